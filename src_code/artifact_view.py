@@ -0,0 +1,147 @@
+import mmap
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Bytes scanned for line breaks at a time while indexing
+INDEX_CHUNK = 64 * 1024 * 1024
+
+# Indexes kept in memory, most recently used first
+INDEX_CACHE_SIZE = 32
+
+# Artifact suffix -> (symbol kind, pattern whose first group names it); each name is indexed at its first line
+symbol_patterns = {
+    ".ll": [
+        ("function", re.compile(rb'^define [^\n@]*@"?([-\w.$]+)', re.M)),
+        ("global", re.compile(rb'^@"?([-\w.$]+)"? =', re.M)),
+        ("label", re.compile(rb'^"?([-\w.$]+)"?:', re.M)),
+    ],
+    ".asm": [
+        ("loop", re.compile(rb"^REPEAT [^;\n]*; Loop %([-\w.$]+)", re.M)),
+        ("row", re.compile(rb"^(?:ACTIVATE|LOAD|STORE) (\d+)", re.M)),
+    ],
+    ".map": [
+        ("tensor", re.compile(rb"^(@[-\w.$]+)", re.M)),
+    ],
+}
+
+
+def _line_starts(buffer):
+    """Offsets of the first byte of every line in buffer"""
+    starts = [np.zeros(1, dtype=np.int64)]
+    for offset in range(0, len(buffer), INDEX_CHUNK):
+        chunk = np.frombuffer(buffer, dtype=np.uint8, count=min(INDEX_CHUNK, len(buffer) - offset), offset=offset)
+        starts.append(np.flatnonzero(chunk == ord("\n")).astype(np.int64) + offset + 1)
+        # The view keeps the mmap exported; drop it before the next chunk or close
+        del chunk
+    starts = np.concatenate(starts)
+    # A trailing newline does not start another line
+    return starts[:-1] if len(starts) > 1 and starts[-1] == len(buffer) else starts
+
+
+class ArtifactIndex:
+    """Line offsets and symbols of one text artifact, whose lines are read in windows through mmap
+
+    Built once per file version by load_index(). symbols are dicts with
+    the kind, name, first line (0-based) and number of occurrences of each
+    function, label, global, loop, row or tensor the artifact's suffix
+    defines (see symbol_patterns). Labels in .ll files are named
+    function:label.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.size = os.path.getsize(path)
+        self.symbols = []
+        if not self.size:
+            self.offsets = np.zeros(1, dtype=np.int64)
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            self.offsets = _line_starts(buffer)
+            self._index_symbols(buffer, symbol_patterns.get(os.path.splitext(path)[1], ()))
+
+    @property
+    def line_count(self):
+        return len(self.offsets) if self.size else 0
+
+    def _index_symbols(self, buffer, patterns):
+        found = {}
+        for kind, pattern in patterns:
+            for match in pattern.finditer(buffer):
+                key = (kind, match.group(1))
+                if key in found:
+                    found[key][1] += 1
+                else:
+                    found[key] = [match.start(), 1]
+        if not found:
+            return
+        lines = self.line_of(np.array([start for start, _ in found.values()]))
+        functions = sorted((line, name) for (kind, name), line in zip(found, lines) if kind == "function")
+        function_lines = np.array([line for line, _ in functions])
+        for ((kind, name), (_, count)), line in zip(found.items(), lines.tolist()):
+            name = name.decode(errors="replace")
+            if kind == "label" and functions:
+                owner = np.searchsorted(function_lines, line, side="right") - 1
+                if owner >= 0:
+                    name = f"{functions[owner][1].decode(errors='replace')}:{name}"
+            self.symbols.append({"kind": kind, "name": name, "line": line, "count": count})
+        self.symbols.sort(key=lambda symbol: symbol["line"])
+
+    def line_of(self, offsets):
+        """Line (0-based) holding each byte offset"""
+        return np.searchsorted(self.offsets, offsets, side="right") - 1
+
+    def read_lines(self, start, count):
+        """Up to count lines from line start (0-based), without their line breaks"""
+        start = max(0, min(start, self.line_count))
+        end = min(start + count, self.line_count)
+        if start >= end:
+            return []
+        stop = int(self.offsets[end]) if end < self.line_count else self.size
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            text = buffer[int(self.offsets[start]):stop]
+        return text.decode(errors="replace").splitlines()
+
+    def find_symbols(self, query="", kinds=None, limit=50):
+        """Symbols whose name contains query (case-insensitive), in file order"""
+        query = query.lower()
+        matches = []
+        for symbol in self.symbols:
+            if (kinds is None or symbol["kind"] in kinds) and query in symbol["name"].lower():
+                matches.append(symbol)
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def search(self, text, start_line=0, limit=1):
+        """Lines (0-based) at or after start_line containing text, up to limit; wraps to the top once"""
+        needle = text.encode()
+        if not needle or not self.size:
+            return []
+        lines = []
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            start = int(self.offsets[min(max(start_line, 0), self.line_count - 1)])
+            for begin, end in ((start, self.size), (0, start)):
+                position = buffer.find(needle, begin, end)
+                while position != -1 and len(lines) < limit:
+                    line = int(self.line_of(position))
+                    lines.append(line)
+                    next_line = line + 1
+                    if next_line >= self.line_count:
+                        break
+                    position = buffer.find(needle, int(self.offsets[next_line]), end)
+        return lines
+
+
+@lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _cached_index(path, mtime_ns, size):
+    return ArtifactIndex(path)
+
+
+def load_index(path):
+    """ArtifactIndex of path, rebuilt only when the file changes"""
+    status = os.stat(path)
+    return _cached_index(os.path.abspath(path), status.st_mtime_ns, status.st_size)
+
@@ -0,0 +1,144 @@
+"""Headless batch compiler: compiles many .cpp/.ll files in parallel.
+
+Usage:
+    python batch_compile.py kernels/ extra.ll -o build/ --jobs 8
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from compile_cache import CompileCache
+from memory_layout import DEFAULT_BANKS
+from partition import SPLITS
+from pim_pipeline import CompileError, compile_source
+
+SOURCE_SUFFIXES = {".cpp", ".cxx", ".cc", ".ll"}
+
+
+def collect_inputs(paths):
+    """Expand files and directories into a sorted list of compilable sources"""
+    inputs = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            inputs.extend(p for p in path.rglob("*") if p.suffix in SOURCE_SUFFIXES)
+        elif path.suffix in SOURCE_SUFFIXES:
+            inputs.append(path)
+    return sorted(set(inputs))
+
+
+def job_dir_name(source_path):
+    """Unique per-input directory name, stable across runs"""
+    digest = hashlib.sha1(str(Path(source_path).resolve()).encode()).hexdigest()[:8]
+    return f"{Path(source_path).stem}-{digest}"
+
+
+def run_job(source_path, work_dir, cache_dir=None, optimize=True, stream=False, in_process=False, passes=None,
+            clusters=1, split="auto", incremental=False, report=False, sample=False, banks=DEFAULT_BANKS):
+    """Compile one input in its own work directory; never raises"""
+    started = time.perf_counter()
+    record = {"source": str(source_path), "work_dir": str(work_dir)}
+    try:
+        cache = CompileCache(cache_dir) if cache_dir else None
+        result = compile_source(source_path, work_dir, cache=cache, optimize=optimize, stream=stream,
+                                in_process=in_process, passes=passes, clusters=clusters, split=split,
+                                incremental=incremental, report=report, sample=sample, banks=banks)
+        record.update({
+            "status": "ok",
+            "cached": result["cached"],
+            "timings": result["timings"],
+            "stats": result["stats"],
+            "tac_instructions": result["tac_count"],
+            "isa_instructions": result["isa_count"],
+        })
+        if result["memory_layout"]["warning"]:
+            record["warning"] = result["memory_layout"]["warning"]
+        if result["partition"] is not None:
+            record["partition"] = result["partition"]
+        if result["report"] is not None:
+            record["report"] = str(Path(work_dir) / "report.json")
+    except CompileError as e:
+        record.update({"status": "error", "error": str(e)})
+    except Exception as e:
+        # A compiler bug in one job must not take down the rest of the batch
+        record.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    record["total_seconds"] = time.perf_counter() - started
+    return record
+
+
+def run_batch(inputs, output_dir, jobs=None, cache_dir=None, optimize=True, stream=False,
+              in_process=False, passes=None, clusters=1, split="auto", incremental=False, report=False, sample=False,
+              banks=DEFAULT_BANKS):
+    """Compile inputs across a process pool and return the summary dict"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    records = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(run_job, str(src), str(output_dir / job_dir_name(src)),
+                        cache_dir, optimize, stream, in_process, passes, clusters, split, incremental, report,
+                        sample, banks)
+            for src in inputs
+        ]
+        for future in as_completed(futures):
+            records.append(future.result())
+    records.sort(key=lambda r: r["source"])
+    return {
+        "workers": jobs or os.cpu_count(),
+        "total_seconds": time.perf_counter() - started,
+        "succeeded": sum(r["status"] == "ok" for r in records),
+        "failed": sum(r["status"] != "ok" for r in records),
+        "jobs": records,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-compile C++/LLVM IR files to pPIM ISA")
+    parser.add_argument("inputs", nargs="+", help=".cpp/.ll files or directories to scan")
+    parser.add_argument("-o", "--output-dir", default="outputs/batch", help="root for per-job work directories")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--summary", default=None, help="summary JSON path (default: <output-dir>/summary.json)")
+    parser.add_argument("--cache-dir", default=None, help="enable the compile cache in this directory")
+    parser.add_argument("--no-opt", action="store_true", help="skip opt; treat IR as already optimized")
+    parser.add_argument("--stream", action="store_true", help="stream large IR straight to disk instead of in memory")
+    parser.add_argument("--in-process", action="store_true", help="optimize with llvmlite instead of spawning opt")
+    parser.add_argument("--passes", default=None,
+                        help="comma-separated llvmlite passes to run instead of -O2 (implies --in-process)")
+    parser.add_argument("--clusters", type=int, default=1,
+                        help="split multiply loop nests across this many clusters")
+    parser.add_argument("--split", choices=SPLITS, default="auto",
+                        help="loop of each nest to split across clusters (see partition.py)")
+    parser.add_argument("--banks", type=int, default=DEFAULT_BANKS,
+                        help="memory banks the arrays are laid out across")
+    parser.add_argument("--incremental", action="store_true",
+                        help="lower each function separately, reusing cached asm for unchanged functions")
+    parser.add_argument("--report", action="store_true",
+                        help="write each job's per-stage time, memory and size report to report.json")
+    parser.add_argument("--sample", action="store_true",
+                        help="also run the sampling profiler (implies --report; stacks go to profile.folded)")
+    args = parser.parse_args(argv)
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        parser.error("no .cpp/.cxx/.cc/.ll inputs found")
+
+    passes = tuple(args.passes.split(",")) if args.passes else None
+    summary = run_batch(inputs, args.output_dir, args.jobs, args.cache_dir,
+                        not args.no_opt, args.stream, args.in_process or passes is not None, passes,
+                        args.clusters, args.split, args.incremental, args.report, args.sample, args.banks)
+    summary_path = Path(args.summary or Path(args.output_dir) / "summary.json")
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    summary_path.write_text(json.dumps(summary, indent=2))
+
+    print(f"{summary['succeeded']} succeeded, {summary['failed']} failed "
+          f"in {summary['total_seconds']:.2f}s; summary written to {summary_path}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""Benchmark the compiler stages on synthetic kernels of growing size.
+
+Usage:
+    python benchmark.py [--suite quick|full] [--case unrolled:1000000] [-o results.json]
+                        [--baseline ../benchmarks/baseline.json] [--tolerance 0.25] [--no-memory]
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import ir_profile
+from memory_layout import format_memory_map
+from pim_binary import encode_file
+from pim_ir import format_tac
+from pim_pipeline import generate_lut_file, map_tac_to_isa, parse_llvm_to_tac, plan_layout
+from precision import plan_core_placement
+
+# (kernel, size) cases of each suite; sizes are matrix order, loop depth or IR instruction count
+SUITES = {
+    "quick": [("matmul", 8), ("matmul", 32), ("nest", 2), ("nest", 4), ("unrolled", 10 ** 3),
+              ("unrolled", 10 ** 4), ("single", 10 ** 4)],
+    "full": [("matmul", 8), ("matmul", 32), ("matmul", 128), ("nest", 2), ("nest", 4), ("nest", 8),
+             ("unrolled", 10 ** 3), ("unrolled", 10 ** 4), ("unrolled", 10 ** 5), ("unrolled", 10 ** 6),
+             ("unrolled", 10 ** 7), ("single", 10 ** 5), ("single", 10 ** 6)],
+}
+
+STAGES = ("tac", "lut", "layout", "isa", "write")
+
+# Instructions per function of an unrolled kernel
+UNROLLED_FUNCTION_SIZE = 10 ** 4
+
+# Trip count of every loop of a nest kernel
+NEST_TRIP_COUNT = 4
+
+# Stage times below this many seconds are too noisy to flag as regressions
+MIN_SECONDS = 0.05
+
+
+def _loop(lines, name, preheader, latch):
+    """Header of a counted loop over %name from 0; _loop_exit() closes it"""
+    lines.append(f"{name}.loop:")
+    lines.append(f"  %{name} = phi i64 [ 0, %{preheader} ], [ %{name}.next, %{latch} ]")
+
+
+def _loop_exit(lines, name, count, exit_label, loop_label):
+    lines.append(f"  %{name}.next = add nuw nsw i64 %{name}, 1")
+    lines.append(f"  %{name}.done = icmp eq i64 %{name}.next, {count}")
+    lines.append(f"  br i1 %{name}.done, label %{exit_label}, label %{loop_label}")
+
+
+def matmul_kernel(size):
+    """IR for C = A * B on size x size i32 matrices, as opt -O2 leaves a triple loop"""
+    row = f"[{size} x i32]"
+    matrix = f"[{size} x {row}]"
+    lines = [f"@{name} = global {matrix} zeroinitializer" for name in "ABC"]
+    lines += ["", "define void @matmul() {", "entry:", "  br label %i.loop", ""]
+    _loop(lines, "i", "entry", "i.latch")
+    lines += ["  br label %j.loop", ""]
+    _loop(lines, "j", "i.loop", "j.latch")
+    lines += ["  br label %k.loop", ""]
+    _loop(lines, "k", "j.loop", "k.loop")
+    lines += [
+        "  %acc = phi i32 [ 0, %j.loop ], [ %sum, %k.loop ]",
+        f"  %pa = getelementptr inbounds {matrix}, {matrix}* @A, i64 0, i64 %i, i64 %k",
+        f"  %pb = getelementptr inbounds {matrix}, {matrix}* @B, i64 0, i64 %k, i64 %j",
+        "  %a = load i32, i32* %pa",
+        "  %b = load i32, i32* %pb",
+        "  %p = mul nsw i32 %a, %b",
+        "  %sum = add nsw i32 %acc, %p",
+    ]
+    _loop_exit(lines, "k", size, "j.latch", "k.loop")
+    lines += ["", "j.latch:", f"  %pc = getelementptr inbounds {matrix}, {matrix}* @C, i64 0, i64 %i, i64 %j",
+              "  store i32 %sum, i32* %pc"]
+    _loop_exit(lines, "j", size, "i.latch", "j.loop")
+    lines += ["", "i.latch:"]
+    _loop_exit(lines, "i", size, "exit", "i.loop")
+    lines += ["", "exit:", "  ret void", "}", ""]
+    return "\n".join(lines)
+
+
+def nest_kernel(depth):
+    """IR for depth perfectly nested counted loops around a multiply-accumulate"""
+    array = f"[{NEST_TRIP_COUNT} x i32]"
+    lines = [f"@A = global {array} zeroinitializer", "", "define void @nest(i32 %x) {", "entry:",
+             "  br label %l0.loop", ""]
+    for level in range(depth):
+        preheader = f"l{level - 1}.loop" if level else "entry"
+        latch = f"l{level}.latch" if level < depth - 1 else f"l{level}.loop"
+        _loop(lines, f"l{level}", preheader, latch)
+        if level < depth - 1:
+            lines += [f"  br label %l{level + 1}.loop", ""]
+    inner = f"l{depth - 1}"
+    lines += [
+        f"  %p = getelementptr inbounds {array}, {array}* @A, i64 0, i64 %{inner}",
+        "  %a = load i32, i32* %p",
+        "  %m = mul nsw i32 %a, %x",
+        "  %s = add nsw i32 %m, %a",
+        "  store i32 %s, i32* %p",
+    ]
+    for level in reversed(range(depth)):
+        if level < depth - 1:
+            lines += ["", f"l{level}.latch:"]
+        exit_label = f"l{level - 1}.latch" if level else "exit"
+        _loop_exit(lines, f"l{level}", NEST_TRIP_COUNT, exit_label, f"l{level}.loop")
+    lines += ["", "exit:", "  ret void", "}", ""]
+    return "\n".join(lines)
+
+
+def write_unrolled_kernel(path, instructions, function_size=UNROLLED_FUNCTION_SIZE):
+    """Write IR of about instructions straight-line loads, multiplies, adds and stores to path
+
+    The code is split into functions of function_size instructions and
+    written as it is generated, so 10**7 instructions fit in memory. Value
+    names are unique across functions.
+    """
+    array = "[64 x i32]"
+    with open(path, "w") as f:
+        f.write(f"@A = global {array} zeroinitializer\n")
+        written = 0
+        function = 0
+        first = 0
+        while written < instructions:
+            size = min(function_size, instructions - written)
+            f.write(f"\ndefine void @unrolled{function}(i32 %x) {{\nentry:\n")
+            previous = "%x"
+            groups = max(size // 5, 1)
+            for group in range(first, first + groups):
+                f.write(f"  %p{group} = getelementptr inbounds {array}, {array}* @A, i64 0, i64 {group % 64}\n"
+                        f"  %a{group} = load i32, i32* %p{group}\n"
+                        f"  %m{group} = mul nsw i32 %a{group}, {previous}\n"
+                        f"  %s{group} = add nsw i32 %m{group}, %a{group}\n"
+                        f"  store i32 %s{group}, i32* %p{group}\n")
+                previous = f"%s{group}"
+            f.write("  ret void\n}\n")
+            written += size
+            function += 1
+            first += groups
+
+
+def write_kernel(kernel, size, path):
+    if kernel == "matmul":
+        Path(path).write_text(matmul_kernel(size))
+    elif kernel == "nest":
+        Path(path).write_text(nest_kernel(size))
+    elif kernel == "unrolled":
+        write_unrolled_kernel(path, size)
+    elif kernel == "single":
+        write_unrolled_kernel(path, size, function_size=size)
+    else:
+        raise ValueError(f"unknown kernel {kernel!r}; expected matmul, nest, unrolled or single")
+
+
+def _run_stages(ll_path, work_dir, measure):
+    """Run each stage once on ll_path; measure(stage, thunk) runs a stage and returns its result"""
+    # The profile is memoized by content hash; every run must build it afresh
+    ir_profile._profiles.clear()
+    block_labels = {}
+    tac = measure("tac", lambda: parse_llvm_to_tac(str(ll_path), block_labels))
+
+    def lut():
+        profile = ir_profile.profile_ir(str(ll_path))
+        generate_lut_file(profile)
+        return profile, plan_core_placement(profile["lut_demand"])
+
+    profile, placement = measure("lut", lut)
+    layout = measure("layout", lambda: plan_layout(profile))
+    isa, _ = measure("isa", lambda: map_tac_to_isa(tac, block_labels, placement=placement, loops=profile["loops"],
+                                                   layout=layout, value_ranges=profile["value_ranges"]))
+
+    def write():
+        (work_dir / "output.tac").write_text("\n".join(format_tac(tac)))
+        asm_path = work_dir / "output.asm"
+        asm_path.write_text("\n".join(isa))
+        encode_file(asm_path, work_dir / "output.bin")
+        (work_dir / "output.map").write_text(format_memory_map(layout))
+
+    measure("write", write)
+    return len(tac), len(isa)
+
+
+def run_case(kernel, size, work_dir, repeat=1, memory=True):
+    """Time (best of repeat runs) and optionally trace the peak memory of each stage for one kernel"""
+    work_dir = Path(work_dir) / f"{kernel}-{size}"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    ll_path = work_dir / "input.ll"
+    started = time.perf_counter()
+    write_kernel(kernel, size, ll_path)
+    stages = {stage: {"seconds": None} for stage in STAGES}
+    case = {"name": f"{kernel}-{size}", "kernel": kernel, "size": size,
+            "generate_seconds": time.perf_counter() - started, "ll_bytes": ll_path.stat().st_size,
+            "stages": stages}
+
+    def timed(stage, thunk):
+        # Collect earlier stages' garbage outside the timed span
+        gc.collect()
+        started = time.perf_counter()
+        value = thunk()
+        seconds = time.perf_counter() - started
+        best = stages[stage]["seconds"]
+        stages[stage]["seconds"] = seconds if best is None else min(best, seconds)
+        return value
+
+    def traced(stage, thunk):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        value = thunk()
+        stages[stage]["peak_bytes"] = tracemalloc.get_traced_memory()[1] - base
+        return value
+
+    for _ in range(repeat):
+        case["tac_instructions"], case["isa_instructions"] = _run_stages(ll_path, work_dir, timed)
+    if memory:
+        # A separate run, so tracing does not slow the timed ones
+        tracemalloc.start()
+        try:
+            _run_stages(ll_path, work_dir, traced)
+        finally:
+            tracemalloc.stop()
+    case["total_seconds"] = sum(stage["seconds"] for stage in stages.values())
+    return case
+
+
+def run_suite(cases, work_dir, repeat=1, memory=True, progress=None):
+    """Benchmark (kernel, size) cases and return the results dict"""
+    progress = progress or (lambda message: None)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "cases": [],
+    }
+    for kernel, size in cases:
+        progress(f"{kernel}-{size}...")
+        results["cases"].append(run_case(kernel, size, work_dir, repeat, memory))
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.25, min_seconds=MIN_SECONDS):
+    """Stage times and peak memory more than tolerance above baseline, for the cases both contain
+
+    Times below min_seconds in both runs are not compared.
+    """
+    baseline_cases = {case["name"]: case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        old_case = baseline_cases.get(case["name"])
+        if old_case is None:
+            continue
+        for stage, measured in case["stages"].items():
+            old = old_case["stages"].get(stage, {})
+            for metric in ("seconds", "peak_bytes"):
+                before, after = old.get(metric), measured.get(metric)
+                if not before or after is None:
+                    continue
+                if metric == "seconds" and max(before, after) < min_seconds:
+                    continue
+                if after > before * (1 + tolerance):
+                    regressions.append({"case": case["name"], "stage": stage, "metric": metric,
+                                        "baseline": before, "current": after, "ratio": round(after / before, 2)})
+    return regressions
+
+
+def format_results(results):
+    """Table of each case's stage times (and peak memory, if traced)"""
+    header = f"{'case':<18}{'tac instrs':>12}" + "".join(f"{stage:>16}" for stage in STAGES)
+    lines = [header]
+    for case in results["cases"]:
+        cells = []
+        for stage in STAGES:
+            measured = case["stages"][stage]
+            cell = f"{measured['seconds']:.3f}s"
+            if "peak_bytes" in measured:
+                cell += f"/{measured['peak_bytes'] / 2 ** 20:.1f}M"
+            cells.append(f"{cell:>16}")
+        lines.append(f"{case['name']:<18}{case['tac_instructions']:>12}" + "".join(cells))
+    return "\n".join(lines)
+
+
+def _parse_case(text):
+    kernel, _, size = text.partition(":")
+    try:
+        return kernel, int(float(size))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected <kernel>:<size>, got {text!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pPIM compiler stages on synthetic kernels")
+    parser.add_argument("--suite", choices=SUITES, default="quick")
+    parser.add_argument("--case", type=_parse_case, action="append", default=[],
+                        help="extra <kernel>:<size> case, e.g. unrolled:1e6 (kernels: matmul, nest, unrolled)")
+    parser.add_argument("--only", action="store_true", help="run just the --case entries, not the suite")
+    parser.add_argument("-o", "--output", default=None, help="write the JSON results here")
+    parser.add_argument("--baseline", default=None, help="compare against these stored results")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown or growth, as a fraction")
+    parser.add_argument("--repeat", type=int, default=3, help="time each case this many times and keep the best")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run of each case")
+    parser.add_argument("--work-dir", default=None, help="keep the generated inputs and outputs here")
+    args = parser.parse_args(argv)
+
+    cases = args.case if args.only else SUITES[args.suite] + args.case
+    with tempfile.TemporaryDirectory() as scratch:
+        results = run_suite(cases, args.work_dir or scratch, args.repeat, not args.no_memory,
+                            progress=lambda message: print(message, file=sys.stderr))
+    print(format_results(results))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']} {regression['stage']} {regression['metric']}: "
+                  f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['ratio']}x)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
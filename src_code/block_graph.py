@@ -0,0 +1,81 @@
+from collections import deque
+
+
+class BlockGraph:
+    """Basic blocks of the emitted program with branch and fall-through edges
+
+    block_labels is the {block id: (function, label)} map filled in by
+    parse_llvm_to_tac(); block ids are consecutive in layout order. A block
+    whose terminator was not lowered (ret, switch, ...) falls through to the
+    next block, exactly as the emitted instruction stream would.
+    """
+
+    def __init__(self, tac_instructions, block_labels):
+        self.block_labels = block_labels
+        self.order = sorted(block_labels)
+        self.instructions = {block: [] for block in self.order}
+        for instr in tac_instructions:
+            self.instructions[instr.block].append(instr)
+
+        label_ids = {key: block for block, key in block_labels.items()}
+        self.successors = {}
+        for index, block in enumerate(self.order):
+            instrs = self.instructions[block]
+            labels = instrs[-1].branch_targets() if instrs else None
+            if labels is None:
+                self.successors[block] = [self.order[index + 1]] if index + 1 < len(self.order) else []
+                continue
+            function = block_labels[block][0]
+            self.successors[block] = [label_ids[(function, label)] for label in labels
+                                      if (function, label) in label_ids]
+
+        self.predecessors = {block: [] for block in self.order}
+        for block in self.order:
+            for succ in self.successors[block]:
+                self.predecessors[succ].append(block)
+
+    def is_entry(self, block):
+        """Function entries and unreachable blocks start with nothing known"""
+        return self.block_labels[block][1] == "entry" or not self.predecessors[block]
+
+    def natural_loops(self):
+        """(header, latch) pairs for back edges, innermost loops first"""
+        loops = {}
+        for block in self.order:
+            for target in self.successors[block]:
+                if target <= block and self.block_labels[target][0] == self.block_labels[block][0]:
+                    loops[target] = max(loops.get(target, target), block)
+        return sorted(loops.items(), key=lambda loop: loop[1] - loop[0])
+
+    def forward_must(self, transfer, meet, unknown):
+        """Entry state of every block for a forward must-analysis
+
+        transfer(block, state) gives the state on leaving block; meet()
+        combines states from several predecessors; unknown is the state at
+        function entries.
+        """
+        entry_states = {}
+        exit_states = {}
+        worklist = deque(self.order)
+        queued = set(self.order)
+        while worklist:
+            block = worklist.popleft()
+            queued.discard(block)
+            if self.is_entry(block):
+                state = unknown
+            else:
+                preds = [exit_states[pred] for pred in self.predecessors[block] if pred in exit_states]
+                if not preds:
+                    continue
+                state = preds[0]
+                for pred_state in preds[1:]:
+                    state = meet(state, pred_state)
+            entry_states[block] = state
+            state = transfer(block, state)
+            if block not in exit_states or exit_states[block] != state:
+                exit_states[block] = state
+                for succ in self.successors[block]:
+                    if succ not in queued:
+                        queued.add(succ)
+                        worklist.append(succ)
+        return entry_states
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Flags used by the clang++ and opt stages; they are part of every cache key
+CLANG_FLAGS = ["-S", "-emit-llvm"]
+OPT_FLAGS = ["-S", "-O2"]
+
+# Artifacts stored for every compiled source
+CACHE_ARTIFACTS = ("unoptimized.ll", "optimized.ll", "output.tac", "output.asm", "output.bin", "output.map",
+                   "compile_stats.json")
+
+# Artifact stored for every function lowered by pim_pipeline.lower_functions()
+FUNCTION_ARTIFACTS = ("function.json",)
+
+
+@lru_cache(maxsize=None)
+def tool_version(tool):
+    """Return the first line of `<tool> --version`, or 'unavailable'"""
+    try:
+        result = subprocess.run([tool, "--version"], capture_output=True, text=True)
+    except OSError:
+        return "unavailable"
+    lines = (result.stdout or result.stderr).strip().splitlines()
+    return lines[0] if lines else "unknown"
+
+
+def compute_cache_key(source_bytes, salt=""):
+    """Hash source bytes, tool versions and stage flags into a cache key"""
+    digest = hashlib.sha256()
+    digest.update(source_bytes)
+    for part in (tool_version("clang++"), " ".join(CLANG_FLAGS),
+                 tool_version("opt"), " ".join(OPT_FLAGS), salt):
+        digest.update(b"\0")
+        digest.update(part.encode())
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """Content-addressed on-disk cache of pipeline artifacts with LRU eviction"""
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.stats_path = self.root / "stats.json"
+        self.lock_path = self.root / "stats.lock"
+
+    def _entry_dir(self, key):
+        return self.root / key[:2] / key
+
+    def _load_stats(self):
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0, "evictions": 0}
+
+    @contextmanager
+    def _stats_lock(self):
+        """Hold an exclusive lock on the counters across processes (a no-op without fcntl)"""
+        with open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _bump(self, counter, amount=1):
+        with self._stats_lock():
+            stats = self._load_stats()
+            stats[counter] = stats.get(counter, 0) + amount
+            tmp_path = self.stats_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, self.stats_path)
+
+    def get(self, key, names=CACHE_ARTIFACTS, count=True):
+        """Return {artifact name: path} for a cached entry, or None on a miss"""
+        entry = self._entry_dir(key)
+        paths = {name: entry / name for name in names}
+        if not all(path.exists() for path in paths.values()):
+            if count:
+                self._bump("misses")
+            return None
+        # Touch the entry so eviction treats it as recently used
+        os.utime(entry)
+        if count:
+            self._bump("hits")
+        return paths
+
+    def put(self, key, artifacts, names=CACHE_ARTIFACTS, evict=True):
+        """Store artifacts given as {name: Path or str content}, then evict"""
+        entry = self._entry_dir(key)
+        tmp_entry = entry.with_name(f"{key}.{os.getpid()}.tmp")
+        tmp_entry.mkdir(parents=True, exist_ok=True)
+        for name in names:
+            value = artifacts[name]
+            if isinstance(value, Path):
+                shutil.copyfile(value, tmp_entry / name)
+            else:
+                with open(tmp_entry / name, "w") as f:
+                    f.write(value)
+        if entry.exists():
+            shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(tmp_entry, entry)
+        except OSError:
+            # Another process stored the same key first; entries are content-addressed
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            if not entry.exists():
+                raise
+        if evict:
+            self.evict()
+
+    def get_function(self, key):
+        """The JSON record cached for one function's lowering, or None on a miss
+
+        Function lookups are counted by finish_functions(), not here.
+        """
+        paths = self.get(key, FUNCTION_ARTIFACTS, count=False)
+        if paths is None:
+            return None
+        with open(paths["function.json"]) as f:
+            return json.load(f)
+
+    def put_function(self, key, record):
+        """Store one function's JSON-serializable lowering record, without evicting"""
+        self.put(key, {"function.json": json.dumps(record)}, FUNCTION_ARTIFACTS, evict=False)
+
+    def finish_functions(self, hits, misses):
+        """Count a module's function lookups and evict once its functions are stored"""
+        self._bump("function_hits", hits)
+        self._bump("function_misses", misses)
+        self.evict()
+
+    def restore(self, key, output_dir):
+        """Copy a cached entry into output_dir; returns False on a miss"""
+        paths = self.get(key)
+        if paths is None:
+            return False
+        for name, path in paths.items():
+            shutil.copyfile(path, os.path.join(output_dir, name))
+        return True
+
+    def _entries(self):
+        entries = []
+        for shard in self.root.iterdir():
+            if not shard.is_dir():
+                continue
+            for entry in shard.iterdir():
+                if entry.suffix == ".tmp":
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in entry.iterdir())
+                    entries.append((entry.stat().st_mtime, size, entry))
+                except OSError:
+                    # Entry removed by a concurrent eviction
+                    continue
+        return entries
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            self._bump("evictions", evicted)
+        return evicted
+
+    def stats(self):
+        """Return hit/miss counters plus current entry count and size"""
+        stats = self._load_stats()
+        stats.setdefault("function_hits", 0)
+        stats.setdefault("function_misses", 0)
+        entries = self._entries()
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+        })
+        return stats
@@ -0,0 +1,251 @@
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from compile_cache import CompileCache
+from pim_pipeline import CompileError, compile_source
+
+# Wall-clock seconds a job may run before it is killed
+DEFAULT_TIMEOUT = 300
+
+# Seconds between checks of the running jobs
+POLL_INTERVAL = 0.1
+
+# Seconds a finished job and its directory are kept before being discarded
+JOB_TTL = 3600
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMED_OUT = "queued", "running", "done", "failed", "cancelled", "timed out"
+FINISHED_STATES = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+
+def _run_job(source_path, work_dir, cache_dir, options, events):
+    """Worker process body: compile one source, reporting each stage on events
+
+    The TAC and ISA text lines are left out of the result sent back; they
+    are in the job's work_dir as output.tac and output.asm.
+    """
+    if hasattr(os, "setsid"):
+        # Own process group, so killing the job also kills its clang++/opt
+        os.setsid()
+    started = time.perf_counter()
+
+    def progress(message):
+        events.put(("progress", time.perf_counter() - started, message))
+
+    try:
+        cache = CompileCache(cache_dir) if cache_dir else None
+        result = compile_source(source_path, work_dir, cache=cache, progress=progress, **options)
+    except CompileError as e:
+        events.put(("error", time.perf_counter() - started, str(e)))
+    except Exception as e:
+        # Any other failure is a compiler bug; report it rather than let the worker die silently
+        events.put(("error", time.perf_counter() - started, f"{type(e).__name__}: {e}"))
+    else:
+        result["tac_instructions"] = result["isa_instructions"] = None
+        events.put(("done", time.perf_counter() - started, result))
+
+
+class CompileJob:
+    """One submitted compile and what is known about it so far"""
+
+    def __init__(self, job_id, session, source_path, work_dir, options, timeout):
+        self.id = job_id
+        self.session = session
+        self.source_path = source_path
+        self.work_dir = work_dir
+        self.options = options
+        self.timeout = timeout
+        self.state = QUEUED
+        self.events = []
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._process = None
+        self._events = None
+
+    @property
+    def finished_state(self):
+        return self.state in FINISHED_STATES
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def stage(self):
+        """Latest progress message, or the state if there is none"""
+        return self.events[-1][1] if self.events else self.state
+
+
+def _is_job_id(name):
+    return len(name) in (12, 32) and all(char in "0123456789abcdef" for char in name)
+
+
+class JobQueue:
+    """Runs compile jobs in worker processes, at most max_workers at a time
+
+    Each job gets its own directory under root holding the uploaded source
+    and every output, so concurrent sessions never share files. A monitor
+    thread starts queued jobs, collects their per-stage progress events,
+    kills jobs that run longer than their timeout, reaps finished workers
+    and discards jobs that finished more than ttl seconds ago; submit()
+    and cancel() return at once. Job ids are unguessable 32-digit hex
+    tokens. Job directories left under root by an earlier queue are
+    deleted on start, since no job of this one refers to them.
+    """
+
+    def __init__(self, root, max_workers=2, timeout=DEFAULT_TIMEOUT, cache_dir=None, ttl=JOB_TTL):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        for stale in self.root.iterdir():
+            if stale.is_dir() and _is_job_id(stale.name):
+                shutil.rmtree(stale, ignore_errors=True)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._monitor = threading.Thread(target=self._watch, name="compile-jobs", daemon=True)
+        self._monitor.start()
+
+    def submit(self, file_name, data, session=None, timeout=None, **options):
+        """Queue a compile of data saved as file_name; returns the job id
+
+        options are passed to pim_pipeline.compile_source().
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = self.root / job_id
+        source_path = job_dir / Path(file_name).name
+        work_dir = job_dir / "outputs"
+        work_dir.mkdir(parents=True)
+        source_path.write_bytes(data)
+        job = CompileJob(job_id, session, str(source_path), str(work_dir), options, timeout or self.timeout)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._wake.set()
+        return job_id
+
+    def job(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self, session=None):
+        """Jobs of one session (all jobs if session is None), oldest first"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in jobs if session is None or job.session == session]
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; False if it had already finished"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished_state:
+                return False
+            self._stop(job, CANCELLED, "cancelled")
+        return True
+
+    def discard(self, job_id):
+        """Cancel a job if needed and delete it with its directory"""
+        self.cancel(job_id)
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            shutil.rmtree(Path(job.source_path).parent, ignore_errors=True)
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job finishes or timeout seconds pass; returns the job"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        job = self._jobs[job_id]
+        while not job.finished_state and (deadline is None or time.monotonic() < deadline):
+            time.sleep(POLL_INTERVAL)
+        return job
+
+    def _start(self, job):
+        job._events = self._context.Queue()
+        job._process = self._context.Process(
+            target=_run_job, args=(job.source_path, job.work_dir, self.cache_dir, job.options, job._events),
+            name=f"compile-{job.id}", daemon=True)
+        job._process.start()
+        job.state = RUNNING
+        job.started = time.time()
+
+    def _stop(self, job, state, error):
+        process = job._process
+        if process is not None and process.is_alive():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                # No process groups, or the worker has not called setsid() yet
+                process.kill()
+            process.join()
+        self._finish(job, state)
+        job.error = error
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.time()
+        if job._events is not None:
+            job._events.close()
+        job._process = job._events = None
+
+    def _drain(self, job):
+        """Take the job's pending events; True once its final event arrived"""
+        while True:
+            try:
+                kind, elapsed, payload = job._events.get_nowait()
+            except queue.Empty:
+                return False
+            if kind == "progress":
+                job.events.append((elapsed, payload))
+                continue
+            if kind == "done":
+                job.result = payload
+            else:
+                job.error = payload
+            job._process.join()
+            self._finish(job, DONE if kind == "done" else FAILED)
+            return True
+
+    def _poll(self):
+        with self._lock:
+            running = [job for job in self._jobs.values() if job.state == RUNNING]
+            for job in running:
+                if self._drain(job):
+                    continue
+                if job.elapsed() > job.timeout:
+                    self._stop(job, TIMED_OUT, f"timed out after {job.timeout}s")
+                elif not job._process.is_alive() and not self._drain(job):
+                    code = job._process.exitcode
+                    self._finish(job, FAILED)
+                    job.error = f"worker exited with code {code}"
+            slots = self.max_workers - sum(job.state == RUNNING for job in self._jobs.values())
+            for job in self._jobs.values():
+                if slots <= 0:
+                    break
+                if job.state == QUEUED:
+                    self._start(job)
+                    slots -= 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job.id for job in self._jobs.values() if job.finished_state and job.finished < cutoff]
+        for job_id in expired:
+            self.discard(job_id)
+
+    def _watch(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            self._poll()
+            self._expire()
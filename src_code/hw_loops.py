@@ -0,0 +1,240 @@
+from block_graph import BlockGraph
+from pim_ir import Opcode, TacInstr
+
+# Loops with a constant count up to this are fully unrolled...
+UNROLL_MAX_TRIPS = 4
+# ...when the unrolled body stays within this many TAC instructions
+UNROLL_MAX_INSTRUCTIONS = 64
+
+
+def _uses(tac_instructions, block_labels):
+    """{(function, value name): number of instructions reading it}"""
+    uses = {}
+    for instr in tac_instructions:
+        if instr.opcode == Opcode.BRANCH:
+            names = [instr.operands[0]] if len(instr.operands) == 3 else []
+        elif instr.opcode == Opcode.END_REPEAT:
+            names = []
+        else:
+            names = instr.operands
+        function = block_labels[instr.block][0]
+        for name in names:
+            key = (function, name.lstrip("%"))
+            uses[key] = uses.get(key, 0) + 1
+    return uses
+
+
+def _drop_dead(instrs, function, seeds, uses, dropped):
+    """Drop seeds and, transitively, the compares and loads in instrs feeding only dropped code"""
+    defining = {instr.dest: instr for instr in instrs if instr.dest is not None}
+    worklist = list(seeds)
+    while worklist:
+        instr = worklist.pop()
+        if id(instr) in dropped:
+            continue
+        dropped.add(id(instr))
+        names = [instr.operands[0]] if instr.opcode == Opcode.BRANCH else instr.operands
+        for name in names:
+            name = name.lstrip("%")
+            uses[(function, name)] -= 1
+            producer = defining.get(name)
+            if producer is not None and not uses[(function, name)] and producer.opcode in (Opcode.ICMP, Opcode.LOAD):
+                worklist.append(producer)
+
+
+class _Loop:
+    def __init__(self, header, latch, exiting, count):
+        self.header = header
+        self.latch = latch
+        self.exiting = exiting
+        self.count = count
+
+
+def _reachable(graph, header, body):
+    """Blocks of body reachable from header; exception cleanup laid out inside a loop is not"""
+    seen = {header}
+    worklist = [header]
+    while worklist:
+        for succ in graph.successors[worklist.pop()]:
+            if succ in body and succ not in seen:
+                seen.add(succ)
+                worklist.append(succ)
+    return sorted(seen)
+
+
+def _counted_loops(graph, loops):
+    """_Loop for every natural loop shaped for a hardware loop
+
+    The loop must be entered only by a jump from the block laid out just
+    before its header, leave only through the compare-and-branch its
+    profile counted, to the block just after its latch, and come back to
+    the header only from the latch.
+    """
+    label_ids = {key: block for block, key in graph.block_labels.items()}
+    records = {(record["function"], record["header"]): record for record in loops if record["count"] is not None}
+    counted = []
+    for header, latch in graph.natural_loops():
+        function, header_label = graph.block_labels[header]
+        record = records.get((function, header_label))
+        if record is None or record["latch"] != graph.block_labels[latch][1]:
+            continue
+        exiting = label_ids.get((function, record["exiting"]))
+        preheader, exit_block = header - 1, latch + 1
+        if exiting not in (header, latch) or exit_block not in graph.block_labels or \
+                graph.block_labels.get(preheader, (None,))[0] != function:
+            continue
+        if sorted(graph.predecessors[header]) != sorted({preheader, latch}):
+            continue
+        jump = graph.instructions[preheader][-1] if graph.instructions[preheader] else None
+        if jump is None or jump.opcode != Opcode.BRANCH or jump.operands != (header_label,):
+            continue
+        body = range(header, latch + 1)
+        shaped = True
+        for block in _reachable(graph, header, body):
+            successors = graph.successors[block]
+            leaves = [succ for succ in successors if succ not in body]
+            if leaves != ([exit_block] if block == exiting else []) or \
+                    (header in successors) != (block == latch):
+                shaped = False
+                break
+            instrs = graph.instructions[block]
+            if block == exiting and (not instrs or instrs[-1].opcode != Opcode.BRANCH or
+                                     len(instrs[-1].operands) != 3):
+                shaped = False
+                break
+        # A test at the top must fall into the body
+        if shaped and exiting != latch and header + 1 not in graph.successors[header]:
+            shaped = False
+        if shaped:
+            counted.append(_Loop(header, latch, exiting, record["count"]))
+    return counted
+
+
+def _count_source(loop, graph):
+    """Instruction computing a runtime count inside the loop, or None
+
+    Raises LookupError when the count is defined in the loop by anything
+    but a load in the exiting block, which could not run ahead of it.
+    """
+    if isinstance(loop.count, int):
+        return None
+    name = loop.count.lstrip("%")
+    for block in range(loop.header, loop.latch + 1):
+        for instr in graph.instructions[block]:
+            if instr.dest == name:
+                if block == loop.exiting and instr.opcode == Opcode.LOAD:
+                    return instr
+                raise LookupError(name)
+    return None
+
+
+def _unrolled(loop, graph, dropped):
+    """TAC for a straight-line loop body repeated count times in the header block, or None"""
+    if not isinstance(loop.count, int) or loop.count > UNROLL_MAX_TRIPS:
+        return None
+    body = []
+    for block in range(loop.header, loop.latch + 1):
+        if block != loop.exiting and block != loop.latch and graph.successors[block] != [block + 1]:
+            return None
+        body.extend(instr for instr in graph.instructions[block]
+                    if id(instr) not in dropped and instr.opcode != Opcode.BRANCH)
+    if len(body) * loop.count > UNROLL_MAX_INSTRUCTIONS:
+        return None
+    # Earlier copies rename what they define; the last keeps the names used after the loop
+    defined = {instr.dest for instr in body if instr.dest is not None}
+    copies = []
+    for copy in range(loop.count):
+        suffix = f".{copy}" if copy + 1 < loop.count else ""
+        previous = f".{copy - 1}" if copy else ""
+        seen = set()
+
+        def rename(name):
+            if name not in defined:
+                return name
+            return name + (suffix if name in seen else previous)
+
+        for instr in body:
+            operands = tuple(rename(name) for name in instr.operands)
+            dest = instr.dest
+            if dest is not None:
+                seen.add(dest)
+                dest += suffix
+            copies.append(TacInstr(instr.opcode, dest, operands, instr.width, loop.header, instr.cond, instr.meta,
+                                   instr.operand_bits))
+    return copies
+
+
+def lower_hardware_loops(tac_instructions, block_labels, loops, unroll=True):
+    """Replace the branches of counted loops with REPEAT blocks, or unroll small ones
+
+    loops are the loop records of ir_profile.profile_ir() for the same IR.
+    A counted loop's preheader jump becomes REPEAT <count> and its
+    back-edge END_REPEAT; the exit compare and branch, and loads feeding
+    only them, are dropped. A runtime count loaded in the loop is loaded
+    once ahead of the REPEAT instead. With unroll, loops whose straight-line
+    body runs a small constant number of times are instead repeated inline.
+    Jumps to the block laid out next are dropped either way. Returns the
+    rewritten TAC and counts of the loops lowered and jumps dropped.
+    """
+    stats = {"repeat_blocks": 0, "unrolled": 0, "jumps_dropped": 0}
+    graph = BlockGraph(tac_instructions, block_labels)
+    uses = _uses(tac_instructions, block_labels)
+    dropped = set()
+    replaced = {}
+    for loop in _counted_loops(graph, loops or ()):
+        try:
+            source = _count_source(loop, graph)
+        except LookupError:
+            continue
+        function, header_label = block_labels[loop.header]
+        exit_label = block_labels[loop.latch + 1][1]
+        test = graph.instructions[loop.exiting][-1]
+        _drop_dead(graph.instructions[loop.exiting], function, [test], uses, dropped)
+        back_edge = graph.instructions[loop.latch][-1]
+        if back_edge is not test:
+            dropped.add(id(back_edge))
+
+        copies = _unrolled(loop, graph, dropped) if unroll else None
+        if copies is not None:
+            body = [instr for block in range(loop.header, loop.latch + 1) for instr in graph.instructions[block]]
+            dropped.update(id(instr) for instr in body)
+            if body:
+                replaced[id(body[0])] = copies
+            stats["unrolled"] += 1
+            continue
+
+        preheader = loop.header - 1
+        entry = []
+        if source is not None:
+            dropped.add(id(source))
+            entry.append(TacInstr(source.opcode, source.dest, source.operands, source.width, preheader,
+                                  source.cond, source.meta))
+        entry.append(TacInstr(Opcode.REPEAT, None, (str(loop.count), header_label), 0, preheader))
+        replaced[id(graph.instructions[preheader][-1])] = entry
+        end = TacInstr(Opcode.END_REPEAT, None, (header_label, exit_label), 0, loop.latch)
+        if back_edge is test:
+            replaced[id(test)] = [end]
+        else:
+            replaced[id(back_edge)] = [end]
+        stats["repeat_blocks"] += 1
+
+    lowered = []
+    for instr in tac_instructions:
+        if id(instr) in replaced:
+            lowered.extend(replaced[id(instr)])
+        elif id(instr) not in dropped:
+            lowered.append(instr)
+    return _drop_fallthrough_jumps(lowered, graph, stats), stats
+
+
+def _drop_fallthrough_jumps(tac_instructions, graph, stats):
+    """Unconditional branches to the next block in layout, which the stream reaches anyway"""
+    kept = []
+    for instr in tac_instructions:
+        if instr.opcode == Opcode.BRANCH and len(instr.operands) == 1 and \
+                graph.successors.get(instr.block) == [instr.block + 1] and \
+                graph.block_labels.get(instr.block + 1, (None, None))[1] == instr.operands[0]:
+            stats["jumps_dropped"] += 1
+            continue
+        kept.append(instr)
+    return kept
@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Seconds between stack samples of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+
+# Functions listed under hot_functions in a report
+HOT_FUNCTIONS = 25
+
+
+def peak_rss(children=False):
+    """High-water resident set size in bytes of this process, or of its waited-for children; None if unknown"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Sampling profiler: records one thread's Python stack every interval seconds
+
+    Each sample is filed under the current label (the pipeline stage), so
+    time can be attributed to stages and to functions within them.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.label = None
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        self._thread_id = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(self.label or "(no stage)")
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def hot_functions(self, limit=HOT_FUNCTIONS):
+        """Functions by samples spent in them (self) and under them (total), busiest first"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack[1:]):
+                total[name] += count
+        return [{"function": name, "self_samples": own[name], "total_samples": count,
+                 "self_percent": round(100 * own[name] / self.samples, 1),
+                 "total_percent": round(100 * count / self.samples, 1)}
+                for name, count in sorted(total.items(), key=lambda item: (-own[item[0]], -item[1]))[:limit]]
+
+    def stage_samples(self):
+        counts = Counter()
+        for stack, count in self.stacks.items():
+            counts[stack[0]] += count
+        return dict(counts)
+
+    def folded(self):
+        """Stacks in the collapsed "stage;caller;callee count" format flame graph tools read"""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in sorted(self.stacks.items()))
+
+
+class StageRecorder:
+    """Times pipeline stages into timings and, when detailed, records a report of each
+
+    Every stage gets its wall time in timings. A detailed recorder also
+    keeps, per stage, the process's peak RSS and how much the stage raised
+    it, the peak RSS of the tools it ran, and whatever sizes and
+    instruction counts the stage adds to its record. With a sampler the
+    stack samples are labelled by stage.
+    """
+
+    def __init__(self, timings, progress=None, detailed=False, sampler=None):
+        self.timings = timings
+        self.progress = progress or (lambda message: None)
+        self.detailed = detailed or sampler is not None
+        self.sampler = sampler
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, message=None):
+        """Context for one stage; yields the record dict the stage may add its sizes and counts to"""
+        if message:
+            self.progress(message)
+        record = {"stage": name}
+        rss_before = peak_rss() if self.detailed else None
+        if self.sampler is not None:
+            self.sampler.label = name
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - started
+            self.timings[name] = self.timings.get(name, 0) + seconds
+            if self.sampler is not None:
+                self.sampler.label = None
+            if self.detailed:
+                rss = peak_rss()
+                record.update({
+                    "seconds": seconds,
+                    "peak_rss_bytes": rss,
+                    "peak_rss_growth_bytes": rss - rss_before if rss is not None else None,
+                    "tool_peak_rss_bytes": peak_rss(children=True),
+                })
+                self.stages.append(record)
+
+    def report(self, **fields):
+        """The recorded stages, their totals and any sampling profile, plus fields"""
+        report = dict(fields)
+        report.update({
+            "stages": self.stages,
+            "total_seconds": sum(stage["seconds"] for stage in self.stages),
+            "peak_rss_bytes": peak_rss(),
+            "sampling": None,
+        })
+        if self.sampler is not None:
+            report["sampling"] = {
+                "interval": self.sampler.interval,
+                "samples": self.sampler.samples,
+                "stage_samples": self.sampler.stage_samples(),
+                "hot_functions": self.sampler.hot_functions(),
+            }
+        return report
+
+    def write(self, path, **fields):
+        """Write report() as JSON to path and return it"""
+        report = self.report(**fields)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return report
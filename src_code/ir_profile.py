@@ -0,0 +1,595 @@
+import hashlib
+import io
+import mmap
+import re
+from collections import OrderedDict
+
+from pim_ir import Opcode, type_width
+from precision import decompose, signed_predicates
+from value_range import narrowed_bits, value_ranges
+
+# Iterations assumed for loops whose trip count is not a compile-time constant
+DEFAULT_TRIP_COUNT = 16
+
+# Profiles kept in memory, keyed by the hash of the IR they describe
+PROFILE_CACHE_SIZE = 64
+
+profile_patterns = {
+    'compare': re.compile(rb"=\s*icmp\s+(\w+)\s+(\w+)\s+([^,]+),\s*(\S+)"),
+    'phi': re.compile(rb"=\s*phi\s+(\w+)\s+(.*)"),
+    'incoming': re.compile(rb"\[\s*([^,\]]+),\s*%([-\w.$\"]+)\s*\]"),
+    'labels': re.compile(rb"label\s+%([-\w.$\"]+)"),
+    'cond': re.compile(rb"br\s+i1\s+(%[-\w.$]+)"),
+    'load': re.compile(rb"=\s*load\s+[^,]+,\s*[^,%@]*(%[-\w.$]+)"),
+    'store': re.compile(rb"store\s+\w+\s+([^,]+),\s*[^,%@]*(%[-\w.$]+)"),
+    'cast': re.compile(rb"=\s*(?:sext|zext|trunc)\s+(?:nneg\s+)?(\w+)\s+(%[-\w.$]+)\s+to\s+(\w+)"),
+    'binary': re.compile(rb"=\s*\w+\s+(?:(?:nuw|nsw|exact|disjoint)\s+)*i(\d+)\s+([^,\s]+),\s*([^,\s]+)"),
+    'select': re.compile(rb"=\s*select\s+i1\s+([^,]+),\s*i(\d+)\s+([^,\s]+),\s*i\d+\s+([^,\s]+)"),
+    'value': re.compile(rb"%[-\w.$]+"),
+    'global': re.compile(rb"^@([-\w.$]+)\s*=[^\[]*?\b(?:global|constant)\s+(\[[^=]*?\])\s"),
+    'alloca': re.compile(rb"=\s*alloca\s+(\[[^=]*\])\s*(?:,|$)"),
+}
+
+# Predicate taking the other branch: a compare that exits when true, read as one that continues
+inverse_predicates = {"eq": "ne", "ne": "eq", "slt": "sge", "sge": "slt", "sgt": "sle", "sle": "sgt",
+                      "ult": "uge", "uge": "ult", "ugt": "ule", "ule": "ugt"}
+
+# LUT-lowered opcodes by IR name
+lut_opcodes = {b"add": Opcode.ADD, b"mul": Opcode.MUL, b"icmp": Opcode.ICMP}
+
+# Instructions other than load and store that can take a stack slot's address
+pointer_operand_ops = {b"call", b"invoke", b"getelementptr", b"bitcast", b"ptrtoint", b"addrspacecast", b"select",
+                       b"phi", b"ret", b"icmp", b"insertvalue", b"cmpxchg", b"atomicrmw"}
+
+# Integer operations value_range.value_ranges() can bound
+range_binary_ops = {b"add", b"sub", b"mul", b"and", b"or", b"xor", b"shl", b"lshr", b"ashr",
+                    b"udiv", b"sdiv", b"urem", b"srem"}
+
+_profiles = OrderedDict()
+
+
+class _Block:
+    def __init__(self, function, label):
+        self.function = function
+        self.label = label
+        self.ops = {}
+        self.lut_ops = []
+        self.successors = []
+        self.loop_branch = False
+        self.cond = None
+
+
+def _int_bits(ty):
+    """Bits of an LLVM integer type such as b'i32', or None"""
+    return int(ty[1:]) if ty[:1] == b"i" and ty[1:].isdigit() else None
+
+
+def _constant_range(token):
+    value = _constant(token.decode())
+    return (value, value) if value is not None else None
+
+
+def _constant(token):
+    try:
+        return int(token)
+    except ValueError:
+        return None
+
+
+class _Facts:
+    """Per-value defining facts of a module, keyed by (function, value name)
+
+    defs maps every named value to its block index; loads to the stack
+    slot they read; stores maps each slot to its (block index, value) stores.
+    arrays holds the (shape, element bits) of array allocas and, under
+    function None, globals; geps the (source type, base, index operands)
+    of each getelementptr; accesses every (block index, pointer, is store).
+    values holds the integer operations value_range.value_ranges() reads,
+    slots the scalar allocas and escaped the slots used other than as the
+    pointer of a load or store.
+    """
+
+    def __init__(self):
+        self.defs, self.phis, self.adds, self.compares, self.loads, self.stores = {}, {}, {}, {}, {}, {}
+        self.casts, self.arrays, self.geps, self.values = {}, {}, {}, {}
+        self.accesses = []
+        self.slots, self.escaped = set(), set()
+
+
+def _split_operands(text):
+    """Comma-separated operands of an instruction, ignoring commas nested in brackets"""
+    parts, depth, start = [], 0, 0
+    for position, char in enumerate(text):
+        if char in b"[{(<":
+            depth += 1
+        elif char in b"]})>":
+            depth -= 1
+        elif char == ord(",") and not depth:
+            parts.append(text[start:position].strip())
+            start = position + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def array_shape(type_text):
+    """(shape, element bits) of an LLVM array type, e.g. '[4 x [8 x i32]]' -> ((4, 8), 32)"""
+    if isinstance(type_text, bytes):
+        type_text = type_text.decode()
+    shape = tuple(int(dim) for dim in re.findall(r"\[\s*(\d+)\s+x", type_text))
+    element = type_text.rstrip("] ").rsplit(" x ", 1)[-1].strip()
+    return shape, type_width(element)
+
+
+def _gep(stripped):
+    """(source type, base, index operands) of a getelementptr instruction"""
+    parts = [part for part in _split_operands(stripped.split(None, 1)[1]) if not part.startswith(b"!")]
+    source = parts[0].split(b"inbounds", 1)[-1].strip()
+    return source, parts[1].split()[-1], [part.split()[-1] for part in parts[2:]]
+
+
+def _scan(lines):
+    """Blocks in layout order plus per-value defining facts"""
+    blocks = []
+    facts = _Facts()
+    phis, adds, compares, values = facts.phis, facts.adds, facts.compares, facts.values
+    function = None
+    slots = set()
+    for line in lines:
+        if line[:1] == b"@" and (match := profile_patterns['global'].match(line)):
+            facts.arrays[(None, b"@" + match.group(1))] = array_shape(match.group(2))
+            continue
+        if line[:1] not in b" \t\n;%@!$":
+            if line.startswith(b"define "):
+                function = line.partition(b"@")[2].partition(b"(")[0].strip(b'"').decode()
+                blocks.append(_Block(function, "entry"))
+                slots = set()
+            elif (label := line.split(None, 1)[0]).endswith(b":"):
+                blocks.append(_Block(function, label[:-1].strip(b'"').decode()))
+            elif line.startswith(b"}"):
+                function = None
+            continue
+        if function is None or not blocks:
+            continue
+        block = blocks[-1]
+        stripped = line.strip()
+        dest = None
+        if stripped[:1] == b"%":
+            dest, _, stripped = stripped.partition(b"=")
+            dest = dest.strip()
+            stripped = stripped.strip()
+            facts.defs[(block.function, dest)] = len(blocks) - 1
+        tokens = stripped.split(None, 1)
+        if not tokens:
+            continue
+        op = tokens[0]
+        name = op.decode()
+        block.ops[name] = block.ops.get(name, 0) + 1
+        if slots and op in pointer_operand_ops:
+            facts.escaped.update((block.function, value) for value in profile_patterns['value'].findall(stripped)
+                                 if value in slots)
+
+        if op in range_binary_ops and (match := profile_patterns['binary'].search(line)):
+            bits, lhs, rhs = match.groups()
+            values[(block.function, dest)] = (op, int(bits), lhs, rhs)
+            if op in lut_opcodes:
+                block.lut_ops.append((lut_opcodes[op], int(bits), False, lhs, rhs))
+            if op == b"add":
+                adds[(block.function, dest)] = (lhs, _constant(rhs.decode()))
+        elif op == b"icmp" and (match := profile_patterns['compare'].search(line)):
+            pred, ty, lhs, rhs = (group.strip() for group in match.groups())
+            pred = pred.decode()
+            rhs = rhs.rstrip(b",")
+            block.lut_ops.append((Opcode.ICMP, type_width(ty.decode()), pred in signed_predicates, lhs, rhs))
+            compares[(block.function, dest)] = (pred, lhs, rhs)
+            values[(block.function, dest)] = (op, 1)
+        elif op == b"phi" and (match := profile_patterns['phi'].search(line)):
+            ty, incoming = match.groups()
+            incoming = profile_patterns['incoming'].findall(incoming)
+            phis[(block.function, dest)] = (len(blocks) - 1, [(value.strip(), label.strip(b'"').decode())
+                                                              for value, label in incoming])
+            if (bits := _int_bits(ty)) is not None:
+                values[(block.function, dest)] = (op, bits)
+        elif op == b"load" and (match := profile_patterns['load'].search(line)):
+            facts.loads[(block.function, dest)] = match.group(1)
+            facts.accesses.append((len(blocks) - 1, match.group(1), False))
+            if match.group(1) in slots:
+                values[(block.function, dest)] = (op, _int_bits(tokens[1].split(None, 1)[0].rstrip(b",")),
+                                                  match.group(1))
+        elif op == b"store":
+            match = profile_patterns['store'].search(line)
+            if match is None:
+                facts.escaped.update((block.function, value) for value in profile_patterns['value'].findall(stripped)
+                                     if value in slots)
+                continue
+            value, slot = match.groups()
+            value = value.strip()
+            facts.stores.setdefault((block.function, slot), []).append((len(blocks) - 1, value))
+            facts.accesses.append((len(blocks) - 1, slot, True))
+            if value in slots:
+                facts.escaped.add((block.function, value))
+        elif op == b"getelementptr":
+            facts.geps[(block.function, dest)] = _gep(stripped)
+        elif op in (b"sext", b"zext", b"trunc") and (match := profile_patterns['cast'].search(line)):
+            source_type, source, target_type = match.groups()
+            facts.casts[(block.function, dest)] = source
+            bits, to_bits = _int_bits(source_type), _int_bits(target_type)
+            if bits and to_bits:
+                values[(block.function, dest)] = (op, bits, source, to_bits)
+        elif op == b"select" and (match := profile_patterns['select'].search(line)):
+            cond, bits, true_value, false_value = match.groups()
+            values[(block.function, dest)] = (op, int(bits), cond.strip(), true_value, false_value)
+        elif op == b"alloca":
+            if match := profile_patterns['alloca'].search(line):
+                facts.arrays[(block.function, dest)] = array_shape(match.group(1))
+            elif _int_bits(stripped.split(None, 2)[1].rstrip(b",")) is not None:
+                slots.add(dest)
+                facts.slots.add((block.function, dest))
+        elif op == b"br":
+            body = line.partition(b", !")[0]
+            block.successors = [label.strip(b'"').decode() for label in profile_patterns['labels'].findall(body)]
+            block.loop_branch = b"!llvm.loop" in line
+            if match := profile_patterns['cond'].search(body):
+                block.cond = match.group(1)
+        elif op in (b"ret", b"switch", b"unreachable", b"resume", b"indirectbr"):
+            block.successors = []
+    return blocks, facts
+
+
+def _phi_induction(name, header, latch, index_of, facts, function):
+    """(start, step) of a header phi stepped by a constant add inside the loop"""
+    phi = facts.phis.get((function, name))
+    if phi is None or phi[0] != header:
+        return None
+    start = step = None
+    for value, label in phi[1]:
+        source = index_of.get((function, label))
+        if source is None:
+            continue
+        if header <= source <= latch:
+            add = facts.adds.get((function, value))
+            if add and add[0] == name:
+                step = add[1]
+        else:
+            start = _constant(value.decode())
+    return (start, step) if start is not None and step else None
+
+
+def _memory_induction(slot, header, latch, facts, function):
+    """(start, step) of a stack slot set once before the loop and bumped by a constant inside it"""
+    inside, outside = [], []
+    for position, value in facts.stores.get((function, slot), ()):
+        (inside if header <= position <= latch else outside).append(value)
+    if len(inside) != 1 or len(outside) != 1:
+        return None
+    add = facts.adds.get((function, inside[0]))
+    start = _constant(outside[0].decode())
+    if add is None or start is None or not add[1] or facts.loads.get((function, add[0])) != slot:
+        return None
+    return start, add[1]
+
+
+def _invariant_bound(name, header, latch, facts, function):
+    """Whether a non-constant bound holds the same value on every iteration"""
+    position = facts.defs.get((function, name))
+    if position is None or not header <= position <= latch:
+        return True
+    slot = facts.loads.get((function, name))
+    return slot is not None and all(not header <= store <= latch
+                                    for store, _ in facts.stores.get((function, slot), ()))
+
+
+def _trip_count(header, latch, blocks, index_of, facts):
+    """(trip count, label of the exiting block, induction) of a counted loop, or None
+
+    Recognizes an induction variable that starts at a constant outside the
+    loop and is stepped by a constant add inside it: a header phi, or at
+    -O0 a stack slot that is loaded, bumped and stored back. The branch
+    leaving the header or the latch must compare it, or its stepped value,
+    against a bound. A constant bound gives an int; a loop-invariant value
+    counted from 0 in steps of 1 gives that value's name ('%n'). induction
+    is (phi name or stack slot, start, step).
+    """
+    function = blocks[header].function
+    for position in (header, latch):
+        block = blocks[position]
+        compare = facts.compares.get((function, block.cond))
+        if compare is None or len(block.successors) != 2:
+            continue
+        targets = [index_of.get((function, label)) for label in block.successors]
+        inside = [target is not None and header <= target <= latch for target in targets]
+        if inside[0] == inside[1]:
+            continue
+        pred, lhs, rhs = compare
+        if not inside[0]:
+            pred = inverse_predicates.get(pred)
+        # Compare either the induction variable itself or its stepped value
+        step_source = facts.adds.get((function, lhs))
+        name = step_source[0] if step_source else lhs
+        variable = name
+        induction = _phi_induction(name, header, latch, index_of, facts, function)
+        if induction is None and (variable := facts.loads.get((function, name))) is not None:
+            induction = _memory_induction(variable, header, latch, facts, function)
+        if induction is None:
+            continue
+        start, step = induction
+        induction = (variable, start, step)
+        if step_source and step_source[1] != step:
+            continue
+        bound = _constant(rhs.decode())
+        if bound is None:
+            if (start, step) == (0, 1) and pred in ("slt", "ult", "ne") and \
+                    _invariant_bound(rhs, header, latch, facts, function):
+                return rhs.decode(), block.label, induction
+            continue
+        # The exit compare sees the stepped value when it tests the add
+        first = start + step if step_source else start
+        if pred in ("slt", "ult", "ne"):
+            span = bound - first
+        elif pred in ("sle", "ule"):
+            span = bound - first + 1
+        elif pred in ("sgt", "ugt"):
+            span = first - bound
+            step = -step
+        elif pred in ("sge", "uge"):
+            span = first - bound + 1
+            step = -step
+        else:
+            continue
+        if step <= 0:
+            continue
+        return max(0, -(-span // step)) + (1 if step_source else 0), block.label, induction
+    return None
+
+
+def _loops(blocks):
+    """{header index: latch index} for back edges, plus headers whose latch carries !llvm.loop"""
+    index_of = {(block.function, block.label): index for index, block in enumerate(blocks)}
+    loops = {}
+    annotated = set()
+    for index, block in enumerate(blocks):
+        for label in block.successors:
+            target = index_of.get((block.function, label))
+            if target is not None and target <= index:
+                loops[target] = max(loops.get(target, target), index)
+                if block.loop_branch:
+                    annotated.add(target)
+    return loops, annotated, index_of
+
+
+def _resolve_gep(function, pointer, facts, memo):
+    """(root, dims, index operands, element bits) of the address a getelementptr chain computes, or None
+
+    root is the global, array alloca or pointer slot/argument indexed.
+    dims is the shape seen from it, None where the extent is not in the
+    IR; a further GEP on a partial address continues its indices.
+    """
+    key = (function, pointer)
+    if key in memo:
+        return memo[key]
+    memo[key] = None
+    gep = facts.geps.get(key)
+    if gep is None:
+        return None
+    source, base, indices = gep
+    shape, bits = array_shape(source)
+    parent = _resolve_gep(function, base, facts, memo)
+    if parent is not None:
+        root, dims, index, _ = parent
+        if len(index) < len(dims) and indices and indices[0] == b"0":
+            resolved = root, dims, index + indices[1:], bits
+        elif len(index) == len(dims) and len(indices) == 1 and index[-1] == b"0":
+            resolved = root, dims, index[:-1] + indices, bits
+        else:
+            resolved = None
+    else:
+        root = (None, base) if base.startswith(b"@") else (function, facts.loads.get(key[:1] + (base,), base))
+        array = facts.arrays.get(root)
+        if array is not None and array[0] == shape and indices and indices[0] == b"0":
+            resolved = root, shape, indices[1:], bits
+        else:
+            resolved = root, (None,) + shape, indices, bits
+    memo[key] = resolved
+    return resolved
+
+
+def _index(function, token, facts, inductions):
+    """An index operand as an int, the header index of the loop it counts, or None"""
+    constant = _constant(token.decode())
+    if constant is not None:
+        return constant
+    while (function, token) in facts.casts:
+        token = facts.casts[(function, token)]
+    header = inductions.get((function, token))
+    if header is None and (slot := facts.loads.get((function, token))) is not None:
+        header = inductions.get((function, slot))
+    return ("loop", header) if header is not None else None
+
+
+def _tensor_name(root, facts):
+    function, name = root
+    name = name.decode()
+    if function is None:
+        return name, "global"
+    if root in facts.arrays:
+        return f"{function}:{name}", "local"
+    return f"{function}:{name.removesuffix('.addr')}", "argument"
+
+
+def _reach(subscript):
+    """Elements a dimension needs to hold for subscript to stay in bounds, or None if unknown
+
+    A constant index reaches itself; a loop's induction variable reaches
+    the further of its first and last values.
+    """
+    if isinstance(subscript, dict):
+        start = subscript["start"]
+        subscript = max(start, start + subscript["step"] * (subscript["trip_count"] - 1))
+    if not isinstance(subscript, int) or subscript < 0:
+        return None
+    return subscript + 1
+
+
+def _tensor_accesses(blocks, facts, inductions, loops_by_header, innermost, weights):
+    """Array tensors and the loads/stores that index them with known subscripts"""
+    memo = {}
+    tensors, accesses = {}, []
+    for position, pointer, store in facts.accesses:
+        function = blocks[position].function
+        resolved = _resolve_gep(function, pointer, facts, memo)
+        if resolved is None or len(resolved[2]) != len(resolved[1]):
+            continue
+        root, dims, index, bits = resolved
+        name, kind = _tensor_name(root, facts)
+        tensor = tensors.setdefault(name, {"function": root[0], "kind": kind, "dims": dims, "elem_bits": bits or 32})
+        if tensor["dims"] != dims:
+            continue
+        subscripts = []
+        for token in index:
+            subscript = _index(function, token, facts, inductions)
+            if isinstance(subscript, tuple):
+                record = loops_by_header[subscript[1]]
+                subscript = {"loop": record["header"], "start": record["induction"][0],
+                             "step": record["induction"][1], "trip_count": record["trip_count"]}
+            subscripts.append(subscript)
+        loop = innermost[position]
+        accesses.append({
+            "tensor": name,
+            "function": function,
+            "block": blocks[position].label,
+            "loop": loops_by_header[loop]["header"] if loop is not None else None,
+            "pointer": pointer.decode().lstrip("%"),
+            "store": store,
+            "subscripts": subscripts,
+            "weight": weights[position],
+        })
+    # Extents missing from the IR are the furthest element a subscript reaches
+    for name, tensor in tensors.items():
+        shape = []
+        for dim, extent in enumerate(tensor.pop("dims")):
+            if extent is None:
+                reaches = [_reach(access["subscripts"][dim]) for access in accesses if access["tensor"] == name]
+                extent = max(filter(None, reaches), default=DEFAULT_TRIP_COUNT)
+                tensor["estimated"] = True
+            shape.append(extent)
+        tensor["shape"] = tuple(shape)
+        tensor.setdefault("estimated", False)
+    return tensors, accesses
+
+
+def _build_profile(lines, digest):
+    blocks, facts = _scan(lines)
+    loops, annotated, index_of = _loops(blocks)
+
+    loop_records = []
+    loops_by_header = {}
+    inductions = {}
+    swept = {}
+    innermost = [None] * len(blocks)
+    weights = [1] * len(blocks)
+    for header, latch in sorted(loops.items()):
+        counted = _trip_count(header, latch, blocks, index_of, facts)
+        count, exiting, induction = counted or (None, None, None)
+        if induction is not None:
+            inductions[(blocks[header].function, induction[0])] = header
+            if isinstance(count, int):
+                # The variable also holds its exit value once the loop ends
+                variable, start, step = induction
+                swept[(blocks[header].function, variable)] = tuple(sorted((start, start + step * count)))
+        known = isinstance(count, int)
+        trips = count if known else DEFAULT_TRIP_COUNT
+        parent = innermost[header]
+        for index in range(header, latch + 1):
+            weights[index] *= max(trips, 1)
+            # Later headers are nested deeper
+            innermost[index] = header
+        depth = sum(1 for other, other_latch in loops.items() if other <= header and latch <= other_latch)
+        loop_records.append({
+            "function": blocks[header].function,
+            "header": blocks[header].label,
+            "latch": blocks[latch].label,
+            "depth": depth,
+            "parent": loops_by_header[parent]["header"] if parent is not None else None,
+            "trip_count": trips,
+            "trip_count_known": known,
+            "count": count,
+            "exiting": exiting,
+            "annotated": header in annotated,
+            "induction": induction[1:] if induction else None,
+        })
+        loops_by_header[header] = loop_records[-1]
+
+    ranges = value_ranges(facts.values, facts.phis, facts.slots - facts.escaped, facts.stores, swept)
+    static_counts, dynamic_counts, lut_ops, lut_demand = {}, {}, {}, {}
+    narrowing = {"operations": 0, "micro_ops": 0, "full_micro_ops": 0}
+    for block, weight in zip(blocks, weights):
+        for op, count in block.ops.items():
+            static_counts[op] = static_counts.get(op, 0) + count
+            dynamic_counts[op] = dynamic_counts.get(op, 0) + count * weight
+        for opcode, width, signed, lhs, rhs in block.lut_ops:
+            bits = narrowed_bits(opcode, width, ranges.get((block.function, lhs), _constant_range(lhs)),
+                                 ranges.get((block.function, rhs), _constant_range(rhs)))
+            narrowing["operations"] += bits is not None
+            key = (opcode, width, signed, bits)
+            lut_ops[key] = lut_ops.get(key, 0) + weight
+    for (opcode, width, signed, bits), count in lut_ops.items():
+        ops = decompose(opcode, width, signed, operand_bits=bits).ops
+        for code, *_ in ops:
+            lut_demand[code] = lut_demand.get(code, 0) + count
+        narrowing["micro_ops"] += len(ops) * count
+        narrowing["full_micro_ops"] += len(decompose(opcode, width, signed).ops) * count
+    tensors, accesses = _tensor_accesses(blocks, facts, inductions, loops_by_header, innermost, weights)
+
+    return {
+        "hash": digest,
+        "blocks": len(blocks),
+        "block_weights": {(block.function, block.label): weight for block, weight in zip(blocks, weights)},
+        "loops": loop_records,
+        "static_counts": static_counts,
+        "dynamic_counts": dynamic_counts,
+        "lut_demand": lut_demand,
+        "value_ranges": {(function, name[1:].decode()): value_range
+                         for (function, name), value_range in ranges.items()},
+        "narrowing": narrowing,
+        "tensors": tensors,
+        "accesses": accesses,
+    }
+
+
+def profile_ir(source):
+    """Static execution profile of LLVM IR given as bytes or a .ll path, memoized by content hash
+
+    Each block's operations are weighted by the product of the estimated
+    trip counts of the loops around it: exact for constant-bounded counted
+    loops, DEFAULT_TRIP_COUNT otherwise. value_ranges bounds integer values
+    by (function, name without '%'), from constants, casts, masks and
+    counted loops (see value_range.value_ranges()). lut_demand gives the
+    weighted number of 4-bit micro-ops each LUT function would run, with
+    operations on small non-negative operands narrowed; narrowing counts
+    them and the weighted micro-ops with and without narrowing. tensors
+    are the arrays indexed through getelementptr, with their shape and
+    element width, and accesses the loads and stores into them with each
+    subscript given as a constant, the counted loop whose induction
+    variable it is, or None. The returned dict is shared between callers and must not be
+    modified.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return _profile_buffer(source, lambda: iter(io.BytesIO(source).readline, b""))
+    with open(source, "rb") as f:
+        if not f.seek(0, 2):
+            return _profile_buffer(b"", lambda: iter(()))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            buffer_lines = lambda: iter(buffer.readline, b"")
+            return _profile_buffer(buffer, buffer_lines)
+
+
+def _profile_buffer(buffer, lines):
+    digest = hashlib.sha256(buffer).hexdigest()
+    profile = _profiles.get(digest)
+    if profile is None:
+        profile = _build_profile(lines(), digest)
+        _profiles[digest] = profile
+        if len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+    else:
+        _profiles.move_to_end(digest)
+    return profile
@@ -0,0 +1,183 @@
+# Each pPIM cluster has nine 8-bit LUT cores
+CORES_PER_CLUSTER = 9
+
+# LUT function codes and the instruction that programs them
+LUT_MULT = 0x40
+LUT_ADD = 0x80
+LUT_CMP = 0xC0
+LUT_CMP_SIGNED = 0xD0
+LUT_CMP_MERGE = 0xE0
+lut_mnemonics = {LUT_MULT: "LUT_PROG_MULT", LUT_ADD: "LUT_PROG_ADD", LUT_CMP: "LUT_PROG_CMP",
+                 LUT_CMP_SIGNED: "LUT_PROG_CMP", LUT_CMP_MERGE: "LUT_PROG_CMP"}
+lut_purposes = {LUT_MULT: "4-bit mult", LUT_ADD: "addition", LUT_CMP: "comparison",
+                LUT_CMP_SIGNED: "signed comparison", LUT_CMP_MERGE: "comparison merge"}
+
+# Per-core programming with nothing known about any core
+UNKNOWN_STATE = (None,) * CORES_PER_CLUSTER
+
+
+def apply_program(state, mask, code):
+    """State after programming the cores in mask with code"""
+    return tuple(code if mask >> core & 1 else held for core, held in enumerate(state))
+
+
+def meet(state_a, state_b):
+    """Cores whose programming is the same on both incoming paths"""
+    return tuple(a if a == b else None for a, b in zip(state_a, state_b))
+
+
+def missing_cores(state, mask, code):
+    """Subset of mask whose cores do not already hold code"""
+    missing = 0
+    for core in range(CORES_PER_CLUSTER):
+        if mask >> core & 1 and state[core] != code:
+            missing |= 1 << core
+    return missing
+
+
+def describe_cores(mask):
+    """Human-readable core list for asm comments, e.g. 'cores 0-3'"""
+    cores = [core for core in range(CORES_PER_CLUSTER) if mask >> core & 1]
+    if len(cores) == 1:
+        return f"core {cores[0]}"
+    if cores == list(range(cores[0], cores[-1] + 1)):
+        return f"cores {cores[0]}-{cores[-1]}"
+    return "cores " + ", ".join(map(str, cores))
+
+
+def format_lut_prog(mask, code, comment):
+    """LUT programming asm line in the existing '0xF, 0x80' operand style"""
+    return f"{lut_mnemonics[code]} 0x{mask:X}, 0x{code:X}  ; {comment}"
+
+
+class LutPlan:
+    """Result of plan_lut_programming(): per-block entry states and hoisted programs"""
+
+    def __init__(self, entry_states, hoisted):
+        self.entry_states = entry_states
+        self.hoisted = hoisted
+
+
+def _requirements(graph, lut_requirements):
+    """(mask, code) programming requested by each block, in order"""
+    return {
+        block: [(mask, code) for instr in instrs for mask, code, _ in lut_requirements(instr)]
+        for block, instrs in graph.instructions.items()
+    }
+
+
+def _hoist(graph, requirements):
+    """Move loop-invariant per-core programming into each loop's single preheader"""
+    hoisted = {block: [] for block in graph.order}
+    for header, latch in graph.natural_loops():
+        body = range(header, latch + 1)
+        outside = [pred for pred in graph.predecessors[header] if pred not in body]
+        if len(outside) != 1:
+            continue
+        codes_per_core = [set() for _ in range(CORES_PER_CLUSTER)]
+        for block in body:
+            for mask, code in requirements[block] + hoisted[block]:
+                for core in range(CORES_PER_CLUSTER):
+                    if mask >> core & 1:
+                        codes_per_core[core].add(code)
+        invariant = {}
+        for core, codes in enumerate(codes_per_core):
+            if len(codes) == 1:
+                code = next(iter(codes))
+                invariant[code] = invariant.get(code, 0) | 1 << core
+        hoisted[outside[0]].extend((mask, code) for code, mask in invariant.items())
+    return hoisted
+
+
+def plan_lut_programming(graph, lut_requirements, hoist=True):
+    """Compute the LUT state known on entry to every block of a BlockGraph
+
+    lut_requirements(instr) gives the (mask, code, comment) programming an
+    instruction needs. A core counts as programmed on block entry only if
+    it holds the same function on every incoming path. With hoist=True
+    loop-invariant programming is first moved to the end of each loop's
+    preheader so the loop body finds it resident.
+    """
+    requirements = _requirements(graph, lut_requirements)
+    if hoist:
+        hoisted = _hoist(graph, requirements)
+    else:
+        hoisted = {block: [] for block in graph.order}
+
+    def transfer(block, state):
+        for mask, code in requirements[block] + hoisted[block]:
+            state = apply_program(state, mask, code)
+        return state
+
+    return LutPlan(graph.forward_must(transfer, meet, UNKNOWN_STATE), hoisted)
+
+
+class LutTracker:
+    """Models the cores' LUT contents during lowering and drops redundant LUT_PROG_*
+
+    Without a plan the state is only trusted within a basic block, which
+    is always safe for streamed lowering.
+    """
+
+    def __init__(self, plan=None):
+        self.plan = plan
+        self.state = UNKNOWN_STATE
+        self.block = None
+        self.pending_hoisted = []
+        self.stats = {"requested": 0, "emitted": 0, "saved": 0, "hoisted": 0}
+
+    def _emit(self, mask, code, comment):
+        missing = missing_cores(self.state, mask, code)
+        self.state = apply_program(self.state, mask, code)
+        if not missing:
+            return None
+        if missing != mask:
+            comment = f"Program {describe_cores(missing)} for {lut_purposes[code]}; rest already resident"
+        return format_lut_prog(missing, code, comment)
+
+    def program(self, mask, code, comment):
+        """Asm line programming whichever cores in mask lack code, or None"""
+        self.stats["requested"] += 1
+        line = self._emit(mask, code, comment)
+        if line is None:
+            self.stats["saved"] += 1
+        else:
+            self.stats["emitted"] += 1
+        return line
+
+    def flush_hoisted(self):
+        """Asm lines for programming hoisted to the end of the current block"""
+        lines = []
+        for mask, code in self.pending_hoisted:
+            line = self._emit(mask, code, f"Hoisted: program {describe_cores(mask)} for {lut_purposes[code]}")
+            if line is not None:
+                self.stats["hoisted"] += 1
+                lines.append(line)
+        self.pending_hoisted = []
+        return lines
+
+    def enter_block(self, block):
+        """Advance to block, returning hoisted lines owed by the blocks passed over
+
+        Block ids are consecutive in layout order, so blocks that produced
+        no instructions still get their hoisted programming emitted.
+        """
+        lines = self.flush_hoisted()
+        if self.plan is None:
+            self.block = block
+            self.state = UNKNOWN_STATE
+            return lines
+        start = block if self.block is None else self.block + 1
+        for passed in range(start, block + 1):
+            self.block = passed
+            self.state = self.plan.entry_states.get(passed, UNKNOWN_STATE)
+            self.pending_hoisted = list(self.plan.hoisted.get(passed, ()))
+            if passed != block:
+                lines.extend(self.flush_hoisted())
+        return lines
+
+    def finish(self):
+        """Hoisted lines owed by the current block and any trailing empty blocks"""
+        if self.plan is None or not self.plan.hoisted:
+            return self.flush_hoisted()
+        return self.enter_block(max(self.plan.hoisted)) + self.flush_hoisted()
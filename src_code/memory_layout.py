@@ -0,0 +1,343 @@
+"""Place the arrays of LLVM IR into pPIM banks, subarrays and rows.
+
+Usage:
+    python memory_layout.py outputs/optimized.ll [--banks 4] [--layout tiled] [-o outputs/output.map]
+"""
+import argparse
+import math
+import sys
+
+import numpy as np
+
+from ir_profile import profile_ir
+from row_allocator import NUM_ROWS, ROW_BITS
+
+LAYOUTS = ("row_major", "column_major", "interleaved", "tiled")
+
+# Geometry assumed when none is given: a bank's 512 rows split into 8 subarrays
+DEFAULT_BANKS = 4
+SUBARRAYS_PER_BANK = 8
+
+# Iterations replayed when costing a layout: outer loops are sampled evenly
+# over their range, innermost loops run consecutively up to their cap
+TRACE_TRIPS = 8
+TRACE_INNER_TRIPS = 256
+MAX_TRACE_ACCESSES = 1 << 16
+
+
+class MemoryGeometry:
+    """Banks, subarrays and rows the planner places tensors into"""
+
+    def __init__(self, banks=DEFAULT_BANKS, subarrays_per_bank=SUBARRAYS_PER_BANK, rows_per_bank=NUM_ROWS,
+                 row_bits=ROW_BITS):
+        self.banks = banks
+        self.subarrays_per_bank = subarrays_per_bank
+        self.rows_per_bank = rows_per_bank
+        self.row_bits = row_bits
+
+    @property
+    def rows_per_subarray(self):
+        return self.rows_per_bank // self.subarrays_per_bank
+
+    def describe(self):
+        return {"banks": self.banks, "subarrays_per_bank": self.subarrays_per_bank,
+                "rows_per_subarray": self.rows_per_subarray, "row_bits": self.row_bits}
+
+
+class _Tensor:
+    """A tensor viewed as a rows x cols matrix, leading dimensions folded into rows"""
+
+    def __init__(self, name, record, weight, geometry):
+        self.name = name
+        self.record = record
+        self.weight = weight
+        shape = record["shape"]
+        self.rows = math.prod(shape[:-1]) if len(shape) > 1 else 1
+        self.cols = shape[-1] if shape else 1
+        self.per_row = max(geometry.row_bits // record["elem_bits"], 1)
+        # Square-ish tiles filling one DRAM row
+        tile_cols = min(self.cols, 1 << int(math.log2(self.per_row) // 2))
+        self.tile = (max(min(self.rows, self.per_row // tile_cols), 1), tile_cols)
+
+    def layouts(self, allowed):
+        if self.rows == 1:
+            return [layout for layout in allowed if layout in ("row_major", "interleaved")] or ["row_major"]
+        return list(allowed)
+
+    def row_count(self, layout, banks):
+        """DRAM rows needed per bank holding part of the tensor"""
+        elements = self.rows * self.cols
+        if layout == "interleaved":
+            return -(-(-(-elements // self.per_row)) // banks)
+        if layout == "tiled":
+            tile_rows, tile_cols = self.tile
+            return -(-self.rows // tile_rows) * -(-self.cols // tile_cols)
+        return -(-elements // self.per_row)
+
+    def place(self, layout, bank, first_row, row, col, banks):
+        """(bank, row) arrays of the elements at row, col"""
+        if layout == "column_major":
+            chunk = (col * self.rows + row) // self.per_row
+        elif layout == "tiled":
+            tile_rows, tile_cols = self.tile
+            chunk = row // tile_rows * -(-self.cols // tile_cols) + col // tile_cols
+        else:
+            chunk = (row * self.cols + col) // self.per_row
+        if layout == "interleaved":
+            return (bank + chunk) % banks, first_row + chunk // banks
+        return np.full(chunk.shape, bank), first_row + chunk
+
+
+def _loop_tree(profile, function):
+    """{loop header or None: child loop records} of one function"""
+    children = {}
+    for record in profile["loops"]:
+        if record["function"] == function:
+            children.setdefault(record["parent"], []).append(record)
+    return children
+
+
+def _trace(profile, tensors):
+    """(tensor ids, matrix rows, matrix cols) of accesses replaying every loop nest in order
+
+    Loops with nested loops run TRACE_TRIPS iterations spread over their
+    trip count, innermost loops their first TRACE_INNER_TRIPS. An access
+    runs once per iteration of its innermost loop, ahead of the loops
+    nested in it. Subscripts that are not constants or induction variables
+    read as 0.
+    """
+    ids = {name: index for index, name in enumerate(tensors)}
+    by_loop = {}
+    for access in profile["accesses"]:
+        if access["tensor"] in ids:
+            by_loop.setdefault((access["function"], access["loop"]), []).append(access)
+    events = []
+    env = {}
+
+    def emit(accesses):
+        for access in accesses:
+            subscripts = []
+            for subscript in access["subscripts"]:
+                if isinstance(subscript, dict):
+                    subscripts.append(env.get(subscript["loop"], subscript["start"]))
+                else:
+                    subscripts.append(subscript or 0)
+            tensor = tensors[access["tensor"]]
+            shape = tensor.record["shape"]
+            flat = 0
+            for value, extent in zip(subscripts[:-1], shape[:-1]):
+                flat = flat * extent + value % extent
+            col = subscripts[-1] % shape[-1] if shape else 0
+            events.append((ids[access["tensor"]], flat, col))
+
+    def walk(function, record, children):
+        nested = children.get(record["header"], ())
+        trips = record["trip_count"]
+        sampled = min(trips, TRACE_TRIPS if nested else TRACE_INNER_TRIPS)
+        start, step = record["induction"] or (0, 1)
+        accesses = by_loop.get((function, record["header"]), ())
+        for sample in range(sampled):
+            if len(events) >= MAX_TRACE_ACCESSES:
+                return
+            iteration = sample * trips // sampled if nested else sample
+            env[record["header"]] = start + step * iteration
+            emit(accesses)
+            for child in nested:
+                walk(function, child, children)
+
+    for function in dict.fromkeys(access["function"] for access in profile["accesses"]):
+        children = _loop_tree(profile, function)
+        emit(by_loop.get((function, None), ()))
+        for record in children.get(None, ()):
+            walk(function, record, children)
+    table = np.asarray(events, dtype=np.int64).reshape(-1, 3)
+    return table[:, 0], table[:, 1], table[:, 2]
+
+
+def _first_rows(tensors, choices, geometry):
+    """First row of each tensor, packing tensors bank by bank in order"""
+    next_free = [0] * geometry.banks
+    first_rows = {}
+    for name, tensor in tensors.items():
+        layout, bank = choices[name]
+        banks = range(geometry.banks) if layout == "interleaved" else (bank,)
+        first_row = max(next_free[b] for b in banks)
+        rows = tensor.row_count(layout, geometry.banks)
+        for b in banks:
+            next_free[b] = first_row + rows
+        first_rows[name] = first_row
+    return first_rows, next_free
+
+
+def _overflow(tensors, choices, geometry):
+    """Rows the tensors need beyond the capacity of their banks, summed over banks"""
+    _, rows_used = _first_rows(tensors, choices, geometry)
+    return sum(max(rows - geometry.rows_per_bank, 0) for rows in rows_used)
+
+
+def _cost(trace, tensors, choices, geometry):
+    """(row activations, bank conflicts) of the trace under a layout assignment
+
+    An access activates a row unless its bank already has that row open; it
+    is a bank conflict when the row it closes was opened for another tensor.
+    """
+    ids, rows, cols = trace
+    if not len(ids):
+        return 0, 0
+    first_rows, _ = _first_rows(tensors, choices, geometry)
+    bank = np.zeros(len(ids), dtype=np.int64)
+    row = np.zeros(len(ids), dtype=np.int64)
+    for index, (name, tensor) in enumerate(tensors.items()):
+        mask = ids == index
+        layout, home = choices[name]
+        bank[mask], row[mask] = tensor.place(layout, home, first_rows[name], rows[mask], cols[mask], geometry.banks)
+    order = np.argsort(bank, kind="stable")
+    bank, row, owner = bank[order], row[order], ids[order]
+    same_bank = np.concatenate(([False], bank[1:] == bank[:-1]))
+    previous_row = np.concatenate(([-1], row[:-1]))
+    previous_owner = np.concatenate(([-1], owner[:-1]))
+    activation = ~same_bank | (row != previous_row)
+    conflict = activation & same_bank & (owner != previous_owner)
+    return int(activation.sum()), int(conflict.sum())
+
+
+def plan_memory_layout(profile, geometry=None, layouts=LAYOUTS):
+    """Choose a layout and bank for every tensor of a profile (see ir_profile.profile_ir())
+
+    The loop nests' accesses are replayed against each candidate layout
+    (row-major, column-major, row-interleaved across banks, or tiles of one
+    DRAM row) and bank, one tensor at a time from the most accessed, keeping
+    whichever overflows the banks' rows least and then gives the fewest row
+    activations plus bank conflicts. The baseline is every tensor
+    row-major, packed one after another into bank 0. Returns the placement
+    of each tensor, the replayed costs of the plan and the baseline, and
+    pointer_rows: for each function, the [bank, first row] of the tensor
+    each of its getelementptr pointers indexes, for the row allocator. When no layout fits in the banks the
+    plan places nothing, leaving the row allocator's sequential
+    allocation, and says why in warning.
+    """
+    geometry = geometry or MemoryGeometry()
+    weights = {}
+    for access in profile["accesses"]:
+        weights[access["tensor"]] = weights.get(access["tensor"], 0) + access["weight"]
+    tensors = {name: _Tensor(name, profile["tensors"][name], weight, geometry)
+               for name, weight in sorted(weights.items(), key=lambda item: -item[1])}
+    trace = _trace(profile, tensors)
+
+    baseline = {name: ("row_major", 0) for name in tensors}
+    choices = dict(baseline)
+    best = _cost(trace, tensors, choices, geometry)
+    overflow = _overflow(tensors, choices, geometry)
+    for _ in range(2):
+        for name, tensor in tensors.items():
+            for layout in tensor.layouts(layouts):
+                for bank in range(geometry.banks):
+                    candidate = dict(choices, **{name: (layout, bank)})
+                    candidate_overflow = _overflow(tensors, candidate, geometry)
+                    if candidate_overflow > overflow:
+                        continue
+                    cost = _cost(trace, tensors, candidate, geometry)
+                    if candidate_overflow < overflow or sum(cost) < sum(best):
+                        choices, best, overflow = candidate, cost, candidate_overflow
+
+    baseline_cost = _cost(trace, tensors, baseline, geometry)
+    plan = {
+        "geometry": geometry.describe(),
+        "tensors": [],
+        "traced_accesses": len(trace[0]),
+        "row_activations": baseline_cost[0],
+        "bank_conflicts": baseline_cost[1],
+        "baseline_row_activations": baseline_cost[0],
+        "baseline_bank_conflicts": baseline_cost[1],
+        "rows_reserved": 0,
+        "pointer_rows": {},
+        "warning": None,
+    }
+    if overflow:
+        plan["warning"] = (f"tensors need {overflow} more rows than {geometry.banks} banks of "
+                           f"{geometry.rows_per_bank} rows hold; arrays are allocated sequentially instead")
+        return plan
+    first_rows, rows_used = _first_rows(tensors, choices, geometry)
+    placements = []
+    for name, tensor in tensors.items():
+        layout, bank = choices[name]
+        rows = tensor.row_count(layout, geometry.banks)
+        first_row = first_rows[name]
+        banks = list(range(geometry.banks)) if layout == "interleaved" else [bank]
+        placements.append({
+            "tensor": name,
+            "function": tensor.record["function"],
+            "kind": tensor.record["kind"],
+            "shape": list(tensor.record["shape"]),
+            "shape_estimated": tensor.record["estimated"],
+            "elem_bits": tensor.record["elem_bits"],
+            "layout": layout,
+            "tile": list(tensor.tile) if layout == "tiled" else None,
+            "banks": banks,
+            "first_row": first_row,
+            "rows": rows,
+            "subarrays": sorted({row // geometry.rows_per_subarray for row in range(first_row, first_row + rows)}),
+            "access_weight": tensor.weight,
+        })
+    plan.update({
+        "tensors": placements,
+        "row_activations": best[0],
+        "bank_conflicts": best[1],
+        "rows_reserved": max(rows_used, default=0),
+        "pointer_rows": {},
+    })
+    for access in profile["accesses"]:
+        address = [choices[access["tensor"]][1], first_rows[access["tensor"]]]
+        plan["pointer_rows"].setdefault(access["function"], {})[access["pointer"]] = address
+    return plan
+
+
+def _range(values):
+    return f"{values[0]}-{values[-1]}" if len(values) > 1 else str(values[0])
+
+
+def format_memory_map(plan):
+    """Text memory map listing where each tensor lives"""
+    geometry = plan["geometry"]
+    lines = [
+        f"; pPIM memory map: {geometry['banks']} banks x {geometry['subarrays_per_bank']} subarrays x "
+        f"{geometry['rows_per_subarray']} rows of {geometry['row_bits']} bits",
+        f"; {plan['traced_accesses']} traced accesses: {plan['row_activations']} row activations, "
+        f"{plan['bank_conflicts']} bank conflicts (all row-major in bank 0: "
+        f"{plan['baseline_row_activations']}, {plan['baseline_bank_conflicts']})",
+    ]
+    if plan["warning"]:
+        lines.append(f"; warning: {plan['warning']}")
+    lines.append(f"{'tensor':<24}{'shape':<14}{'elem':<6}{'layout':<18}{'banks':<8}{'rows':<10}{'subarrays':<10}")
+    for placement in plan["tensors"]:
+        shape = "x".join(map(str, placement["shape"])) + ("?" if placement["shape_estimated"] else "")
+        layout = placement["layout"]
+        if placement["tile"]:
+            layout += " {}x{}".format(*placement["tile"])
+        rows = _range([placement["first_row"], placement["first_row"] + placement["rows"] - 1])
+        lines.append(f"{placement['tensor']:<24}{shape:<14}{'i' + str(placement['elem_bits']):<6}{layout:<18}"
+                     f"{_range(placement['banks']):<8}{rows:<10}{_range(placement['subarrays']):<10}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan the physical memory layout of LLVM IR arrays")
+    parser.add_argument("ll_file")
+    parser.add_argument("--banks", type=int, default=DEFAULT_BANKS)
+    parser.add_argument("--layout", choices=LAYOUTS, action="append", default=None,
+                        help="restrict the candidate layouts (repeatable)")
+    parser.add_argument("-o", "--output", default=None, help="write the memory map here instead of printing it")
+    args = parser.parse_args(argv)
+
+    plan = plan_memory_layout(profile_ir(args.ll_file), MemoryGeometry(banks=args.banks), args.layout or LAYOUTS)
+    memory_map = format_memory_map(plan)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(memory_map)
+    else:
+        print(memory_map)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
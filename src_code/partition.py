@@ -0,0 +1,315 @@
+"""Split emitted pPIM assembly into one instruction stream per cluster.
+
+Usage:
+    python partition.py outputs/output.asm --clusters 8 [-o outputs/clusters] [--split inner]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from lut_state import UNKNOWN_STATE, LutTracker, apply_program, format_lut_prog, lut_purposes
+from pim_ir import Opcode
+from pim_binary import encode_file
+from pim_isa import format_row, parse_asm_line
+from pim_simulator import PimConfig, simulate
+from precision import DEFAULT_WIDTH, decompose
+from row_allocator import NUM_ROWS
+
+SPLITS = ("auto", "outer", "inner")
+
+
+class _Repeat:
+    """A REPEAT ... END_REPEAT span of the asm, by line index"""
+
+    def __init__(self, start, count):
+        self.start = start
+        self.end = None
+        self.count = count
+        self.children = []
+
+
+def _count(line):
+    """Trip count of a REPEAT line: an int, or the name of a runtime value"""
+    token = line.split(";", 1)[0].split()[1].rstrip(",")
+    return int(token) if token.isdigit() else token
+
+
+def _repeat_tree(lines):
+    """Top-level REPEAT spans with their nested spans"""
+    roots, stack = [], []
+    for index, line in enumerate(lines):
+        if line.startswith("REPEAT"):
+            repeat = _Repeat(index, _count(line))
+            (stack[-1].children if stack else roots).append(repeat)
+            stack.append(repeat)
+        elif line.startswith("END_REPEAT") and stack:
+            stack.pop().end = index
+    if stack:
+        raise ValueError(f"REPEAT on line {stack[-1].start + 1} has no END_REPEAT")
+    return roots
+
+
+def _has_mac(lines, repeat):
+    return any(line.startswith("MAC_MULT") for line in lines[repeat.start:repeat.end])
+
+
+def _innermost_mac(lines, repeat):
+    """Deepest REPEAT within repeat whose own body multiplies"""
+    for child in repeat.children:
+        if _has_mac(lines, child):
+            return _innermost_mac(lines, child)
+    return repeat
+
+
+def _shares(count, clusters):
+    """Iterations of a count-iteration loop each cluster runs"""
+    return [count // clusters + (part < count % clusters) for part in range(clusters)]
+
+
+def _slice(line, part, clusters):
+    """REPEAT line running the part-th of clusters contiguous slices of the loop"""
+    comment = line.partition(";")[2]
+    return f"REPEAT {_shares(_count(line), clusters)[part]}  ;{comment} slice {part + 1}/{clusters}"
+
+
+def _lut_state(lines, state=UNKNOWN_STATE):
+    """Per-core LUT codes after running lines once in order"""
+    for line in lines:
+        if line.startswith("LUT_PROG"):
+            _, mask, code = parse_asm_line(line)
+            state = apply_program(state, mask, code)
+    return state
+
+
+def _load_state(state, target, reason="Match cluster 0"):
+    """LUT_PROG lines bringing a cluster from state to target"""
+    masks = {}
+    for core, code in enumerate(target):
+        if code is not None and state[core] != code:
+            masks[code] = masks.get(code, 0) | 1 << core
+    return [format_lut_prog(mask, code, f"{reason}: {lut_purposes[code]}") for code, mask in masks.items()]
+
+
+def _is_row_access(line):
+    return line.startswith(("ACTIVATE", "LOAD", "STORE"))
+
+
+def _rows_used(lines):
+    """Rows below the highest row any ACTIVATE, LOAD or STORE addresses"""
+    return max((parse_asm_line(line)[1] + 1 for line in lines if _is_row_access(line)), default=0)
+
+
+def _relocate(line, base):
+    """A row access moved base rows up, into a cluster's copy of the data; other lines unchanged"""
+    if not base or not _is_row_access(line):
+        return line
+    _, row, bank = parse_asm_line(line)
+    code, _, comment = line.partition(";")
+    text = f"{code.split()[0]} {format_row(row + base, bank)}"
+    return f"{text}  ;{comment}" if comment else text
+
+
+def _accumulator(lines, kernel):
+    """(row, bank) of the last store in a kernel, where its partial sums live"""
+    for line in reversed(lines[kernel.start:kernel.end]):
+        if line.startswith("STORE"):
+            return parse_asm_line(line)[1:]
+    return 0, 0
+
+
+def _reduction(lines, kernel, part, clusters, state, placement, bases):
+    """Tree reduction of the partial sums after an inner-loop split, for one cluster
+
+    Round r adds cluster part + 2**r's partial, read from the partner's
+    copy of the accumulator row, into cluster part's when part is a
+    multiple of 2**(r + 1). Every cluster takes part in the SYNC of each
+    round. Cores the addition reprograms are restored afterwards.
+    """
+    row, bank = _accumulator(lines, kernel)
+    program = decompose(Opcode.ADD, DEFAULT_WIDTH, placement=placement)
+    out = []
+    stride = 1
+    while stride < clusters:
+        out.append(f"SYNC  ; Reduction round {stride.bit_length()}")
+        partner = part + stride
+        if part % (2 * stride) == 0 and partner < clusters:
+            tracker = LutTracker()
+            tracker.state = state
+            out.extend(filter(None, (tracker.program(*requirement) for requirement in program.requirements())))
+            out.append(f"LOAD {format_row(row + bases[partner], bank)}  ; Partial sum from cluster {partner}")
+            out.extend(program.asm_lines())
+            out.append(f"STORE {format_row(row + bases[part], bank)}  ; Combined partial sum")
+            out.extend(_load_state(tracker.state, state, "Restore"))
+        stride *= 2
+    return out
+
+
+def _kernel_stream(lines, start, kernel, split, part, clusters, base):
+    """One cluster's lines from start to the end of a kernel, its split loop sliced and its rows moved up by base"""
+    return [_slice(lines[index], part, clusters) if index == split.start else _relocate(lines[index], base)
+            for index in range(start, kernel.end + 1)]
+
+
+def _estimate(lines, split, shares, reductions):
+    """Cycles for the split loop run on one cluster, and across clusters
+
+    One iteration is costed as the loop body, nested loops at their counts
+    (see pim_simulator.simulate()).
+    """
+    iteration = simulate(lines[split.start + 1:split.end])["cycles"]
+    serial = iteration * sum(shares)
+    parallel = max(iteration * share + simulate(reduction)["cycles"] for share, reduction in zip(shares, reductions))
+    return serial, parallel
+
+
+def _runtime_count(lines, kernel):
+    """Whether any loop of a kernel nest has a runtime count"""
+    return any(line.startswith("REPEAT") and not isinstance(_count(line), int)
+               for line in lines[kernel.start:kernel.end])
+
+
+def _choose_split(lines, kernel, clusters, split):
+    if split == "outer":
+        return kernel
+    inner = _innermost_mac(lines, kernel)
+    if split == "inner" or kernel.count < clusters:
+        return inner
+    return kernel
+
+
+def partition_streams(lines, clusters, split="auto", placement=None):
+    """Per-cluster asm streams and a load-balance report for emitted assembly
+
+    Every top-level REPEAT nest containing a multiply is a kernel. Kernels
+    are split across clusters: by slicing the iterations of the outermost
+    loop (rows of the result, no reduction needed), or with split="inner"
+    by slicing the innermost multiplying loop, whose partial sums are then
+    combined after the kernel, outside every REPEAT, by a SYNC-separated
+    tree reduction. "auto" splits the outer loop unless its count leaves
+    clusters idle. Each cluster works on its own copy of the data: its
+    slice of the arrays, distributed ahead of the run, sits at its
+    row_bases entry above the rows the program uses, and its kernel rows
+    are moved up by that much. A kernel is not split when the copies do
+    not fit in the rows. A runtime trip count is
+    loaded in cluster 0's code where the other clusters cannot read it, so
+    a kernel with any loop of runtime count is not split either: it stays
+    serial on cluster 0 and is listed in serial_kernels with the reason. Code between kernels
+    runs on cluster 0; all clusters SYNC on entering and leaving a kernel,
+    and the others first program their LUTs to match cluster 0.
+    placement (see precision.plan_core_placement()) is used for the
+    reduction additions. The report gives each kernel's iteration shares
+    and their balance (mean share over largest), and estimates the split
+    loop's cycles on one cluster and across all of them.
+    """
+    if split not in SPLITS:
+        raise ValueError(f"unknown split {split!r}; expected one of {', '.join(SPLITS)}")
+    if clusters < 1:
+        raise ValueError("need at least one cluster")
+    streams = [[] for _ in range(clusters)]
+    states = [UNKNOWN_STATE] * clusters
+    kernels, serial_kernels = [], []
+    rows = _rows_used(lines)
+    bases = [part * rows for part in range(clusters)]
+    position = 0
+    for kernel in _repeat_tree(lines):
+        if not _has_mac(lines, kernel):
+            continue
+        reason = None
+        if _runtime_count(lines, kernel):
+            reason = "runtime trip count"
+        elif clusters * rows > NUM_ROWS:
+            reason = f"{clusters} copies of {rows} rows exceed {NUM_ROWS} rows"
+        if reason is not None:
+            serial_kernels.append({"line": kernel.start + 1, "loop": lines[kernel.start].partition(";")[2].strip(),
+                                   "count": kernel.count, "reason": reason})
+            continue
+        # Activations hoisted ahead of the kernel open rows for every cluster
+        start = kernel.start
+        while start > position and lines[start - 1].startswith("ACTIVATE"):
+            start -= 1
+        serial = lines[position:start]
+        streams[0].extend(serial)
+        states[0] = _lut_state(serial, states[0])
+        chosen = _choose_split(lines, kernel, clusters, split)
+        entry = states[0]
+        if chosen is kernel:
+            reductions = [[] for _ in range(clusters)]
+        else:
+            after = _lut_state(lines[kernel.start:kernel.end + 1], entry)
+            reductions = [_reduction(lines, kernel, part, clusters, after, placement, bases)
+                          for part in range(clusters)]
+        for part, stream in enumerate(streams):
+            stream.append(f"SYNC  ; Enter kernel at line {kernel.start + 1}")
+            stream.extend(_load_state(states[part], entry))
+            body = _kernel_stream(lines, start, kernel, chosen, part, clusters, bases[part]) + reductions[part]
+            stream.extend(body)
+            stream.append(f"SYNC  ; Leave kernel at line {kernel.start + 1}")
+            states[part] = _lut_state(body, entry)
+        shares = _shares(chosen.count, clusters)
+        serial, parallel = _estimate(lines, chosen, shares, reductions)
+        kernels.append({
+            "line": kernel.start + 1,
+            "loop": lines[chosen.start].partition(";")[2].strip(),
+            "split": "outer" if chosen is kernel else "inner",
+            "count": chosen.count,
+            "iterations": shares,
+            "balance": round(sum(shares) / (clusters * max(shares)), 4) if max(shares) else 0.0,
+            "reduction_rounds": 0 if chosen is kernel else (clusters - 1).bit_length(),
+            "row_bases": bases,
+            "serial_cycles": serial,
+            "parallel_cycles": parallel,
+            "speedup": round(serial / parallel, 2) if parallel else 1.0,
+        })
+        position = kernel.end + 1
+    streams[0].extend(lines[position:])
+    report = {
+        "clusters": clusters,
+        "kernels": kernels,
+        "serial_kernels": serial_kernels,
+        "stream_lengths": [len(stream) for stream in streams],
+    }
+    return streams, report
+
+
+def write_partition(lines, out_dir, clusters, split="auto", placement=None):
+    """Write cluster_<n>.asm/.bin and partition.json for asm lines; returns the report
+
+    The report also holds the SYNC-aware simulation of all streams.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    streams, report = partition_streams(lines, clusters, split, placement)
+    for part, stream in enumerate(streams):
+        asm_path = out_dir / f"cluster_{part}.asm"
+        asm_path.write_text("\n".join(stream))
+        encode_file(asm_path, out_dir / f"cluster_{part}.bin")
+    simulation = simulate(streams, PimConfig(banks=clusters))
+    report["simulation"] = {
+        "cycles": simulation["cycles"],
+        "cycles_lower_bound": simulation["cycles_lower_bound"],
+        "sync_points": simulation["sync_points"],
+        "stall_cycles": [stats["stall_cycles"] for stats in simulation["clusters"]],
+        "utilization": [stats["utilization"] for stats in simulation["clusters"]],
+    }
+    (out_dir / "partition.json").write_text(json.dumps(report, indent=2))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partition pPIM assembly across clusters")
+    parser.add_argument("asm_file")
+    parser.add_argument("--clusters", type=int, default=4)
+    parser.add_argument("--split", choices=SPLITS, default="auto")
+    parser.add_argument("-o", "--output-dir", default="clusters", help="directory for the per-cluster streams")
+    args = parser.parse_args(argv)
+
+    with open(args.asm_file) as f:
+        lines = f.read().splitlines()
+    report = write_partition(lines, args.output_dir, args.clusters, args.split)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Packed 24-bit binary form of pPIM assembly.
+
+Usage:
+    python pim_binary.py encode outputs/output.asm outputs/output.bin
+    python pim_binary.py disasm outputs/output.bin
+"""
+import mmap
+import struct
+import sys
+
+import numpy as np
+
+from pim_isa import (ACTIVATE, COMPARE, CONTROL_OPCODES, ISA_MNEMONICS, LOAD, LUT_PROG_OPCODES,
+                     MAC_ADD, MAC_MULT, MEMORY_OPCODES, NO_OPERAND, REPEAT, STORE, format_row, parse_asm_line)
+
+# Instruction word, little-endian, 3 bytes per instruction:
+#   23-19 mnemonic   18-17 opcode class   16-11 core pointer
+#   10 read bit      9 write bit          8-0 row address / immediate
+# The 2-bit opcode class is the README's PROG/EXE/MEM/END field; the 5-bit
+# mnemonic in the otherwise unused top bits tells apart the 14 instructions
+# sharing those four classes. Bits 8-0 are one bit per core of the cluster
+# for LUT programming and compute; the core pointer then holds the LUT
+# function code >> 4. For ACTIVATE, LOAD and STORE the core pointer holds
+# the bank of the row; files from before banks have 0 there.
+WORD_BYTES = 3
+CLASS_PROG, CLASS_EXE, CLASS_MEM, CLASS_END = 0, 1, 2, 3
+CORE_BITS = 6
+FIELD_BITS = 9
+CODE_SHIFT = 4
+
+opcode_classes = np.zeros(len(ISA_MNEMONICS), dtype=np.uint32)
+opcode_classes[list(LUT_PROG_OPCODES)] = CLASS_PROG
+opcode_classes[[MAC_MULT, MAC_ADD, COMPARE]] = CLASS_EXE
+opcode_classes[[ACTIVATE, *MEMORY_OPCODES]] = CLASS_MEM
+opcode_classes[list(CONTROL_OPCODES)] = CLASS_END
+
+# File layout: header, packed words, padding to 4 bytes, one int32 triple
+# of symbol ids per control instruction (-1 if absent), then the symbol
+# names separated by newlines. Branch labels and repeat counts have no
+# room in a word. Version 2 added REPEAT/END_REPEAT and version 3 SYNC;
+# older files still load.
+MAGIC = b"PPIM"
+VERSION = 3
+HEADER = struct.Struct("<4sHHII")
+
+# Lines packed per NumPy batch when encoding a file
+ENCODE_BATCH = 1 << 20
+
+
+def _select(opcodes, table):
+    return np.isin(opcodes, table)
+
+
+def pack_words(opcodes, arg0, arg1):
+    """uint8 array of packed words for parsed (opcode, arg0, arg1) columns"""
+    opcodes = np.asarray(opcodes, dtype=np.uint32)
+    arg0 = np.asarray(arg0, dtype=np.int64)
+    arg1 = np.asarray(arg1, dtype=np.int64)
+    is_lut_prog = _select(opcodes, LUT_PROG_OPCODES)
+    is_row = _select(opcodes, (ACTIVATE, *MEMORY_OPCODES))
+    is_compute = _select(opcodes, (MAC_MULT, MAC_ADD, COMPARE))
+
+    code = np.where(is_lut_prog, arg1, 0)
+    bank = np.where(is_row, np.maximum(arg1, 0), 0)
+    core = code >> CODE_SHIFT | bank
+    # A bare COMPARE (no core mask) encodes as mask 0
+    field = np.where(is_row | is_lut_prog, arg0, np.where(is_compute, np.maximum(arg0, 0), 0))
+    if (code < 0).any() or (code & (1 << CODE_SHIFT) - 1).any() or (code >> CODE_SHIFT >> CORE_BITS).any():
+        raise ValueError(f"LUT function code does not fit the {CORE_BITS}-bit core pointer")
+    if (bank >> CORE_BITS).any():
+        raise ValueError(f"bank does not fit the {CORE_BITS}-bit core pointer")
+    if (field < 0).any() or (field >> FIELD_BITS).any():
+        raise ValueError(f"row address or core mask does not fit {FIELD_BITS} bits")
+
+    words = (opcodes << 19 | opcode_classes[opcodes] << 17 | core.astype(np.uint32) << 11
+             | (opcodes == LOAD).astype(np.uint32) << 10 | (opcodes == STORE).astype(np.uint32) << 9
+             | field.astype(np.uint32))
+    return words.astype("<u4").view(np.uint8).reshape(-1, 4)[:, :WORD_BYTES].reshape(-1)
+
+
+def unpack_words(buffer):
+    """(opcodes, arg0, arg1) arrays, as pim_simulator.program_arrays() builds, from packed words"""
+    raw = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, WORD_BYTES).astype(np.uint32)
+    words = raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16
+    opcodes = words >> 19
+    if (opcodes >= len(ISA_MNEMONICS)).any():
+        raise ValueError("unknown pPIM opcode in binary")
+    core = (words >> 11 & (1 << CORE_BITS) - 1).astype(np.int32)
+    field = (words & (1 << FIELD_BITS) - 1).astype(np.int32)
+    is_lut_prog = _select(opcodes, LUT_PROG_OPCODES)
+    is_row = _select(opcodes, (ACTIVATE, *MEMORY_OPCODES))
+    has_field = is_row | _select(opcodes, (MAC_MULT, MAC_ADD)) | (opcodes == COMPARE) & (field > 0)
+    arg0 = np.where(is_lut_prog | has_field, field, NO_OPERAND).astype(np.int32)
+    arg1 = np.where(is_lut_prog, core << CODE_SHIFT, np.where(is_row & (core > 0), core, NO_OPERAND)).astype(np.int32)
+    return opcodes.astype(np.uint8), arg0, arg1
+
+
+class _Encoder:
+    """Accumulates parsed columns and branch symbols across batches"""
+
+    def __init__(self):
+        self.symbols = {}
+        self.relocations = []
+        self.count = 0
+
+    def _symbol(self, name):
+        return self.symbols.setdefault(name, len(self.symbols))
+
+    def batch(self, lines):
+        """Packed words for a batch of asm lines"""
+        parsed = []
+        for line in lines:
+            instr = parse_asm_line(line)
+            if instr is None:
+                continue
+            if instr[0] in CONTROL_OPCODES:
+                operands = line.split(";", 1)[0].split(None, 1)[1:]
+                labels = operands[0].split(",") if operands else []
+                ids = [self._symbol(label.strip()) for label in labels]
+                self.relocations.append(ids + [-1] * (3 - len(ids)))
+            parsed.append(instr)
+        self.count += len(parsed)
+        if not parsed:
+            return np.zeros(0, dtype=np.uint8)
+        table = np.asarray(parsed, dtype=np.int64)
+        return pack_words(table[:, 0], table[:, 1], table[:, 2])
+
+    def tail(self):
+        """Relocation and symbol sections following the words"""
+        padding = b"\0" * (-self.count * WORD_BYTES % 4)
+        relocations = np.asarray(self.relocations, dtype="<i4").reshape(-1, 3)
+        return padding + relocations.tobytes() + "\n".join(self.symbols).encode()
+
+    def header(self):
+        return HEADER.pack(MAGIC, VERSION, WORD_BYTES, self.count, len(self.relocations))
+
+
+def encode(lines):
+    """Binary image for an iterable of asm lines"""
+    encoder = _Encoder()
+    words = encoder.batch(lines)
+    return encoder.header() + words.tobytes() + encoder.tail()
+
+
+def encode_file(asm_path, bin_path):
+    """Encode an asm file in batches without holding all of it in memory; returns the instruction count"""
+    encoder = _Encoder()
+    with open(asm_path) as src, open(bin_path, "wb") as dst:
+        dst.write(encoder.header())
+        batch = []
+        for line in src:
+            batch.append(line)
+            if len(batch) == ENCODE_BATCH:
+                dst.write(encoder.batch(batch).tobytes())
+                batch = []
+        dst.write(encoder.batch(batch).tobytes())
+        dst.write(encoder.tail())
+        dst.seek(0)
+        dst.write(encoder.header())
+    return encoder.count
+
+
+class PimBinary:
+    """Read-only view of an encoded program; words are NumPy views over the buffer
+
+    Pass a path to mmap the file, or the bytes returned by encode().
+    """
+
+    def __init__(self, source):
+        self._mmap = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            buffer = source
+        else:
+            with open(source, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            buffer = self._mmap
+        magic, version, word_bytes, count, controls = HEADER.unpack_from(buffer)
+        if magic != MAGIC or not 1 <= version <= VERSION or word_bytes != WORD_BYTES:
+            raise ValueError("not a pPIM binary or unsupported version")
+        self.count = count
+        offset = HEADER.size
+        self.words = np.frombuffer(buffer, dtype=np.uint8, count=count * WORD_BYTES, offset=offset)
+        offset += count * WORD_BYTES
+        offset += -offset % 4
+        self.relocations = np.frombuffer(buffer, dtype="<i4", count=controls * 3, offset=offset).reshape(-1, 3)
+        offset += controls * 3 * 4
+        symbols = bytes(buffer[offset:]).decode()
+        self.symbols = symbols.split("\n") if symbols else []
+
+    def __len__(self):
+        return self.count
+
+    def program(self):
+        """(opcodes, arg0, arg1) arrays for pim_simulator
+
+        A REPEAT's constant count, kept with its labels, is its arg0 as when
+        parsed from asm; a runtime count is NO_OPERAND.
+        """
+        opcodes, arg0, arg1 = unpack_words(self.words)
+        controls = np.flatnonzero(_select(opcodes, CONTROL_OPCODES))
+        for index, symbol in zip(controls.tolist(), self.relocations[:, 0].tolist()):
+            if opcodes[index] == REPEAT and symbol >= 0 and self.symbols[symbol].isdigit():
+                arg0[index] = int(self.symbols[symbol])
+        return opcodes, arg0, arg1
+
+    def close(self):
+        # NumPy views keep the mmap exported; drop them before closing
+        self.words = self.relocations = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def disassemble(binary):
+    """Asm lines, without comments, for a PimBinary or encoded bytes
+
+    Words keep no radix, so core masks and LUT codes come back in hex and
+    rows in decimal whatever the source used.
+    """
+    if not isinstance(binary, PimBinary):
+        binary = PimBinary(binary)
+    opcodes, arg0, arg1 = binary.program()
+    controls = iter(binary.relocations.tolist())
+    lines = []
+    for opcode, a0, a1 in zip(opcodes.tolist(), arg0.tolist(), arg1.tolist()):
+        mnemonic = ISA_MNEMONICS[opcode]
+        if opcode in LUT_PROG_OPCODES:
+            lines.append(f"{mnemonic} 0x{a0:X}, 0x{a1:X}")
+        elif opcode in CONTROL_OPCODES:
+            labels = [binary.symbols[index] for index in next(controls) if index >= 0]
+            lines.append(" ".join([mnemonic, ", ".join(labels)]) if labels else mnemonic)
+        elif a0 == NO_OPERAND:
+            lines.append(mnemonic)
+        elif opcode in (MAC_MULT, MAC_ADD, COMPARE):
+            lines.append(f"{mnemonic} 0x{a0:X}")
+        else:
+            lines.append(f"{mnemonic} {format_row(a0, a1)}")
+    return lines
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 3 and argv[0] == "encode":
+        count = encode_file(argv[1], argv[2])
+        print(f"Encoded {count} instructions into {argv[2]}")
+        return 0
+    if len(argv) == 2 and argv[0] == "disasm":
+        with PimBinary(argv[1]) as binary:
+            print("\n".join(disassemble(binary)))
+        return 0
+    print(__doc__.strip(), file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
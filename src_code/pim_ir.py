@@ -0,0 +1,130 @@
+from enum import IntEnum
+from functools import lru_cache
+
+
+class CompileError(Exception):
+    """Raised when a pipeline stage fails"""
+
+    def __init__(self, stage, message):
+        super().__init__(f"{stage} failed: {message}")
+        self.stage = stage
+
+
+class Opcode(IntEnum):
+    """TAC opcodes understood by the ISA lowering"""
+    ADD = 0
+    SUB = 1
+    MUL = 2
+    DIV = 3
+    SDIV = 4
+    AND = 5
+    OR = 6
+    XOR = 7
+    ICMP = 8
+    LOAD = 9
+    STORE = 10
+    BRANCH = 11
+    REPEAT = 12
+    END_REPEAT = 13
+
+
+# LLVM opcode spelling -> Opcode
+OPCODES_BY_NAME = {op.name.lower(): op for op in Opcode}
+
+# Opcodes that end a basic block
+CONTROL_OPCODES = frozenset({Opcode.BRANCH, Opcode.REPEAT, Opcode.END_REPEAT})
+
+BINARY_OPCODES = frozenset({
+    Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV,
+    Opcode.SDIV, Opcode.AND, Opcode.OR, Opcode.XOR,
+})
+
+
+@lru_cache(maxsize=None)
+def type_width(type_name):
+    """Bit width of an LLVM first-class type name (i32 -> 32, ptr -> 64, other -> 0)"""
+    if type_name.startswith("i") and type_name[1:].isdigit():
+        return int(type_name[1:])
+    if type_name == "ptr" or type_name.endswith("*"):
+        return 64
+    return 0
+
+
+class TacInstr:
+    """One three-address instruction passed between pipeline stages
+
+    operands holds value names without the leading '%'. Loads hold their
+    address as (addr,) and stores as (src, addr) when the pointer operand is
+    a named value; globals keep their '@'. For branches it is
+    (cond, true_label, false_label) or (target_label,), where cond is the
+    verbatim IR operand (e.g. '%21' or 'true'). A hardware loop is a
+    REPEAT (count, header_label) ending its preheader, with count a
+    constant or a value name such as '%20', and an END_REPEAT
+    (header_label, exit_label) ending its latch. cond holds the icmp
+    predicate, meta any trailing branch metadata such as '!llvm.loop !6'.
+    operand_bits, set by value_range.narrow_operations() on a MUL, ADD or
+    ICMP, is the unsigned bits (a, b) its operands are known to fit in.
+    """
+    __slots__ = ("opcode", "dest", "operands", "width", "block", "cond", "meta", "operand_bits")
+
+    def __init__(self, opcode, dest=None, operands=(), width=0, block=0, cond=None, meta=None, operand_bits=None):
+        self.opcode = opcode
+        self.dest = dest
+        self.operands = operands
+        self.width = width
+        self.block = block
+        self.cond = cond
+        self.meta = meta
+        self.operand_bits = operand_bits
+
+    def __repr__(self):
+        return f"TacInstr({self.to_tac()!r}, width={self.width}, block={self.block})"
+
+    def __eq__(self, other):
+        if not isinstance(other, TacInstr):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def branch_targets(self):
+        """Labels control may continue at after this instruction, or None if it does not end a block"""
+        if self.opcode == Opcode.BRANCH:
+            if len(self.operands) == 3:
+                return self.operands[1:]
+            return self.operands or None
+        if self.opcode == Opcode.REPEAT:
+            return self.operands[1:]
+        if self.opcode == Opcode.END_REPEAT:
+            return self.operands
+        return None
+
+    def to_tac(self):
+        """Render the instruction as text TAC for display and download"""
+        op = self.opcode
+        if op in BINARY_OPCODES:
+            return f"{self.dest} = {op.name.lower()} {self.operands[0]}, {self.operands[1]}"
+        if op == Opcode.ICMP:
+            return f"{self.dest} = icmp {self.cond} {self.operands[0]}, {self.operands[1]}"
+        if op == Opcode.LOAD:
+            return f"{self.dest} = LOAD"
+        if op == Opcode.STORE:
+            return f"STORE {self.operands[0]}"
+        if op == Opcode.REPEAT:
+            return f"REPEAT {self.operands[0]}, label %{self.operands[1]}"
+        if op == Opcode.END_REPEAT:
+            return f"END_REPEAT label %{self.operands[0]}, label %{self.operands[1]}"
+        # Branches that could not be decomposed keep their IR text in meta
+        if not self.operands:
+            return f"BRANCH {self.meta}"
+        if len(self.operands) == 3:
+            cond, true_label, false_label = self.operands
+            text = f"br i1 {cond}, label %{true_label}, label %{false_label}"
+        else:
+            text = f"br label %{self.operands[0]}"
+        if self.meta:
+            text += f", {self.meta}"
+        return f"BRANCH {text}"
+
+
+def format_tac(instructions):
+    """Text TAC lines for a sequence of TacInstr records"""
+    return [instr.to_tac() for instr in instructions]
@@ -0,0 +1,58 @@
+# Every mnemonic the ISA lowering emits, in opcode-id order
+ISA_MNEMONICS = (
+    "ACTIVATE", "LOAD", "STORE",
+    "LUT_PROG_MULT", "LUT_PROG_ADD", "LUT_PROG_CMP",
+    "MAC_MULT", "MAC_ADD", "COMPARE",
+    "BRANCH", "JUMP",
+    "REPEAT", "END_REPEAT", "SYNC",
+)
+ISA_OPCODES = {mnemonic: opcode for opcode, mnemonic in enumerate(ISA_MNEMONICS)}
+
+ACTIVATE, LOAD, STORE = 0, 1, 2
+LUT_PROG_MULT, LUT_PROG_ADD, LUT_PROG_CMP = 3, 4, 5
+MAC_MULT, MAC_ADD, COMPARE = 6, 7, 8
+BRANCH, JUMP = 9, 10
+REPEAT, END_REPEAT, SYNC = 11, 12, 13
+
+MEMORY_OPCODES = (LOAD, STORE)
+LUT_PROG_OPCODES = (LUT_PROG_MULT, LUT_PROG_ADD, LUT_PROG_CMP)
+COMPUTE_OPCODES = (MAC_MULT, MAC_ADD, COMPARE)
+CONTROL_OPCODES = (BRANCH, JUMP, REPEAT, END_REPEAT, SYNC)
+
+# Placeholder for operands that are labels or absent
+NO_OPERAND = -1
+
+
+def _numeric(token):
+    try:
+        return int(token.rstrip(","), 0)
+    except ValueError:
+        return NO_OPERAND
+
+
+def parse_asm_line(line):
+    """(opcode, arg0, arg1) for one asm line, or None for blank/comment-only lines
+
+    Numeric operands (rows, core masks, LUT codes, MAC phases) are decoded;
+    label operands become NO_OPERAND. ACTIVATE, LOAD and STORE take a row
+    and, as arg1, its bank; without one the row is in bank 0.
+    """
+    tokens = line.split(";", 1)[0].split()
+    if not tokens:
+        return None
+    opcode = ISA_OPCODES.get(tokens[0])
+    if opcode is None:
+        raise ValueError(f"unknown pPIM mnemonic: {tokens[0]}")
+    args = [_numeric(token) for token in tokens[1:3]]
+    args += [NO_OPERAND] * (2 - len(args))
+    return opcode, args[0], args[1]
+
+
+def format_row(row, bank=0):
+    """Row operand text for ACTIVATE, LOAD and STORE, naming the bank unless it is bank 0"""
+    return f"{row}, {bank}" if bank > 0 else str(row)
+
+
+def parse_asm(lines):
+    """Parsed (opcode, arg0, arg1) tuples for an iterable of asm lines"""
+    return [parsed for parsed in map(parse_asm_line, lines) if parsed is not None]
@@ -0,0 +1,876 @@
+import mmap
+import os
+import re
+import shutil
+import subprocess
+import hashlib
+import json
+from collections import Counter
+from functools import lru_cache, partial
+from itertools import chain
+from pathlib import Path
+
+try:
+    import llvmlite.binding as llvm
+except ImportError:
+    llvm = None
+
+from block_graph import BlockGraph
+from compile_cache import CLANG_FLAGS, OPT_FLAGS, compute_cache_key
+from hw_loops import lower_hardware_loops
+from instrumentation import StackSampler, StageRecorder
+from ir_profile import profile_ir
+from lut_state import LutTracker, describe_cores, lut_purposes, plan_lut_programming
+from memory_layout import DEFAULT_BANKS, MemoryGeometry, format_memory_map, plan_memory_layout
+from pim_binary import encode_file
+from pim_ir import OPCODES_BY_NAME, CompileError, Opcode, TacInstr, format_tac, type_width
+from precision import lut_requirements, micro_program, plan_core_placement
+from partition import write_partition
+from row_allocator import RowAllocation, RowTracker, allocate_rows, plan_open_rows, schedule_row_accesses
+from value_range import narrow_operations
+
+
+# Define Look-Ahead Table (LUT) for operations
+lut_definitions = {
+    "OP_A": {
+        "description": "Multiplication Operation",
+        "entries": [
+            {"input_pattern": "0000", "output_value": "0000", "description": "0 × 0 = 0"},
+            {"input_pattern": "0001", "output_value": "0000", "description": "0 × 1 = 0"},
+            {"input_pattern": "0010", "output_value": "0000", "description": "0 × 2 = 0"},
+            {"input_pattern": "0011", "output_value": "0000", "description": "0 × 3 = 0"},
+            {"input_pattern": "0100", "output_value": "0000", "description": "1 × 0 = 0"},
+            {"input_pattern": "0101", "output_value": "0001", "description": "1 × 1 = 1"},
+            {"input_pattern": "0110", "output_value": "0010", "description": "1 × 2 = 2"},
+            {"input_pattern": "0111", "output_value": "0011", "description": "1 × 3 = 3"},
+            {"input_pattern": "1000", "output_value": "0000", "description": "2 × 0 = 0"},
+            {"input_pattern": "1001", "output_value": "0010", "description": "2 × 1 = 2"},
+            {"input_pattern": "1010", "output_value": "0100", "description": "2 × 2 = 4"},
+            {"input_pattern": "1011", "output_value": "0110", "description": "2 × 3 = 6"},
+            {"input_pattern": "1100", "output_value": "0000", "description": "3 × 0 = 0"},
+            {"input_pattern": "1101", "output_value": "0011", "description": "3 × 1 = 3"},
+            {"input_pattern": "1110", "output_value": "0110", "description": "3 × 2 = 6"},
+            {"input_pattern": "1111", "output_value": "1001", "description": "3 × 3 = 9"}
+        ]
+    },
+    "OP_B": {
+        "description": "Addition Operation",
+        "entries": [
+            {"input_pattern": "0000", "output_value": "0000", "description": "0 + 0 = 0"},
+            {"input_pattern": "0001", "output_value": "0001", "description": "0 + 1 = 1"},
+            {"input_pattern": "0010", "output_value": "0010", "description": "0 + 2 = 2"},
+            {"input_pattern": "0011", "output_value": "0011", "description": "0 + 3 = 3"},
+            {"input_pattern": "0100", "output_value": "0001", "description": "1 + 0 = 1"},
+            {"input_pattern": "0101", "output_value": "0010", "description": "1 + 1 = 2"},
+            {"input_pattern": "0110", "output_value": "0011", "description": "1 + 2 = 3"},
+            {"input_pattern": "0111", "output_value": "0100", "description": "1 + 3 = 4"},
+            {"input_pattern": "1000", "output_value": "0010", "description": "2 + 0 = 2"},
+            {"input_pattern": "1001", "output_value": "0011", "description": "2 + 1 = 3"},
+            {"input_pattern": "1010", "output_value": "0100", "description": "2 + 2 = 4"},
+            {"input_pattern": "1011", "output_value": "0101", "description": "2 + 3 = 5"},
+            {"input_pattern": "1100", "output_value": "0011", "description": "3 + 0 = 3"},
+            {"input_pattern": "1101", "output_value": "0100", "description": "3 + 1 = 4"},
+            {"input_pattern": "1110", "output_value": "0101", "description": "3 + 2 = 5"},
+            {"input_pattern": "1111", "output_value": "0110", "description": "3 + 3 = 6"}
+        ]
+    }
+}
+lookup_table = {
+    "add": "ADD",
+    "sub": "SUB",
+    "mul": "MUL",
+    "load": "LD",
+    "store": "ST",
+    "icmp": "CMP",
+    "br": "BR",
+    "getelementptr": "GBP",
+    "sext": "SEXT",
+    "trunc": "TRUNC",
+    "phi": "PHI"
+}
+
+def generate_lut_file(profile):
+    """Operation frequencies, loop nests and LUT core placement from a profile_ir() profile
+
+    Frequencies are dynamic: each operation is weighted by the estimated
+    trip counts of the loops around it.
+    """
+    counts = profile["dynamic_counts"]
+    placement = plan_core_placement(profile["lut_demand"]) or ()
+    cores = {}
+    for core, code in enumerate(placement):
+        cores.setdefault(lut_purposes[code], []).append(core)
+    return {
+        "Operation Frequency": {op: counts[op] for op in lookup_table if counts.get(op)},
+        "Loop Nests": [f"{'  ' * (loop['depth'] - 1)}{loop['function']}: %{loop['header']} x{loop['trip_count']}"
+                       f"{'' if loop['trip_count_known'] else ' (estimated)'}" for loop in profile["loops"]],
+        "Core Placement": {purpose: describe_cores(sum(1 << core for core in owned))
+                           for purpose, owned in cores.items()},
+        "Lookup Table": {op: lookup_table[op] for op in lookup_table}
+    }
+
+
+def generate_llvm_ir(input_cpp_path, output_ll_path):
+    """Generate LLVM IR (.ll) from C++ code using Clang."""
+    try:
+        result = subprocess.run(["clang++", *CLANG_FLAGS, input_cpp_path, "-o", output_ll_path], 
+                              capture_output=True, text=True)
+    except OSError as e:
+        raise CompileError("LLVM IR generation", str(e)) from e
+    if result.returncode != 0:
+        raise CompileError("LLVM IR generation", result.stderr)
+    return True
+
+def optimize_llvm_ir(input_file, output_file):
+    """Optimize LLVM IR using opt tool"""
+    try:
+        result = subprocess.run(f"opt {' '.join(OPT_FLAGS)} {input_file} -o {output_file}", 
+                               shell=True, capture_output=True, text=True)
+    except OSError as e:
+        raise CompileError("LLVM IR optimization", str(e)) from e
+    if result.returncode != 0:
+        raise CompileError("LLVM IR optimization", result.stderr)
+    return True
+
+@lru_cache(maxsize=None)
+def _target_machine():
+    """Initialize llvmlite once and return the host target machine"""
+    if llvm is None:
+        raise CompileError("LLVM IR optimization", "in-process compilation needs llvmlite")
+    if not hasattr(llvm, "create_pass_builder"):
+        # llvmlite < 0.44 still needs explicit initialization
+        llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    return llvm.Target.from_default_triple().create_target_machine()
+
+
+def parse_llvm_module(ir_text):
+    """Parse and verify LLVM IR text into an llvmlite module"""
+    _target_machine()
+    try:
+        module = llvm.parse_assembly(ir_text)
+        module.verify()
+    except RuntimeError as e:
+        raise CompileError("LLVM IR parsing", str(e)) from e
+    return module
+
+
+def optimize_module(module, passes=None, opt_level=2):
+    """Optimize an llvmlite module in place, with -O<opt_level> or the given passes in order
+
+    Pass names are those of the installed llvmlite's add_<name>_pass
+    methods, e.g. ("sroa", "instruction_combine", "simplify_cfg").
+    """
+    machine = _target_machine()
+    if hasattr(llvm, "create_pass_builder"):
+        builder = llvm.create_pass_builder(machine, llvm.create_pipeline_tuning_options(speed_level=opt_level))
+        manager = builder.getModulePassManager() if passes is None else llvm.create_new_module_pass_manager()
+        run = lambda: manager.run(module, builder)
+    else:
+        manager = llvm.create_module_pass_manager()
+        if passes is None:
+            pass_builder = llvm.create_pass_manager_builder()
+            pass_builder.opt_level = opt_level
+            pass_builder.populate(manager)
+        run = lambda: manager.run(module)
+    for name in passes or ():
+        add_pass = getattr(manager, f"add_{name}_pass", None)
+        if add_pass is None:
+            raise CompileError("LLVM IR optimization", f"unknown pass: {name}")
+        add_pass()
+    run()
+    return module
+
+
+def iter_module_tac(module, block_labels=None):
+    """Stream TacInstr records from an llvmlite module, one function at a time
+
+    Functions are printed individually and go through the same line
+    dispatch as .ll files, so the TAC matches the file-based path.
+    """
+    functions = (function for function in module.functions if not function.is_declaration)
+    return _iter_tac_lines(chain.from_iterable(
+        str(function).encode().splitlines(keepends=True) for function in functions), block_labels)
+
+
+# TAC patterns; each line is matched against at most the one its opcode selects
+tac_patterns = {
+    'binary_op': re.compile(
+        rb"^\s*%(\w+)\s*=\s*(add|sub|mul|div|sdiv|and|or|xor)\s+(?:(?:nuw|nsw|exact|disjoint)\s+)*(\w+)\s+%(\w+),\s*%(\w+)"),
+    'compare': re.compile(rb"^\s*%(\w+)\s*=\s*icmp\s+(\w+)\s+(\w+)\s+%(\w+),\s*%(\w+)"),
+    'load': re.compile(rb"^\s*%(\w+)\s*=\s*load\s+(\w+),(?:\s*[^,%@]*([%@][\w.]+))?"),
+    'store': re.compile(rb"^\s*store\s+(\w+)\s+%(\w+),(?:\s*[^,%@]*([%@][\w.]+))?"),
+    'branch': re.compile(rb"^\s*br\s+(label|i1).*")
+}
+branch_operands = re.compile(
+    rb"br\s+(?:i1\s+([-%\w.$]+),\s*label\s+%([-\w.$]+),\s*label\s+%([-\w.$]+)|label\s+%([-\w.$]+))(?:,\s*(.*))?$")
+
+
+def _binary_tac(match, line, block):
+    dest, op, ty, op1, op2 = (group.decode() for group in match.groups())
+    return TacInstr(OPCODES_BY_NAME[op], dest, (op1, op2), type_width(ty), block)
+
+
+def _compare_tac(match, line, block):
+    dest, pred, ty, op1, op2 = (group.decode() for group in match.groups())
+    return TacInstr(Opcode.ICMP, dest, (op1, op2), type_width(ty), block, cond=pred)
+
+
+def _address(group):
+    """Pointer operand name; locals lose their '%', globals keep '@'"""
+    return (group.decode().lstrip("%"),) if group else ()
+
+
+def _load_tac(match, line, block):
+    dest, ty, addr = match.groups()
+    return TacInstr(Opcode.LOAD, dest.decode(), _address(addr), type_width(ty.decode()), block)
+
+
+def _store_tac(match, line, block):
+    ty, src, addr = match.groups()
+    return TacInstr(Opcode.STORE, None, (src.decode(),) + _address(addr), type_width(ty.decode()), block)
+
+
+def _branch_tac(match, line, block):
+    stripped = line.strip()
+    parts = branch_operands.match(stripped)
+    if parts is None:
+        return TacInstr(Opcode.BRANCH, block=block, meta=stripped.decode())
+    cond, true_label, false_label, target, meta = (
+        group.decode() if group is not None else None for group in parts.groups())
+    if target is not None:
+        return TacInstr(Opcode.BRANCH, None, (target,), 0, block, meta=meta)
+    return TacInstr(Opcode.BRANCH, None, (cond, true_label, false_label), 1, block, meta=meta)
+
+
+# Opcode -> (pattern, builder) so every line costs one dict lookup
+tac_dispatch = {
+    op: (tac_patterns['binary_op'], _binary_tac)
+    for op in (b"add", b"sub", b"mul", b"div", b"sdiv", b"and", b"or", b"xor")
+}
+tac_dispatch.update({
+    b"icmp": (tac_patterns['compare'], _compare_tac),
+    b"load": (tac_patterns['load'], _load_tac),
+    b"store": (tac_patterns['store'], _store_tac),
+    b"br": (tac_patterns['branch'], _branch_tac),
+})
+
+
+def _iter_tac_lines(lines, block_labels=None):
+    """TacInstr records for an iterable of IR text lines (bytes), dispatching on each line's opcode"""
+    block = -1
+    function = None
+    for line in lines:
+        # Block boundaries: function entries and unindented labels
+        if line[:1] not in b" \t\n;%@!$":
+            if line.startswith(b"define "):
+                function = line.partition(b"@")[2].partition(b"(")[0].strip(b'"').decode()
+                block += 1
+                if block_labels is not None:
+                    block_labels[block] = (function, "entry")
+            elif (label := line.split(None, 1)[0]).endswith(b":"):
+                block += 1
+                if block_labels is not None:
+                    block_labels[block] = (function, label[:-1].strip(b'"').decode())
+            continue
+        stripped = line.lstrip()
+        # Assignments carry the opcode after '=', everything else leads with it
+        if stripped[:1] == b"%":
+            stripped = stripped.partition(b"=")[2]
+        tokens = stripped.split(None, 1)
+        if not tokens:
+            continue
+        entry = tac_dispatch.get(tokens[0])
+        if entry is None:
+            continue
+        pattern, builder = entry
+        if match := pattern.match(line):
+            yield builder(match, line, max(block, 0))
+
+
+def iter_llvm_tac(input_ll_file, block_labels=None):
+    """Stream TacInstr records from a memory-mapped .ll file, dispatching on each line's opcode
+
+    Basic blocks are numbered in file order; if block_labels is a dict it
+    is filled with {block id: (function name, label)}.
+    """
+    try:
+        with open(input_ll_file, 'rb') as ll_file:
+            if os.fstat(ll_file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(ll_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield from _iter_tac_lines(iter(buffer.readline, b""), block_labels)
+    except (OSError, ValueError) as e:
+        raise CompileError("TAC extraction", str(e)) from e
+
+
+def parse_llvm_to_tac(input_ll_file, block_labels=None):
+    """Extract TacInstr records from LLVM IR; use format_tac() for text TAC"""
+    return list(iter_llvm_tac(input_ll_file, block_labels))
+
+def iter_tac_to_isa(tac_instructions, operations_used, lut_tracker=None, row_tracker=None, placement=None,
+                    skipped=None):
+    """Lazily lower TAC to PIM assembly, recording LUT operations in operations_used
+
+    LUT programming goes through lut_tracker, which skips cores that already
+    hold the required table, and row accesses through row_tracker, which
+    activates a row only when it is not already open. By default both only
+    trust their state within a block and rows are allocated on first use.
+    Micro-ops run on the cores placement assigns to their LUT function
+    (see precision.plan_core_placement()). Instructions with no lowering
+    are dropped and, if skipped is a Counter, counted in it by opcode.
+    """
+    lut_tracker = lut_tracker or LutTracker()
+    row_tracker = row_tracker or RowTracker(RowAllocation())
+    
+    # Instruction mnemonics
+    mnemonics = {
+        'mem': {
+            'load': 'LOAD',
+            'store': 'STORE'
+        }
+    }
+    
+    for instr in tac_instructions:
+        op = instr.opcode
+        if instr.block != lut_tracker.block:
+            yield from lut_tracker.enter_block(instr.block)
+            yield from row_tracker.enter_block(instr.block)
+
+        # Program LUTs, skipping cores that already hold the table
+        for mask, code, comment in lut_requirements(instr, placement):
+            if line := lut_tracker.program(mask, code, comment):
+                yield line
+
+        # MAC Operation
+        if op == Opcode.MUL:
+            operations_used.update(["OP_A", "OP_B"])
+            
+            # Partial products and their sums, sized to the operand width
+            yield from micro_program(instr, placement).asm_lines()
+            
+            row, activate = row_tracker.access(instr)
+            if activate:
+                yield activate
+            yield f"{mnemonics['mem']['store']} {row}  ; Store results"
+        
+        # Addition Operation
+        elif op == Opcode.ADD:
+            yield from micro_program(instr, placement).asm_lines()
+            operations_used.add("OP_B")
+        
+        # Load Operation
+        elif op == Opcode.LOAD:
+            row, activate = row_tracker.access(instr)
+            if activate:
+                yield activate
+            yield f"{mnemonics['mem']['load']} {row}  ; Load from row {row}"
+        
+        # Store Operation
+        elif op == Opcode.STORE:
+            row, activate = row_tracker.access(instr)
+            if activate:
+                yield activate
+            yield f"{mnemonics['mem']['store']} {row}  ; Store to row {row}"
+        
+        # Comparison Operation
+        elif op == Opcode.ICMP:
+            yield from micro_program(instr, placement).asm_lines()
+            operations_used.add("CMP")
+            
+        # Hardware loop around the following blocks
+        elif op == Opcode.REPEAT:
+            yield from lut_tracker.flush_hoisted()
+            yield from row_tracker.flush_hoisted()
+            count, header = instr.operands
+            yield f"REPEAT {count}  ; Loop %{header}"
+
+        elif op == Opcode.END_REPEAT:
+            yield from lut_tracker.flush_hoisted()
+            yield from row_tracker.flush_hoisted()
+            yield f"END_REPEAT  ; Back to %{instr.operands[0]}"
+
+        # Branch Operation
+        elif op == Opcode.BRANCH:
+            # Programming and activations hoisted out of a loop go before the preheader's branch
+            yield from lut_tracker.flush_hoisted()
+            yield from row_tracker.flush_hoisted()
+            if len(instr.operands) == 3:
+                cond, true_label, false_label = instr.operands
+                yield f"BRANCH {cond}, %{true_label}, %{false_label}"
+            elif instr.operands:
+                yield f"JUMP %{instr.operands[0]}"
+            elif skipped is not None:
+                # Unrecognized branch form
+                skipped["branch"] += 1
+
+        elif skipped is not None:
+            skipped[op.name.lower()] += 1
+
+    yield from lut_tracker.finish()
+    yield from row_tracker.finish()
+
+
+def _reserved_rows(layout):
+    """RowAllocation arguments keeping tensor pointers on the rows a memory layout plan gave them"""
+    if layout is None:
+        return {}
+    reserved = {(None if pointer.startswith("@") else function, pointer): tuple(address)
+                for function, rows in layout["pointer_rows"].items() for pointer, address in rows.items()}
+    return {"reserved": reserved, "first_row": layout["rows_reserved"]}
+
+
+def map_tac_to_isa(tac_instructions, block_labels=None, stats=None, hoist_luts=True, schedule_rows=True,
+                   placement=None, loops=None, layout=None, value_ranges=None):
+    """Generate complete PIM assembly instructions
+
+    Values are packed into DRAM rows by basic-block affinity and, with
+    schedule_rows, independent instructions are reordered so accesses to
+    the same row run together. Passing the block_labels filled in by
+    parse_llvm_to_tac() also carries LUT and open-row state across blocks
+    and enables LUT hoisting. placement fixes which cores hold each LUT
+    function. Jumps to the next block are dropped and, given the profile's
+    loops, counted loops become REPEAT blocks or are unrolled (see
+    hw_loops.lower_hardware_loops()). Given a memory layout plan (see
+    memory_layout.plan_memory_layout()), accesses through a tensor's
+    pointers use the tensor's first row in its bank, written 'LOAD row,
+    bank', and other values are packed into bank 0 past the tensors. Given the profile's
+    value_ranges, multiplies, additions and compares on small non-negative
+    operands run narrowed micro-programs (see
+    value_range.narrow_operations()). LUT programming, row hit/miss, loop
+    and narrowing counts, and counts of instructions with no lowering, are
+    written into stats if given.
+    """
+    operations_used = set()
+    loop_stats = {}
+    narrowed = 0
+    if block_labels and value_ranges:
+        tac_instructions, narrowed = narrow_operations(tac_instructions, block_labels, value_ranges)
+    if block_labels:
+        tac_instructions, loop_stats = lower_hardware_loops(tac_instructions, block_labels, loops)
+    allocation = allocate_rows(tac_instructions, block_labels=block_labels, **_reserved_rows(layout))
+    if schedule_rows:
+        tac_instructions = schedule_row_accesses(tac_instructions, allocation)
+    if block_labels:
+        graph = BlockGraph(tac_instructions, block_labels)
+        requirements = partial(lut_requirements, placement=placement)
+        lut_tracker = LutTracker(plan_lut_programming(graph, requirements, hoist_luts))
+        row_tracker = RowTracker(allocation, plan_open_rows(graph, allocation))
+    else:
+        lut_tracker = LutTracker()
+        row_tracker = RowTracker(allocation)
+    skipped = Counter()
+    asm_instructions = list(iter_tac_to_isa(tac_instructions, operations_used, lut_tracker, row_tracker, placement,
+                                            skipped))
+    if stats is not None:
+        _record_lowering_stats(stats, lut_tracker, row_tracker, skipped)
+        stats.update({f"loops_{key}": value for key, value in loop_stats.items()})
+        stats["narrowed_operations"] = narrowed
+    return asm_instructions, operations_used
+
+
+def _record_lowering_stats(stats, lut_tracker, row_tracker, skipped):
+    stats.update({f"lut_programs_{key}": value for key, value in lut_tracker.stats.items()})
+    stats.update({f"row_{key}": value for key, value in row_tracker.stats.items()})
+    stats["rows_used"] = row_tracker.allocation.rows_used
+    stats["rows_evicted"] = row_tracker.allocation.evicted
+    stats["instructions_skipped"] = sum(skipped.values())
+    stats.update({f"skipped_{name}": count for name, count in skipped.items()})
+
+
+def _write_lines(file, lines):
+    """Write lines joined by newlines without materializing them; returns the count"""
+    count = 0
+    for line in lines:
+        if count:
+            file.write("\n")
+        file.write(line)
+        count += 1
+    return count
+
+
+def _tac_source(ir, block_labels=None):
+    if llvm is not None and isinstance(ir, llvm.ModuleRef):
+        return iter_module_tac(ir, block_labels)
+    return iter_llvm_tac(ir, block_labels)
+
+
+def stream_llvm_to_isa(input_ll_file, output_tac_file, output_asm_file, stats=None, placement=None, layout=None):
+    """Stream IR (a .ll path or an llvmlite module) through TAC extraction and ISA lowering straight to disk"""
+    operations_used = set()
+    block_labels = {}
+    lut_tracker = LutTracker()
+    row_tracker = RowTracker(RowAllocation(block_labels=block_labels, **_reserved_rows(layout)))
+    skipped = Counter()
+    tac_count = 0
+
+    def tee_tac(tac_file):
+        nonlocal tac_count
+        for instr in _tac_source(input_ll_file, block_labels):
+            if tac_count:
+                tac_file.write("\n")
+            tac_file.write(instr.to_tac())
+            tac_count += 1
+            yield instr
+
+    with open(output_tac_file, "w") as tac_file, open(output_asm_file, "w") as asm_file:
+        isa_count = _write_lines(asm_file, iter_tac_to_isa(tee_tac(tac_file), operations_used, lut_tracker,
+                                                           row_tracker, placement, skipped))
+    if stats is not None:
+        _record_lowering_stats(stats, lut_tracker, row_tracker, skipped)
+    return tac_count, isa_count, operations_used
+
+
+# Modules whose code shapes the cached artifacts, this one included
+PIPELINE_MODULES = ("block_graph", "compile_cache", "hw_loops", "ir_profile", "lut_state", "memory_layout",
+                    "partition", "pim_binary", "pim_ir", "pim_isa", "pim_pipeline", "pim_simulator",
+                    "precision", "row_allocator", "value_range")
+
+
+def _pipeline_salt():
+    """Hash of the source of every pipeline module, so any lowering change invalidates cached results"""
+    digest = hashlib.sha256()
+    here = Path(__file__).resolve().parent
+    for module in PIPELINE_MODULES:
+        digest.update(module.encode())
+        digest.update((here / f"{module}.py").read_bytes())
+    return digest.hexdigest()
+
+
+PIPELINE_SALT = _pipeline_salt()
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def plan_layout(profile, banks=DEFAULT_BANKS):
+    """Memory layout plan of a profile for a memory of banks banks (see memory_layout.plan_memory_layout())"""
+    if banks < 1:
+        raise CompileError("Memory layout", f"need at least one bank, got {banks}")
+    return plan_memory_layout(profile, MemoryGeometry(banks=banks))
+
+
+def _partition(asm_path, work_dir, clusters, split, profile, recorder):
+    """Partition report for the compiled asm across clusters, or None for one cluster"""
+    if clusters <= 1:
+        return None
+    with recorder.stage("partition", f"Partitioning across {clusters} clusters...") as record:
+        with open(asm_path) as f:
+            lines = f.read().splitlines()
+        try:
+            report = write_partition(lines, Path(work_dir) / "clusters", clusters, split,
+                                     plan_core_placement(profile["lut_demand"]))
+        except ValueError as e:
+            raise CompileError("Partitioning", str(e)) from e
+        record.update(instructions_in=len(lines), instructions_out=sum(report["stream_lengths"]))
+    return report
+
+
+# Metadata and attribute group numbers, renumbered module-wide whenever any function changes
+function_id_pattern = re.compile(rb"([!#])\d+")
+
+
+def _function_texts(ir_bytes):
+    """{function name: IR text of its definition} for a module"""
+    texts = {}
+    name = None
+    for line in ir_bytes.splitlines(keepends=True):
+        if line.startswith(b"define "):
+            name = line.partition(b"@")[2].partition(b"(")[0].strip(b'"').decode()
+            texts[name] = []
+        if name is not None:
+            texts[name].append(line)
+            if line.startswith(b"}"):
+                name = None
+    return {name: b"".join(lines) for name, lines in texts.items()}
+
+
+def _function_layout(function, layout):
+    """The part of a memory layout plan a function's lowering reads: the rows of its tensor pointers"""
+    if layout is None:
+        return {"pointer_rows": {}, "rows_reserved": 0}
+    rows = layout["pointer_rows"].get(function)
+    return {"pointer_rows": {function: dict(sorted(rows.items()))} if rows else {},
+            "rows_reserved": layout["rows_reserved"]}
+
+
+def _merge_stats(total, part):
+    for key, value in part.items():
+        total[key] = max(total.get(key, 0), value) if key == "rows_used" else total.get(key, 0) + value
+
+
+def lower_functions(tac_instructions, block_labels, ir_bytes, profile, placement=None, layout=None, cache=None,
+                    stats=None):
+    """Lower TAC one function at a time, reusing cached asm for functions whose IR is unchanged
+
+    Each function goes through map_tac_to_isa() on its own, so its values
+    are packed from the first row past the planned tensors rather than
+    after the previous function's. The cache key of a function is its IR,
+    ignoring metadata and attribute group numbers, plus what else its
+    lowering reads: the core placement and the rows of the tensors it
+    accesses. A new placement therefore relowers every function. Returns
+    the asm lines, the LUT operations used and the names of the functions
+    lowered rather than taken from cache. Lowering counts are summed into
+    stats, except rows_used, the largest of any function.
+    """
+    texts = _function_texts(ir_bytes)
+    functions = {}
+    for instr in tac_instructions:
+        functions.setdefault(block_labels[instr.block][0], []).append(instr)
+    labels = {}
+    for block, label in block_labels.items():
+        labels.setdefault(label[0], {})[block] = label
+    loops = {}
+    for loop in profile["loops"]:
+        loops.setdefault(loop["function"], []).append(loop)
+
+    asm_instructions, operations_used, lowered = [], set(), []
+    for function, instrs in functions.items():
+        function_layout = _function_layout(function, layout)
+        digest = hashlib.sha256(f"{PIPELINE_SALT}:{placement}:{json.dumps(function_layout)}".encode())
+        digest.update(function_id_pattern.sub(rb"\1", texts.get(function, b"")))
+        key = digest.hexdigest()
+        record = cache.get_function(key) if cache is not None else None
+        if record is None:
+            function_stats = {}
+            lines, used = map_tac_to_isa(instrs, labels[function], function_stats, placement=placement,
+                                         loops=loops.get(function), layout=function_layout,
+                                         value_ranges=profile["value_ranges"])
+            record = {"asm": lines, "stats": function_stats, "operations_used": sorted(used)}
+            if cache is not None:
+                cache.put_function(key, record)
+            lowered.append(function)
+        asm_instructions.extend(record["asm"])
+        operations_used.update(record["operations_used"])
+        if stats is not None:
+            _merge_stats(stats, record["stats"])
+    if cache is not None:
+        cache.finish_functions(len(functions) - len(lowered), len(lowered))
+    if stats is not None:
+        stats["functions_lowered"] = len(lowered)
+        stats["functions_reused"] = len(functions) - len(lowered)
+    return asm_instructions, operations_used, lowered
+
+
+def _size(path):
+    return Path(path).stat().st_size if Path(path).exists() else None
+
+
+def compile_source(source_path, work_dir, cache=None, optimize=True, progress=None, stream=False,
+                   in_process=False, passes=None, clusters=1, split="auto", incremental=False, report=False,
+                   sample=False, banks=DEFAULT_BANKS):
+    """Run the full pipeline for one .cpp/.ll file with all outputs kept in work_dir
+
+    The returned tac_instructions/isa_instructions are text lines. With
+    stream=True the IR is lowered straight to disk and both are None; use
+    the *_count fields instead. The lowering stats and operations_used are
+    also written to compile_stats.json, so a cache hit returns them too.
+    With in_process=True the IR is optimized
+    by llvmlite (-O2, or the passes given) and TAC is read from the
+    module directly; optimized.ll is still written as an output. The
+    loop-weighted profile of the optimized IR (see ir_profile.profile_ir())
+    decides which cores hold each LUT function and is returned as profile.
+    Arrays are placed in banks and rows of a memory with the given number
+    of banks by memory_layout.plan_memory_layout(), returned as
+    memory_layout and written as the memory map output.map; when they do
+    not fit, the plan's warning says so and is reported as progress.
+    With clusters > 1 the multiply loop nests are also split across that
+    many clusters (see partition.partition_streams()); the streams go to
+    work_dir/clusters and the load-balance report is returned as partition.
+    With incremental=True each function is lowered on its own and, given a
+    cache, functions whose IR is unchanged reuse their cached asm (see
+    lower_functions()); functions_lowered names those lowered afresh.
+    With report=True each stage's wall time, peak RSS, input and output
+    sizes and instruction counts are recorded (see
+    instrumentation.StageRecorder), returned as report and written to
+    report.json. sample=True also runs the sampling profiler over the
+    compile, adding the hot functions to the report and writing the
+    sampled stacks to profile.folded.
+    """
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    timings = {}
+    stats = {}
+    result = {"source": str(source_path), "work_dir": str(work_dir), "cached": False,
+              "timings": timings, "stats": stats, "functions_lowered": None, "report": None}
+    sampler = StackSampler() if sample else None
+    recorder = StageRecorder(timings, progress, report, sampler)
+    if sampler is not None:
+        sampler.start()
+    try:
+        _compile(source_path, work_dir, cache, optimize, stream, in_process, passes, clusters, split, incremental,
+                 banks, recorder, result)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+    if recorder.detailed:
+        result["report"] = recorder.write(work_dir / "report.json", source=str(source_path),
+                                          cached=result["cached"], stats=stats)
+    if sampler is not None:
+        (work_dir / "profile.folded").write_text(sampler.folded())
+    return result
+
+
+def _compile(source_path, work_dir, cache, optimize, stream, in_process, passes, clusters, split, incremental,
+             banks, recorder, result):
+    """compile_source() proper, filling in result"""
+    stage = recorder.stage
+    raw_ll_path = work_dir / "unoptimized.ll"
+    opt_ll_path = work_dir / "optimized.ll"
+    tac_path = work_dir / "output.tac"
+    asm_path = work_dir / "output.asm"
+    bin_path = work_dir / "output.bin"
+    map_path = work_dir / "output.map"
+    stats_path = work_dir / "compile_stats.json"
+    stats = result["stats"]
+    block_labels = {}
+
+    with open(source_path, "rb") as f:
+        source_bytes = f.read()
+    cache_key = None
+    if cache is not None:
+        salt = f"{PIPELINE_SALT}:{Path(source_path).suffix}:{optimize}:{stream}:{banks}"
+        if in_process:
+            salt += f":llvmlite {llvm.llvm_version_info if llvm else None}:{passes}"
+        if incremental and not stream:
+            salt += ":incremental"
+        cache_key = compute_cache_key(source_bytes, salt)
+        with stage("cache_restore") as record:
+            restored = cache.restore(cache_key, work_dir)
+            record["hit"] = restored
+        if restored:
+            recorder.progress("Reusing cached compilation results...")
+            if stream:
+                tac_instructions = isa_instructions = None
+                tac_count, isa_count = _count_lines(tac_path), _count_lines(asm_path)
+            else:
+                tac_instructions = tac_path.read_text().splitlines()
+                isa_instructions = asm_path.read_text().splitlines()
+                tac_count, isa_count = len(tac_instructions), len(isa_instructions)
+            lowering = json.loads(stats_path.read_text())
+            stats.update(lowering["stats"])
+            profile = profile_ir(opt_ll_path)
+            layout = plan_layout(profile, banks)
+            if layout["warning"]:
+                recorder.progress(f"Memory layout: {layout['warning']}")
+            result.update({
+                "cached": True,
+                "profile": profile,
+                "memory_layout": layout,
+                "partition": _partition(asm_path, work_dir, clusters, split, profile, recorder),
+                "tac_instructions": tac_instructions,
+                "isa_instructions": isa_instructions,
+                "tac_count": tac_count,
+                "isa_count": isa_count,
+                "operations_used": lowering["operations_used"],
+                "functions_lowered": [] if incremental and not stream else None,
+            })
+            return
+
+    with stage("llvm_ir", "Generating LLVM IR...") as record:
+        if Path(source_path).suffix == ".ll":
+            shutil.copyfile(source_path, raw_ll_path)
+        else:
+            generate_llvm_ir(str(source_path), str(raw_ll_path))
+        record.update(input_bytes=len(source_bytes), output_bytes=_size(raw_ll_path))
+
+    with stage("optimize", "Optimizing LLVM IR...") as record:
+        module = None
+        if in_process:
+            module = parse_llvm_module(raw_ll_path.read_text())
+            if optimize:
+                optimize_module(module, passes)
+        elif optimize:
+            optimize_llvm_ir(str(raw_ll_path), str(opt_ll_path))
+        else:
+            shutil.copyfile(raw_ll_path, opt_ll_path)
+        ir = module if module is not None else opt_ll_path
+        record.update(input_bytes=_size(raw_ll_path),
+                      output_bytes=len(str(module).encode()) if module is not None else _size(opt_ll_path))
+
+    with stage("profile", "Profiling loop nests...") as record:
+        profile = profile_ir(str(module).encode() if module is not None else opt_ll_path)
+        placement = plan_core_placement(profile["lut_demand"])
+        record.update(loops=len(profile["loops"]), tensors=len(profile["tensors"]),
+                      narrowed_operations=profile["narrowing"]["operations"])
+
+    with stage("layout", "Planning memory layout...") as record:
+        layout = plan_layout(profile, banks)
+        map_path.write_text(format_memory_map(layout))
+        record.update(arrays=len(layout["tensors"]), output_bytes=_size(map_path))
+    if layout["warning"]:
+        recorder.progress(f"Memory layout: {layout['warning']}")
+
+    if stream:
+        with stage("tac_isa", "Streaming TAC extraction and ISA lowering...") as record:
+            tac_count, isa_count, operations_used = stream_llvm_to_isa(ir, tac_path, asm_path, stats, placement,
+                                                                       layout)
+            record.update(instructions_in=tac_count, instructions_out=isa_count,
+                          instructions_skipped=stats.get("instructions_skipped", 0), output_bytes=_size(asm_path))
+        tac_instructions = isa_instructions = None
+    else:
+        with stage("tac", "Extracting Three-Address Code...") as record:
+            tac_instructions = list(_tac_source(ir, block_labels))
+            tac_count = len(tac_instructions)
+            record.update(input_bytes=_size(opt_ll_path) if module is None else None, instructions_out=tac_count,
+                          blocks=len(block_labels))
+
+    if not tac_count:
+        raise CompileError("TAC extraction", "no instructions found in LLVM IR")
+
+    if not stream:
+        with stage("isa", "Generating Custom ISA...") as record:
+            if incremental:
+                ir_bytes = str(module).encode() if module is not None else opt_ll_path.read_bytes()
+                isa_instructions, operations_used, result["functions_lowered"] = lower_functions(
+                    tac_instructions, block_labels, ir_bytes, profile, placement, layout, cache, stats)
+            else:
+                isa_instructions, operations_used = map_tac_to_isa(tac_instructions, block_labels, stats,
+                                                                 placement=placement, loops=profile["loops"],
+                                                                 layout=layout,
+                                                                 value_ranges=profile["value_ranges"])
+            isa_count = len(isa_instructions)
+            record.update(instructions_in=tac_count, instructions_out=isa_count,
+                          instructions_skipped=stats.get("instructions_skipped", 0))
+        with stage("write") as record:
+            tac_instructions = format_tac(tac_instructions)
+            tac_path.write_text("\n".join(tac_instructions))
+            asm_path.write_text("\n".join(isa_instructions))
+            record.update(output_bytes=_size(tac_path) + _size(asm_path))
+
+    if module is not None:
+        opt_ll_path.write_text(str(module))
+
+    with stage("binary", "Encoding binary...") as record:
+        try:
+            encode_file(asm_path, bin_path)
+        except ValueError as e:
+            raise CompileError("Binary encoding", str(e)) from e
+        record.update(input_bytes=_size(asm_path), output_bytes=_size(bin_path), instructions_in=isa_count)
+
+    stats_path.write_text(json.dumps({"stats": stats, "operations_used": sorted(operations_used)}))
+    if cache is not None:
+        with stage("cache_store"):
+            cache.put(cache_key, {
+                "unoptimized.ll": raw_ll_path,
+                "optimized.ll": opt_ll_path,
+                "output.tac": tac_path,
+                "output.asm": asm_path,
+                "output.bin": bin_path,
+                "output.map": map_path,
+                "compile_stats.json": stats_path,
+            })
+
+    result.update({
+        "tac_instructions": tac_instructions,
+        "isa_instructions": isa_instructions,
+        "tac_count": tac_count,
+        "isa_count": isa_count,
+        "operations_used": sorted(operations_used),
+        "profile": profile,
+        "memory_layout": layout,
+        "partition": _partition(asm_path, work_dir, clusters, split, profile, recorder),
+    })
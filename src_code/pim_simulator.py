@@ -0,0 +1,276 @@
+"""Performance model for emitted pPIM assembly.
+
+Usage:
+    python pim_simulator.py outputs/output.asm [more.asm ...] [--mode reference]
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from lut_state import CORES_PER_CLUSTER, LUT_ADD, LUT_CMP, LUT_CMP_MERGE, LUT_CMP_SIGNED, LUT_MULT
+from pim_binary import PimBinary
+from pim_isa import (ACTIVATE, COMPARE, COMPUTE_OPCODES, CONTROL_OPCODES, END_REPEAT, ISA_MNEMONICS, LOAD,
+                     LUT_PROG_OPCODES, MAC_ADD, MAC_MULT, MEMORY_OPCODES, NO_OPERAND, REPEAT, STORE, SYNC, parse_asm)
+
+
+class PimConfig:
+    """Device geometry and per-instruction latencies, in DRAM clock cycles"""
+
+    def __init__(self, banks=1, clusters_per_bank=1, cores_per_cluster=CORES_PER_CLUSTER,
+                 t_activate=28, t_column=4, t_lut_prog_per_core=8, t_lut_op=1, t_control=1):
+        self.banks = banks
+        self.clusters_per_bank = clusters_per_bank
+        self.cores_per_cluster = cores_per_cluster
+        self.t_activate = t_activate
+        self.t_column = t_column
+        self.t_lut_prog_per_core = t_lut_prog_per_core
+        self.t_lut_op = t_lut_op
+        self.t_control = t_control
+
+    @property
+    def clusters(self):
+        return self.banks * self.clusters_per_bank
+
+    def base_costs(self):
+        """Cycle cost of each opcode before row misses and per-core LUT programming"""
+        costs = np.zeros(len(ISA_MNEMONICS), dtype=np.int64)
+        costs[ACTIVATE] = self.t_activate
+        costs[list(MEMORY_OPCODES)] = self.t_column
+        costs[list(COMPUTE_OPCODES)] = self.t_lut_op
+        costs[list(CONTROL_OPCODES)] = self.t_control
+        return costs
+
+
+# LUT functions a compute instruction accepts on each core it fires
+required_luts = {MAC_MULT: {LUT_MULT}, MAC_ADD: {LUT_ADD}, COMPARE: {LUT_CMP, LUT_CMP_SIGNED, LUT_CMP_MERGE}}
+
+
+def program_arrays(parsed):
+    """(opcodes, arg0, arg1) NumPy arrays for parsed (opcode, arg0, arg1) tuples"""
+    if not parsed:
+        empty = np.zeros(0, dtype=np.int32)
+        return empty.astype(np.uint8), empty, empty
+    table = np.asarray(parsed, dtype=np.int32)
+    return table[:, 0].astype(np.uint8), table[:, 1], table[:, 2]
+
+
+def repeat_weights(opcodes, arg0):
+    """Times each instruction runs, and the number of REPEATs whose count is only known at run time
+
+    The body of a REPEAT, up to and including its END_REPEAT, runs its
+    constant count (arg0) times, nested counts multiplying. A REPEAT with a
+    runtime count (arg0 is NO_OPERAND) is counted as one iteration.
+    """
+    weights = np.ones(len(opcodes), dtype=np.int64)
+    runtime_repeats = 0
+    starts = []
+    for index in np.flatnonzero((opcodes == REPEAT) | (opcodes == END_REPEAT)).tolist():
+        if opcodes[index] == REPEAT:
+            starts.append(index)
+        elif starts:
+            start = starts.pop()
+            if arg0[start] == NO_OPERAND:
+                runtime_repeats += 1
+            else:
+                weights[start + 1:index + 1] *= int(arg0[start])
+    return weights, runtime_repeats
+
+
+def _check_syncs(opcodes):
+    """Reject a SYNC inside a REPEAT block, whose segments the model cannot line up across clusters"""
+    depth = np.cumsum((opcodes == REPEAT).astype(np.int64) - (opcodes == END_REPEAT))
+    inside = np.flatnonzero((opcodes == SYNC) & (depth > 0))
+    if len(inside):
+        raise ValueError(f"SYNC at instruction {int(inside[0]) + 1} is inside a REPEAT block")
+
+
+def _popcount(values, bits):
+    counts = np.zeros(values.shape, dtype=np.int64)
+    for bit in range(bits):
+        counts += (values >> bit) & 1
+    return counts
+
+
+def _simulate_numpy(program, config):
+    """Vectorized cost model for one cluster's instruction stream"""
+    opcodes, arg0, arg1 = program
+    count = len(opcodes)
+    weights, runtime_repeats = repeat_weights(opcodes, arg0)
+    costs = config.base_costs()[opcodes]
+
+    # Row open in its bank before each instruction: the row of the bank's previous access
+    is_memory = np.isin(opcodes, MEMORY_OPCODES)
+    is_activate = opcodes == ACTIVATE
+    touches_row = is_memory | is_activate
+    bank = np.where(touches_row, np.maximum(arg1, 0), NO_OPERAND)
+    open_before = np.full(count, NO_OPERAND, dtype=arg0.dtype)
+    for bank_id in np.unique(bank[touches_row]).tolist():
+        accesses = np.flatnonzero(bank == bank_id)
+        open_before[accesses[1:]] = arg0[accesses[:-1]]
+    implicit = is_memory & (open_before != arg0)
+    redundant = is_activate & (open_before == arg0)
+    costs = costs + implicit * config.t_activate
+
+    is_lut_prog = np.isin(opcodes, LUT_PROG_OPCODES)
+    cores_programmed = np.where(is_lut_prog, _popcount(np.maximum(arg0, 0), config.cores_per_cluster), 0)
+    costs = (costs + cores_programmed * config.t_lut_prog_per_core) * weights
+
+    is_compute = np.isin(opcodes, COMPUTE_OPCODES)
+    # A SYNC closes the segment it ends
+    is_sync = opcodes == SYNC
+    segment = np.concatenate(([0], np.cumsum(is_sync)[:-1])) if count else np.zeros(0, int)
+    segment_cycles = np.bincount(segment, weights=costs, minlength=int(is_sync.sum()) + 1)
+    return {
+        "instructions": int(count),
+        "executed_instructions": int(weights.sum()),
+        "runtime_repeats": runtime_repeats,
+        "cycles": int(costs.sum()),
+        "compute_cycles": int(costs[is_compute].sum()),
+        "memory_cycles": int(costs[touches_row].sum()),
+        "lut_programming_cycles": int(costs[is_lut_prog].sum()),
+        "control_cycles": int(costs[np.isin(opcodes, CONTROL_OPCODES)].sum()),
+        "row_activations": int(weights[is_activate].sum() + weights[implicit].sum()),
+        "implicit_activations": int(weights[implicit].sum()),
+        "redundant_activations": int(weights[redundant].sum()),
+        "row_hits": int(weights[is_memory & ~implicit].sum()),
+        "lut_programming_events": int(weights[is_lut_prog].sum()),
+        "lut_cores_programmed": int((cores_programmed * weights).sum()),
+        "segment_cycles": segment_cycles.astype(np.int64).tolist(),
+    }
+
+
+def _simulate_reference(program, config):
+    """Instruction-by-instruction model; also checks compute ops find their LUT resident"""
+    opcodes, arg0, arg1 = program
+    base = config.base_costs()
+    weights, runtime_repeats = repeat_weights(opcodes, arg0)
+    stats = dict.fromkeys((
+        "cycles", "compute_cycles", "memory_cycles", "lut_programming_cycles", "control_cycles",
+        "row_activations", "implicit_activations", "redundant_activations", "row_hits",
+        "lut_programming_events", "lut_cores_programmed", "lut_faults"), 0)
+    stats["instructions"] = len(opcodes)
+    stats["executed_instructions"] = int(weights.sum())
+    stats["runtime_repeats"] = runtime_repeats
+    stats["segment_cycles"] = [0]
+    open_rows = {}
+    cores = [None] * config.cores_per_cluster
+    for opcode, arg, code, times in zip(opcodes.tolist(), arg0.tolist(), arg1.tolist(), weights.tolist()):
+        cost = int(base[opcode])
+        if opcode == ACTIVATE:
+            stats["row_activations"] += times
+            stats["redundant_activations"] += times * (arg == open_rows.get(max(code, 0)))
+            open_rows[max(code, 0)] = arg
+            cost *= times
+            stats["memory_cycles"] += cost
+        elif opcode in (LOAD, STORE):
+            if arg != open_rows.get(max(code, 0)):
+                cost += config.t_activate
+                stats["row_activations"] += times
+                stats["implicit_activations"] += times
+                open_rows[max(code, 0)] = arg
+            else:
+                stats["row_hits"] += times
+            cost *= times
+            stats["memory_cycles"] += cost
+        elif opcode in LUT_PROG_OPCODES:
+            programmed = [core for core in range(config.cores_per_cluster) if max(arg, 0) >> core & 1]
+            for core in programmed:
+                cores[core] = code
+            cost = (cost + len(programmed) * config.t_lut_prog_per_core) * times
+            stats["lut_programming_events"] += times
+            stats["lut_cores_programmed"] += len(programmed) * times
+            stats["lut_programming_cycles"] += cost
+        elif opcode in required_luts:
+            # Without a core mask any core holding the function will do
+            firing = [core for core in range(config.cores_per_cluster) if arg >> core & 1] if arg > 0 else None
+            if firing is None:
+                stats["lut_faults"] += times * (not required_luts[opcode] & set(cores))
+            else:
+                stats["lut_faults"] += times * any(cores[core] not in required_luts[opcode] for core in firing)
+            cost *= times
+            stats["compute_cycles"] += cost
+        elif opcode in CONTROL_OPCODES:
+            cost *= times
+            stats["control_cycles"] += cost
+        stats["cycles"] += cost
+        stats["segment_cycles"][-1] += cost
+        if opcode == SYNC:
+            stats["segment_cycles"].append(0)
+    return stats
+
+
+def simulate(streams, config=None, mode="numpy"):
+    """Model one instruction stream per cluster running in parallel
+
+    streams is a list of asm line lists (or a single list for one cluster);
+    a stream may also be the (opcodes, arg0, arg1) arrays of a pim_binary.PimBinary.
+    Each bank a stream addresses keeps its own row open. Branches are not
+    followed. Instructions are costed in stream order, those in a REPEAT
+    block once per iteration of each enclosing block (see
+    repeat_weights()); every iteration costs what the first pass does. Blocks whose count is only known at run time are costed once, so
+    when runtime_repeats is non-zero the cycles are a lower bound and
+    cycles_lower_bound is set. Clusters wait for each other at
+    every SYNC, so the run time is the sum over the segments between SYNCs
+    of the slowest cluster's time; each cluster's waiting is its
+    stall_cycles. All streams must contain the same number of SYNCs, none
+    of them inside a REPEAT block.
+    The reference mode is slower but additionally counts compute ops whose
+    LUT function is not resident on any core (lut_faults).
+    """
+    config = config or PimConfig()
+    if isinstance(streams, tuple) or streams and isinstance(streams[0], str):
+        streams = [streams]
+    if len(streams) > config.clusters:
+        raise ValueError(f"{len(streams)} streams but only {config.clusters} clusters configured")
+    run = _simulate_numpy if mode == "numpy" else _simulate_reference
+
+    clusters = []
+    segments = []
+    for index, lines in enumerate(streams):
+        program = lines if isinstance(lines, tuple) else program_arrays(parse_asm(lines))
+        _check_syncs(program[0])
+        stats = run(program, config)
+        segments.append(stats.pop("segment_cycles"))
+        stats.update({"cluster": index, "bank": index // config.clusters_per_bank})
+        clusters.append(stats)
+    if len({len(cycles) for cycles in segments}) > 1:
+        raise ValueError("streams disagree on the number of SYNC instructions: "
+                         + ", ".join(str(len(cycles) - 1) for cycles in segments))
+
+    makespan = sum(map(max, zip(*segments))) if segments else 0
+    for stats in clusters:
+        stats["stall_cycles"] = makespan - stats["cycles"]
+        stats["utilization"] = round(stats["compute_cycles"] / makespan, 4) if makespan else 0.0
+    totals = {key: sum(stats[key] for stats in clusters)
+              for key in clusters[0] if key not in ("cluster", "bank", "cycles", "utilization")} if clusters else {}
+    return {"mode": mode, "cycles": makespan, "sync_points": len(segments[0]) - 1 if segments else 0,
+            "cycles_lower_bound": any(stats["runtime_repeats"] for stats in clusters), **totals,
+            "clusters": clusters}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the run time of emitted pPIM assembly")
+    parser.add_argument("asm_files", nargs="+", help="one .asm or encoded .bin stream per cluster")
+    parser.add_argument("--mode", choices=("numpy", "reference"), default="numpy")
+    parser.add_argument("--banks", type=int, default=None, help="banks (default: one per stream)")
+    parser.add_argument("--clusters-per-bank", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    streams = []
+    for path in args.asm_files:
+        if path.endswith(".bin"):
+            with PimBinary(path) as binary:
+                streams.append(binary.program())
+            continue
+        with open(path) as f:
+            streams.append(f.read().splitlines())
+    banks = args.banks or -(-len(streams) // args.clusters_per_bank)
+    config = PimConfig(banks=banks, clusters_per_bank=args.clusters_per_bank)
+    print(json.dumps(simulate(streams, config, args.mode), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+from functools import lru_cache
+
+import numpy as np
+
+from lut_state import (CORES_PER_CLUSTER, LUT_ADD, LUT_CMP, LUT_CMP_MERGE, LUT_CMP_SIGNED, LUT_MULT,
+                       describe_cores, lut_purposes)
+from pim_ir import Opcode
+
+# Each LUT core maps two 4-bit inputs (one 8-bit index) to an 8-bit output
+NIBBLE_BITS = 4
+
+# Three-way results of the comparison tables
+CMP_EQ, CMP_LT, CMP_GT = 0, 1, 2
+
+# Width assumed for operands whose type width is unknown
+DEFAULT_WIDTH = 32
+
+# Asm mnemonic that executes micro-ops of each LUT function
+lut_instructions = {LUT_MULT: "MAC_MULT", LUT_ADD: "MAC_ADD", LUT_CMP: "COMPARE",
+                    LUT_CMP_SIGNED: "COMPARE", LUT_CMP_MERGE: "COMPARE"}
+
+signed_predicates = {"slt", "sle", "sgt", "sge"}
+
+
+def _to_signed(nibbles):
+    return np.where(nibbles & 0x8, nibbles.astype(np.int16) - 16, nibbles)
+
+
+def _three_way(a, b):
+    return np.where(a < b, CMP_LT, np.where(a > b, CMP_GT, CMP_EQ))
+
+
+@lru_cache(maxsize=None)
+def lut_table(code):
+    """Read-only 256-entry contents of a LUT function, indexed by a << 4 | b"""
+    index = np.arange(256, dtype=np.uint16)
+    a, b = index >> NIBBLE_BITS, index & 0xF
+    if code == LUT_MULT:
+        table = a * b
+    elif code == LUT_ADD:
+        table = a + b
+    elif code == LUT_CMP:
+        table = _three_way(a, b)
+    elif code == LUT_CMP_SIGNED:
+        table = _three_way(_to_signed(a), _to_signed(b))
+    elif code == LUT_CMP_MERGE:
+        # a is the result for the more significant nibbles, b for the rest
+        table = np.where(a == CMP_EQ, b, a) * (a <= CMP_GT) * (b <= CMP_GT)
+    else:
+        raise ValueError(f"unknown LUT function 0x{code:X}")
+    table = table.astype(np.uint8)
+    table.flags.writeable = False
+    return table
+
+
+def nibbles(width):
+    return max(1, -(-(width or DEFAULT_WIDTH) // NIBBLE_BITS))
+
+
+class MicroProgram:
+    """4-bit LUT micro-ops for one operation, scheduled onto the cores of a cluster
+
+    ops are (code, dest, src_a, src_b) lookups; each source is a
+    (register, half) pair naming the low or high nibble of an 8-bit
+    register. Registers 0..na-1 hold operand a's nibbles and na..na+nb-1
+    operand b's, n of each unless operand_bits gives the unsigned bits the
+    operands are known to fit in. result lists the sources of the result
+    nibbles, least significant first (a single three-way code for
+    comparisons); nibbles is their count.
+    """
+
+    def __init__(self, kind, width, signed=False, operand_bits=None):
+        self.kind = kind
+        self.width = width or DEFAULT_WIDTH
+        self.signed = signed
+        self.operand_bits = operand_bits
+        self.nibbles = nibbles(width)
+        self.operand_nibbles = (self.nibbles, self.nibbles)
+        if operand_bits:
+            na, nb = (min(nibbles(bits), self.nibbles) for bits in operand_bits)
+            self.operand_nibbles = (max(na, nb),) * 2 if kind == "cmp" else (na, nb)
+        self.registers = sum(self.operand_nibbles)
+        self.ops = []
+        self.result = []
+        self.core_codes = ()
+        self.steps = []
+
+    def emit(self, code, src_a, src_b):
+        dest = self.registers
+        self.registers += 1
+        self.ops.append((code, dest, src_a, src_b))
+        return dest
+
+    def operand(self, which, index):
+        return (index if which == "a" else self.operand_nibbles[0] + index, 0)
+
+    def label(self):
+        """Operation named in asm comments, e.g. 'i32 mul' or 'i32 mul on u8, u4'"""
+        label = f"i{self.width} {self.kind}"
+        if self.operand_bits:
+            label += " on " + ", ".join(f"u{bits}" for bits in self.operand_bits)
+        return label
+
+    def requirements(self):
+        """(core mask, LUT code, comment) programming the cores this program runs on"""
+        masks = {}
+        for core, code in enumerate(self.core_codes):
+            if code is not None:
+                masks[code] = masks.get(code, 0) | 1 << core
+        return tuple((mask, code, f"Program {describe_cores(mask)} for {lut_purposes[code]}")
+                     for code, mask in masks.items())
+
+    def asm_lines(self):
+        """One compute instruction per step and mnemonic, operand = mask of cores firing"""
+        lines = []
+        for number, step in enumerate(self.steps, 1):
+            masks = {}
+            for core, index in step:
+                mnemonic = lut_instructions[self.ops[index][0]]
+                masks[mnemonic] = masks.get(mnemonic, 0) | 1 << core
+            for mnemonic, mask in masks.items():
+                lines.append(f"{mnemonic} 0x{mask:X}  ; {self.label()} step {number}/{len(self.steps)}")
+        return lines
+
+    def execute(self, a, b):
+        """Run the micro-ops through the LUT tables on arrays of operand values
+
+        Returns the result nibbles packed into an integer array and, like
+        LLVM's wrapping arithmetic, truncated to width bits (the three-way
+        code for comparisons). Signed operands narrower than a
+        whole number of nibbles must already be sign-extended; narrowed
+        operands must fit their operand_bits. Used to check decompositions.
+        """
+        na, nb = self.operand_nibbles
+        a = np.asarray(a).astype(np.uint64) & np.uint64((1 << na * NIBBLE_BITS) - 1)
+        b = np.asarray(b).astype(np.uint64) & np.uint64((1 << nb * NIBBLE_BITS) - 1)
+        registers = np.zeros((self.registers,) + a.shape, dtype=np.uint64)
+        for index in range(na):
+            registers[index] = a >> NIBBLE_BITS * index & 0xF
+        for index in range(nb):
+            registers[na + index] = b >> NIBBLE_BITS * index & 0xF
+
+        def read(source):
+            register, half = source
+            return registers[register] >> NIBBLE_BITS * half & 0xF
+
+        for code, dest, src_a, src_b in self.ops:
+            registers[dest] = lut_table(code)[read(src_a) << NIBBLE_BITS | read(src_b)]
+        value = np.zeros(a.shape, dtype=np.uint64)
+        for index, source in enumerate(self.result):
+            value |= read(source) << NIBBLE_BITS * index
+        if self.kind != "cmp":
+            # The top nibble of a width that is not a multiple of 4 holds carries past the width
+            value &= np.uint64((1 << self.width) - 1)
+        return value
+
+
+def _column_sums(program, columns):
+    """Add up columns of nibble terms with ADD lookups, rippling carries left
+
+    Every addition may carry, so carries of a column are tallied in
+    accumulator nibbles (at most 15 carries each, so the tally itself never
+    carries) that become terms of the next column.
+    """
+    for k in range(program.nibbles):
+        terms = columns[k]
+        total = terms[0]
+        tallies = []
+        for term in terms[1:]:
+            total = (program.emit(LUT_ADD, total, term), 0)
+            if k + 1 == program.nibbles:
+                continue
+            carry = (total[0], 1)
+            if tallies and tallies[-1][1] < 15:
+                tally, count = tallies[-1]
+                tallies[-1] = ((program.emit(LUT_ADD, tally, carry), 0), count + 1)
+            else:
+                tallies.append((carry, 1))
+        if k + 1 < program.nibbles:
+            columns[k + 1].extend(tally for tally, _ in tallies)
+        program.result.append(total)
+
+
+def _multiply(program):
+    """Partial products that land inside the result width, then column sums
+
+    Narrowed operands drop the products of their missing nibbles, and the
+    result the nibbles above the widest product: 4-bit by 4-bit operands
+    take a single lookup.
+    """
+    na, nb = program.operand_nibbles
+    if program.operand_bits:
+        program.nibbles = min(program.nibbles, nibbles(sum(program.operand_bits)))
+    n = program.nibbles
+    columns = [[] for _ in range(n)]
+    for shift in range(n):
+        for i in range(max(0, shift - nb + 1), min(shift + 1, na)):
+            product = program.emit(LUT_MULT, program.operand("a", i), program.operand("b", shift - i))
+            columns[shift].append((product, 0))
+            if shift + 1 < n:
+                columns[shift + 1].append((product, 1))
+    _column_sums(program, columns)
+
+
+def _add(program):
+    na, nb = program.operand_nibbles
+    if program.operand_bits:
+        program.nibbles = min(program.nibbles, nibbles(max(program.operand_bits) + 1))
+    columns = [[program.operand(which, k) for which, count in (("a", na), ("b", nb)) if k < count]
+               for k in range(program.nibbles)]
+    _column_sums(program, columns)
+
+
+def _compare(program):
+    """Nibble-wise three-way compares merged pairwise, most significant side first"""
+    n = program.nibbles = program.operand_nibbles[0]
+    codes = []
+    for k in range(n):
+        code = LUT_CMP_SIGNED if program.signed and k == n - 1 else LUT_CMP
+        codes.append((program.emit(code, program.operand("a", k), program.operand("b", k)), 0))
+    while len(codes) > 1:
+        merged = [(program.emit(LUT_CMP_MERGE, codes[k + 1], codes[k]), 0) for k in range(0, len(codes) - 1, 2)]
+        if len(codes) % 2:
+            merged.append(codes[-1])
+        codes = merged
+    program.result = codes
+
+
+def _levels(program):
+    """ASAP level of every micro-op and the op indices it depends on"""
+    producer = {}
+    levels = []
+    deps = []
+    for index, (_, dest, src_a, src_b) in enumerate(program.ops):
+        op_deps = {producer[src[0]] for src in (src_a, src_b) if src[0] in producer}
+        deps.append(op_deps)
+        levels.append(1 + max((levels[dep] for dep in op_deps), default=-1))
+        producer[dest] = index
+    return levels, deps
+
+
+def _partition_cores(program, levels, cores):
+    """Fixed core set per LUT function: widest parallel demand, shrunk to fit the cluster"""
+    counts = {}
+    widest = {}
+    per_level = {}
+    for (code, *_), level in zip(program.ops, levels):
+        counts[code] = counts.get(code, 0) + 1
+        per_level[code, level] = per_level.get((code, level), 0) + 1
+        widest[code] = max(widest.get(code, 0), per_level[code, level])
+    share = dict(widest)
+    if len(share) > cores:
+        raise ValueError(f"{len(share)} LUT functions do not fit on {cores} cores")
+    while sum(share.values()) > cores:
+        # Take a core from the function with the most cores per micro-op it runs
+        code = max((code for code in share if share[code] > 1), key=lambda code: share[code] / counts[code])
+        share[code] -= 1
+    core_codes = []
+    for code in counts:
+        core_codes.extend([code] * share[code])
+    return tuple(core_codes) + (None,) * (cores - len(core_codes))
+
+
+def _placed_cores(program, placement):
+    """Cores of a cluster-wide placement that this program's functions use, or None if one is missing"""
+    used = {code for code, *_ in program.ops}
+    if not used <= set(placement):
+        return None
+    return tuple(code if code in used else None for code in placement)
+
+
+def _schedule(program, cores, placement=None):
+    """List-schedule micro-ops onto their function's cores, earliest ops first"""
+    levels, deps = _levels(program)
+    program.core_codes = (placement and _placed_cores(program, placement)) or _partition_cores(program, levels, cores)
+    done_at = [None] * len(program.ops)
+    remaining = list(range(len(program.ops)))
+    step = 0
+    while remaining:
+        free = {}
+        for core, code in enumerate(program.core_codes):
+            free.setdefault(code, []).append(core)
+        issued = []
+        waiting = []
+        for index in remaining:
+            code = program.ops[index][0]
+            ready = all(done_at[dep] is not None and done_at[dep] < step for dep in deps[index])
+            if ready and free.get(code):
+                issued.append((free[code].pop(0), index))
+                done_at[index] = step
+            else:
+                waiting.append(index)
+        program.steps.append(sorted(issued))
+        remaining = waiting
+        step += 1
+
+
+def plan_core_placement(lut_demand, cores=CORES_PER_CLUSTER):
+    """Cluster-wide LUT function of every core, sized by weighted micro-op demand
+
+    Every function with demand gets its own cores, so each table stays
+    resident for the whole program: one core each, the rest shared out in
+    proportion to demand (largest remainder). Hotter functions take the
+    lower cores. Returns a per-core tuple of codes (None for idle cores),
+    or None if there is no demand or more functions than cores.
+    """
+    demand = {code: count for code, count in lut_demand.items() if count > 0}
+    if not demand or len(demand) > cores:
+        return None
+    hottest = sorted(demand, key=lambda code: (-demand[code], code))
+    spare = cores - len(demand)
+    total = sum(demand.values())
+    quotas = {code: spare * demand[code] / total for code in hottest}
+    share = {code: 1 + int(quotas[code]) for code in hottest}
+    leftover = cores - sum(share.values())
+    for code in sorted(hottest, key=lambda code: int(quotas[code]) - quotas[code])[:leftover]:
+        share[code] += 1
+    placement = []
+    for code in hottest:
+        placement.extend([code] * share[code])
+    return tuple(placement)
+
+
+@lru_cache(maxsize=None)
+def decompose(opcode, width, signed=False, cores=CORES_PER_CLUSTER, placement=None, operand_bits=None):
+    """Scheduled MicroProgram for MUL, ADD or ICMP at the given integer width
+
+    With a placement from plan_core_placement() the micro-ops run on the
+    cores it assigns to their functions; otherwise the cluster is
+    partitioned for this operation alone. operand_bits, the unsigned bits
+    (a, b) the operands are known to fit in (see value_range), narrows the
+    program to their nibbles; the values are then non-negative, so
+    comparisons are unsigned.
+    """
+    builders = {Opcode.MUL: ("mul", _multiply), Opcode.ADD: ("add", _add), Opcode.ICMP: ("cmp", _compare)}
+    kind, build = builders[opcode]
+    program = MicroProgram(kind, width, signed and opcode == Opcode.ICMP and not operand_bits, operand_bits)
+    build(program)
+    _schedule(program, cores, placement)
+    return program
+
+
+def micro_program(instr, placement=None):
+    """MicroProgram for a TacInstr, or None if it is not lowered to LUT micro-ops"""
+    if instr.opcode not in (Opcode.MUL, Opcode.ADD, Opcode.ICMP):
+        return None
+    return decompose(instr.opcode, instr.width or DEFAULT_WIDTH, instr.cond in signed_predicates,
+                     placement=placement, operand_bits=instr.operand_bits)
+
+
+def lut_requirements(instr, placement=None):
+    """LUT programming instr needs before it executes: (core mask, function code, comment)"""
+    program = micro_program(instr, placement)
+    return program.requirements() if program is not None else ()
@@ -0,0 +1,318 @@
+import heapq
+from itertools import groupby
+
+from pim_ir import CONTROL_OPCODES, CompileError, Opcode
+from pim_isa import format_row
+
+# Row buffer geometry: 9-bit row address field, one 8 Kb DRAM page per row
+NUM_ROWS = 512
+ROW_BITS = 8192
+
+# Width assumed for accesses whose type width is unknown
+DEFAULT_WIDTH = 32
+
+
+def row_key(instr, function=None):
+    """(function, value) whose DRAM slot an instruction accesses, or None if it touches no row
+
+    Loads and stores access their address operand; a multiply writes its
+    result back to the result's own slot. Accesses through unnamed pointers
+    get a slot keyed by the loaded or stored value. SSA names are local to
+    the function, given as function; globals are shared, under None.
+    """
+    op = instr.opcode
+    if op == Opcode.LOAD:
+        name = instr.operands[0] if instr.operands else f"*{instr.dest}"
+    elif op == Opcode.STORE:
+        name = instr.operands[1] if len(instr.operands) > 1 else f"*{instr.operands[0]}"
+    elif op == Opcode.MUL:
+        name = instr.dest
+    else:
+        return None
+    return (None if name.startswith("@") else function, name)
+
+
+class RowAllocation:
+    """Assignment of values to (row, bit offset) slots, packed row by row
+
+    Values are (function, name) pairs as row_key() gives them; block_labels
+    (see pim_pipeline.parse_llvm_to_tac()) names the function of each
+    block. reserved maps values, such as pointers into planned tensors, to
+    fixed (bank, row) addresses (see memory_layout.plan_memory_layout());
+    the rest are packed into bank 0 from first_row, past those. When the rows run out packing wraps around to
+    first_row, evicting the values placed there earliest; an evicted value
+    gets a fresh slot if it is accessed again. evicted counts them.
+    """
+
+    def __init__(self, row_bits=ROW_BITS, num_rows=NUM_ROWS, reserved=None, first_row=0, block_labels=None):
+        self.row_bits = row_bits
+        self.num_rows = num_rows
+        self.block_labels = block_labels
+        self.slots = {value: (row, 0) for value, (_, row) in (reserved or {}).items()}
+        self.banks = {value: bank for value, (bank, _) in (reserved or {}).items() if bank}
+        self.first_row = first_row
+        self.row = first_row
+        self.used_bits = 0
+        self.evicted = 0
+        self._row_values = {}
+        if first_row >= num_rows:
+            raise CompileError("Row allocation", f"tensors need more than {num_rows} DRAM rows")
+
+    @property
+    def rows_used(self):
+        return max(row for row, _ in self.slots.values()) + 1 if self.slots else 0
+
+    def _new_row(self):
+        self.row += 1
+        self.used_bits = 0
+        if self.row >= self.num_rows:
+            self.row = self.first_row
+        for value in self._row_values.pop(self.row, ()):
+            del self.slots[value]
+            self.evicted += 1
+
+    def _place(self, value, width):
+        if self.used_bits + width > self.row_bits:
+            self._new_row()
+        self.slots[value] = (self.row, self.used_bits)
+        self._row_values.setdefault(self.row, []).append(value)
+        self.used_bits += width
+
+    def key(self, instr):
+        """row_key() of instr within the function of its block"""
+        return row_key(instr, self.block_labels[instr.block][0] if self.block_labels else None)
+
+    def place_group(self, values):
+        """Place (value, width) pairs used together, starting a fresh row if they would straddle one"""
+        pending = [(value, width or DEFAULT_WIDTH) for value, width in values if value not in self.slots]
+        needed = sum(width for _, width in pending)
+        if self.used_bits and self.used_bits + needed > self.row_bits and needed <= self.row_bits:
+            self._new_row()
+        for value, width in pending:
+            self._place(value, width)
+
+    def row_of(self, value, width=DEFAULT_WIDTH):
+        """Row holding value, allocating the next free slot on first use"""
+        slot = self.slots.get(value)
+        if slot is None:
+            self._place(value, width or DEFAULT_WIDTH)
+            slot = self.slots[value]
+        return slot[0]
+
+    def row_for(self, instr):
+        """(bank, row) instr accesses, or None if it touches no row"""
+        key = self.key(instr)
+        return None if key is None else (self.banks.get(key, 0), self.row_of(key, instr.width))
+
+
+def allocate_rows(tac_instructions, row_bits=ROW_BITS, num_rows=NUM_ROWS, reserved=None, first_row=0,
+                  block_labels=None):
+    """Pack values accessed in the same basic block into the same rows
+
+    Blocks with the most row accesses are placed first so the hottest
+    working sets get whole rows to themselves. Values in reserved keep
+    their rows and the rest are packed from first_row.
+    """
+    allocation = RowAllocation(row_bits, num_rows, reserved, first_row, block_labels)
+    groups = {}
+    for instr in tac_instructions:
+        key = allocation.key(instr)
+        if key is not None:
+            groups.setdefault(instr.block, {}).setdefault(key, instr.width)
+    for block in sorted(groups, key=lambda block: -len(groups[block])):
+        allocation.place_group(groups[block].items())
+    return allocation
+
+
+def _operand_names(instr):
+    if instr.opcode == Opcode.BRANCH:
+        return [instr.operands[0].lstrip("%")] if len(instr.operands) == 3 else []
+    if instr.opcode == Opcode.REPEAT:
+        return [instr.operands[0].lstrip("%")]
+    if instr.opcode == Opcode.END_REPEAT:
+        return []
+    return instr.operands
+
+
+def _schedule_block(instrs, allocation):
+    """List-schedule one block so accesses to the open row run back to back
+
+    Dependencies are SSA def-use edges plus memory ordering: loads may
+    pass each other but never a store, and stores keep their order against
+    every other load and store. A trailing branch stays last.
+    """
+    branch = instrs[-1] if instrs[-1].opcode in CONTROL_OPCODES else None
+    body = instrs[:-1] if branch is not None else instrs
+    count = len(body)
+    successors = [[] for _ in range(count)]
+    pending = [0] * count
+    defined = {}
+    last_store = None
+    loads_since_store = []
+    for index, instr in enumerate(body):
+        deps = {defined[name] for name in _operand_names(instr) if name in defined}
+        if instr.opcode == Opcode.LOAD:
+            if last_store is not None:
+                deps.add(last_store)
+            loads_since_store.append(index)
+        elif instr.opcode == Opcode.STORE:
+            if last_store is not None:
+                deps.add(last_store)
+            deps.update(loads_since_store)
+            last_store = index
+            loads_since_store = []
+        for dep in deps:
+            successors[dep].append(index)
+        pending[index] = len(deps)
+        if instr.dest is not None:
+            defined[instr.dest] = index
+
+    rows = [allocation.row_for(instr) for instr in body]
+    ready_by_row = {}
+    ready_compute = []
+
+    def make_ready(index):
+        if rows[index] is None:
+            heapq.heappush(ready_compute, index)
+        else:
+            heapq.heappush(ready_by_row.setdefault(rows[index], []), index)
+
+    for index in range(count):
+        if not pending[index]:
+            make_ready(index)
+
+    scheduled = []
+    open_row = None
+    while len(scheduled) < count:
+        if ready_by_row.get(open_row):
+            index = heapq.heappop(ready_by_row[open_row])
+        elif ready_compute:
+            index = heapq.heappop(ready_compute)
+        else:
+            # Open the row with the most ready accesses; ties go to the earliest
+            open_row = max((row for row, ready in ready_by_row.items() if ready),
+                           key=lambda row: (len(ready_by_row[row]), -ready_by_row[row][0]))
+            index = heapq.heappop(ready_by_row[open_row])
+        scheduled.append(body[index])
+        for succ in successors[index]:
+            pending[succ] -= 1
+            if not pending[succ]:
+                make_ready(succ)
+
+    if branch is not None:
+        scheduled.append(branch)
+    return scheduled
+
+
+def schedule_row_accesses(tac_instructions, allocation):
+    """Reorder independent instructions within each block to group accesses per row"""
+    scheduled = []
+    for _, instrs in groupby(tac_instructions, key=lambda instr: instr.block):
+        scheduled.extend(_schedule_block(list(instrs), allocation))
+    return scheduled
+
+
+class RowPlan:
+    """Result of plan_open_rows(): per-block entry rows and activations hoisted to loop preheaders"""
+
+    def __init__(self, entry_rows, hoisted):
+        self.entry_rows = entry_rows
+        self.hoisted = hoisted
+
+
+def _hoist(graph, accesses):
+    """Open, in each loop's single preheader, the rows its body is the only one of in their bank"""
+    hoisted = {block: {} for block in graph.order}
+    for header, latch in graph.natural_loops():
+        body = range(header, latch + 1)
+        outside = [pred for pred in graph.predecessors[header] if pred not in body]
+        if len(outside) != 1:
+            continue
+        rows_per_bank = {}
+        for block in body:
+            for bank, row in accesses[block] + list(hoisted[block].items()):
+                rows_per_bank.setdefault(bank, set()).add(row)
+        hoisted[outside[0]].update({bank: min(rows) for bank, rows in rows_per_bank.items() if len(rows) == 1})
+    return hoisted
+
+
+def plan_open_rows(graph, allocation, hoist=True):
+    """Compute the {bank: row} known to be open on entry to every block of a BlockGraph
+
+    A row counts as open only if it is on every incoming path. With
+    hoist=True, a bank that a loop's body only accesses at one row has
+    that row activated at the end of the loop's preheader, so iterations
+    find it open.
+    """
+    accesses = {block: [address for address in map(allocation.row_for, instrs) if address is not None]
+                for block, instrs in graph.instructions.items()}
+    hoisted = _hoist(graph, accesses) if hoist else {block: {} for block in graph.order}
+
+    def transfer(block, open_rows):
+        return {**open_rows, **dict(accesses[block]), **hoisted[block]}
+
+    def meet(rows_a, rows_b):
+        return {bank: row for bank, row in rows_a.items() if rows_b.get(bank) == row}
+
+    return RowPlan(graph.forward_must(transfer, meet, {}), hoisted)
+
+
+class RowTracker:
+    """Follows the open row of each bank during lowering and emits ACTIVATE only on row changes
+
+    Without a plan (see plan_open_rows()) the open rows are forgotten at
+    every block boundary, which is always safe for streamed lowering.
+    """
+
+    def __init__(self, allocation, plan=None):
+        self.allocation = allocation
+        self.plan = plan
+        self.open_rows = {}
+        self.block = None
+        self.pending_hoisted = {}
+        self.stats = {"accesses": 0, "hits": 0, "misses": 0, "hoisted": 0}
+
+    def flush_hoisted(self):
+        """ACTIVATE lines hoisted to the end of the current block"""
+        lines = []
+        for bank, row in self.pending_hoisted.items():
+            if self.open_rows.get(bank) != row:
+                self.open_rows[bank] = row
+                self.stats["hoisted"] += 1
+                lines.append(f"ACTIVATE {format_row(row, bank)}  ; Hoisted: keep row open through the loop")
+        self.pending_hoisted = {}
+        return lines
+
+    def enter_block(self, block):
+        """Advance to block, returning hoisted lines owed by the blocks passed over"""
+        lines = self.flush_hoisted()
+        if self.plan is None:
+            self.block = block
+            self.open_rows = {}
+            return lines
+        start = block if self.block is None else self.block + 1
+        for passed in range(start, block + 1):
+            self.block = passed
+            self.open_rows = dict(self.plan.entry_rows.get(passed, {}))
+            self.pending_hoisted = dict(self.plan.hoisted.get(passed, {}))
+            if passed != block:
+                lines.extend(self.flush_hoisted())
+        return lines
+
+    def finish(self):
+        """Hoisted lines owed by the current block and any trailing empty blocks"""
+        if self.plan is None or not self.plan.hoisted:
+            return self.flush_hoisted()
+        return self.enter_block(max(self.plan.hoisted)) + self.flush_hoisted()
+
+    def access(self, instr):
+        """(row operand, ACTIVATE line or None) for the row instr touches"""
+        bank, row = self.allocation.row_for(instr)
+        operand = format_row(row, bank)
+        self.stats["accesses"] += 1
+        if self.open_rows.get(bank) == row:
+            self.stats["hits"] += 1
+            return operand, None
+        self.stats["misses"] += 1
+        self.open_rows[bank] = row
+        return operand, f"ACTIVATE {operand}  ; Activate row buffer"
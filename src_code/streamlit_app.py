@@ -1,10 +1,18 @@
 import streamlit as st
+import hashlib
 import os
-import subprocess
-import re
-import json
+import time
+import uuid
 from pathlib import Path
 
+from artifact_view import load_index
+from compile_cache import CompileCache
+from compile_jobs import JobQueue
+from memory_layout import DEFAULT_BANKS
+from pim_binary import PimBinary
+from pim_pipeline import generate_lut_file
+from pim_simulator import simulate
+
 # Custom CSS for styling
 st.markdown("""
 <style>
@@ -106,283 +114,78 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Define directories for intermediate and output files
-UPLOAD_FOLDER = "uploads"
-OUTPUT_FOLDER = "outputs"
-Path(UPLOAD_FOLDER).mkdir(parents=True, exist_ok=True)
-Path(OUTPUT_FOLDER).mkdir(parents=True, exist_ok=True)
-
-# Lookup Table for TAC-to-ISA mapping
-lookup_table = {
-    "add": "ADD",
-    "sub": "SUB",
-    "mul": "MUL",
-    "load": "LD",
-    "store": "ST",
-    "icmp": "CMP",
-    "br": "BR"
-}
-
-# Define Look-Ahead Table (LUT) for operations
-lut_definitions = {
-    "OP_A": {
-        "description": "Multiplication Operation",
-        "entries": [
-            {"input_pattern": "0000", "output_value": "0000", "description": "0 × 0 = 0"},
-            {"input_pattern": "0001", "output_value": "0000", "description": "0 × 1 = 0"},
-            {"input_pattern": "0010", "output_value": "0000", "description": "0 × 2 = 0"},
-            {"input_pattern": "0011", "output_value": "0000", "description": "0 × 3 = 0"},
-            {"input_pattern": "0100", "output_value": "0000", "description": "1 × 0 = 0"},
-            {"input_pattern": "0101", "output_value": "0001", "description": "1 × 1 = 1"},
-            {"input_pattern": "0110", "output_value": "0010", "description": "1 × 2 = 2"},
-            {"input_pattern": "0111", "output_value": "0011", "description": "1 × 3 = 3"},
-            {"input_pattern": "1000", "output_value": "0000", "description": "2 × 0 = 0"},
-            {"input_pattern": "1001", "output_value": "0010", "description": "2 × 1 = 2"},
-            {"input_pattern": "1010", "output_value": "0100", "description": "2 × 2 = 4"},
-            {"input_pattern": "1011", "output_value": "0110", "description": "2 × 3 = 6"},
-            {"input_pattern": "1100", "output_value": "0000", "description": "3 × 0 = 0"},
-            {"input_pattern": "1101", "output_value": "0011", "description": "3 × 1 = 3"},
-            {"input_pattern": "1110", "output_value": "0110", "description": "3 × 2 = 6"},
-            {"input_pattern": "1111", "output_value": "1001", "description": "3 × 3 = 9"}
-        ]
-    },
-    "OP_B": {
-        "description": "Addition Operation",
-        "entries": [
-            {"input_pattern": "0000", "output_value": "0000", "description": "0 + 0 = 0"},
-            {"input_pattern": "0001", "output_value": "0001", "description": "0 + 1 = 1"},
-            {"input_pattern": "0010", "output_value": "0010", "description": "0 + 2 = 2"},
-            {"input_pattern": "0011", "output_value": "0011", "description": "0 + 3 = 3"},
-            {"input_pattern": "0100", "output_value": "0001", "description": "1 + 0 = 1"},
-            {"input_pattern": "0101", "output_value": "0010", "description": "1 + 1 = 2"},
-            {"input_pattern": "0110", "output_value": "0011", "description": "1 + 2 = 3"},
-            {"input_pattern": "0111", "output_value": "0100", "description": "1 + 3 = 4"},
-            {"input_pattern": "1000", "output_value": "0010", "description": "2 + 0 = 2"},
-            {"input_pattern": "1001", "output_value": "0011", "description": "2 + 1 = 3"},
-            {"input_pattern": "1010", "output_value": "0100", "description": "2 + 2 = 4"},
-            {"input_pattern": "1011", "output_value": "0101", "description": "2 + 3 = 5"},
-            {"input_pattern": "1100", "output_value": "0011", "description": "3 + 0 = 3"},
-            {"input_pattern": "1101", "output_value": "0100", "description": "3 + 1 = 4"},
-            {"input_pattern": "1110", "output_value": "0101", "description": "3 + 2 = 5"},
-            {"input_pattern": "1111", "output_value": "0110", "description": "3 + 3 = 6"}
-        ]
-    }
-}
-lookup_table = {
-    "add": "ADD",
-    "sub": "SUB",
-    "mul": "MUL",
-    "load": "LD",
-    "store": "ST",
-    "icmp": "CMP",
-    "br": "BR",
-    "getelementptr": "GBP",
-    "sext": "SEXT",
-    "trunc": "TRUNC",
-    "phi": "PHI"
-}
-
-def parse_cpp_code(cpp_code):
-    """Enhanced operation detection with corrected regex patterns and exact counting"""
-    operation_count = {op: 0 for op in lookup_table.keys()}
-    
-    # More precise patterns that match the original functionality
-    patterns = {
-        'add': re.compile(r'\badd\b|\+'),  # Match LLVM's 'add' or + operator
-        'sub': re.compile(r'\bsub\b|\-'),  # Match LLVM's 'sub' or - operator
-        'mul': re.compile(r'\bmul\b|\*'),  # Match LLVM's 'mul' or * operator
-        'load': re.compile(r'\bload\b'),   # Only match LLVM's load instruction
-        'store': re.compile(r'\bstore\b'), # Only match LLVM's store instruction
-        'icmp': re.compile(r'\bicmp\b'),  # Only match LLVM's icmp
-        'br': re.compile(r'\bbr\b'),      # Only match LLVM's br
-        'getelementptr': re.compile(r'\bgetelementptr\b'),
-        'sext': re.compile(r'\bsext\b'),
-        'trunc': re.compile(r'\btrunc\b'),
-        'phi': re.compile(r'\bphi\b')
-    }
-    
-    # Count exact matches as shown in the original image
-    for op in lookup_table.keys():
-        operation_count[op] = cpp_code.count(op)  # Simple count as in original
-    
-    return operation_count
+# Define directories for job work dirs and the shared compile cache
+JOBS_FOLDER = Path(__file__).resolve().parent / "jobs"
+CACHE_FOLDER = Path(__file__).resolve().parent / "cache"
+# Compiles run at once across all sessions, and how long each may take
+MAX_WORKERS = 2
+JOB_TIMEOUT = 300
+# Lines of an output shown at a time
+VIEW_LINES = 200
 
-def generate_lut_file(cpp_code):
-    """Generate output matching the exact format from the image"""
-    operation_count = parse_cpp_code(cpp_code)
-    
-    # Create the formatted output to match the console output from the image
-    result = {
-        "Operation Frequency": {op: count for op, count in operation_count.items() if count > 0},
-        "Lookup Table": {op: lookup_table[op] for op in lookup_table}  # Show complete table as in image
-    }
-    
-    return result
-
-
-def generate_llvm_ir(input_cpp_path, output_ll_path):
-    """Generate LLVM IR (.ll) from C++ code using Clang."""
-    try:
-        result = subprocess.run(["clang++", "-S", "-emit-llvm", input_cpp_path, "-o", output_ll_path], 
-                              capture_output=True, text=True)
-        if result.returncode != 0:
-            st.error(f"LLVM IR generation failed: {result.stderr}")
-            return False
-        return True
-    except Exception as e:
-        st.error(f"Error during LLVM IR generation: {str(e)}")
-        return False
-
-def optimize_llvm_ir(input_file, output_file):
-    """Optimize LLVM IR using opt tool"""
-    try:
-        result = subprocess.run(f"opt -S -O2 {input_file} -o {output_file}", 
-                               shell=True, capture_output=True, text=True)
-        if result.returncode != 0:
-            st.error(f"LLVM IR optimization failed: {result.stderr}")
-            return False
-        return True
-    except Exception as e:
-        st.error(f"Error during LLVM IR optimization: {str(e)}")
-        return False
-
-def parse_llvm_to_tac(input_ll_file):
-    """Improved TAC extraction using regex patterns"""
-    tac_instructions = []
-    patterns = {
-        'binary_op': re.compile(r"^\s*%(\w+)\s*=\s*(add|sub|mul|div|sdiv|and|or|xor)\s+\w+\s+%(\w+),\s*%(\w+)"),
-        'compare': re.compile(r"^\s*%(\w+)\s*=\s*(icmp\s+\w+)\s+\w+\s+%(\w+),\s*%(\w+)"),
-        'load': re.compile(r"^\s*%(\w+)\s*=\s*load\s+\w+,.*"),
-        'store': re.compile(r"^\s*store\s+\w+\s+%(\w+),.*"),
-        'branch': re.compile(r"^\s*br\s+(label|i1).*")
-    }
 
-    try:
-        with open(input_ll_file, 'r') as ll_file:
-            for line in ll_file:
-                if match := patterns['binary_op'].match(line):
-                    dest, op, op1, op2 = match.groups()
-                    tac_instructions.append(f"{dest} = {op} {op1}, {op2}")
-                    continue
-                    
-                if match := patterns['compare'].match(line):
-                    dest, cmp_op, op1, op2 = match.groups()
-                    tac_instructions.append(f"{dest} = {cmp_op} {op1}, {op2}")
-                    continue
-
-                if match := patterns['load'].match(line):
-                    dest = match.group(1)
-                    tac_instructions.append(f"{dest} = LOAD")
-                    continue
-                    
-                if match := patterns['store'].match(line):
-                    src = match.group(1)
-                    tac_instructions.append(f"STORE {src}")
-                    continue
-
-                if match := patterns['branch'].match(line):
-                    tac_instructions.append(f"BRANCH {line.strip()}")
-                    continue
-    except Exception as e:
-        st.error(f"Error parsing LLVM IR: {str(e)}")
-        return []
-
-    return tac_instructions
-
-def map_tac_to_isa(tac_instructions):
-    """Generate complete PIM assembly instructions"""
-    asm_instructions = []
-    operations_used = set()
-    current_row = 0
-    
-    # Instruction mnemonics
-    mnemonics = {
-        'mem': {
-            'activate': 'ACTIVATE',
-            'load': 'LOAD',
-            'store': 'STORE'
-        },
-        'lut': {
-            'mult': 'LUT_PROG_MULT',
-            'add': 'LUT_PROG_ADD',
-            'cmp': 'LUT_PROG_CMP'
-        },
-        'compute': {
-            'mult': 'MAC_MULT',
-            'add': 'MAC_ADD',
-            'cmp': 'COMPARE'
-        }
-    }
-    
-    # Initial row activation
-    asm_instructions.append(f"{mnemonics['mem']['activate']} {current_row}  ; Activate row buffer")
-    
-    for instr in tac_instructions:
-        try:
-            parts = [p for p in instr.split() if p]
-            if not parts:
-                continue
-                
-            if "=" in instr:  # Assignment operation
-                op = parts[2]
-                operands = parts[3:]
-            else:  # Branch/store operation
-                op = parts[0].lower()
-                operands = parts[1:]
-
-            # MAC Operation
-            if op == "mul":
-                # Program LUTs
-                asm_instructions.append(f"{mnemonics['lut']['mult']} 0x3, 0x40  ; Program cores 0-1 for 4-bit mult")
-                asm_instructions.append(f"{mnemonics['lut']['add']} 0xC, 0x80  ; Program cores 2-3 for 4-bit add")
-                operations_used.update(["OP_A", "OP_B"])
-                
-                # Execute MAC steps
-                asm_instructions.append(f"{mnemonics['compute']['mult']} 1  ; First multiply phase")
-                asm_instructions.append(f"{mnemonics['compute']['add']} 1  ; Partial sum")
-                asm_instructions.append(f"{mnemonics['compute']['mult']} 2  ; Second multiply phase")
-                asm_instructions.append(f"{mnemonics['compute']['add']} 2  ; Final accumulate")
-                
-                current_row += 1
-                asm_instructions.append(f"{mnemonics['mem']['store']} {current_row}  ; Store results")
-            
-            # Addition Operation
-            elif op == "add":
-                asm_instructions.append(f"{mnemonics['lut']['add']} 0xF, 0x80  ; Program all cores for addition")
-                asm_instructions.append(f"{mnemonics['compute']['add']} 0  ; Execute addition")
-                operations_used.add("OP_B")
-                current_row += 1
-            
-            # Load Operation
-            elif op == "load":
-                current_row += 1
-                asm_instructions.append(f"{mnemonics['mem']['load']} {current_row}  ; Load from row {current_row}")
-            
-            # Store Operation
-            elif op == "store":
-                current_row += 1
-                asm_instructions.append(f"{mnemonics['mem']['store']} {current_row}  ; Store to row {current_row}")
-            
-            # Comparison Operation
-            elif op.startswith("icmp"):
-                asm_instructions.append(f"{mnemonics['lut']['cmp']} 0xF, 0xC0  ; Program comparison LUTs")
-                asm_instructions.append(f"{mnemonics['compute']['cmp']}  ; Execute comparison")
-                operations_used.add("CMP")
-                
-            # Branch Operation
-            elif op == "branch":
-                cond = operands[1] if len(operands) > 1 else None
-                if cond:
-                    asm_instructions.append(f"BRANCH {cond} {operands[2]} {operands[4]}")
-                else:
-                    asm_instructions.append(f"JUMP {operands[1]}")
-                
-        except Exception as e:
-            print(f"Skipping instruction {instr}: {str(e)}")
-            continue
-    
-    return asm_instructions, operations_used
-    
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(JOBS_FOLDER, max_workers=MAX_WORKERS, timeout=JOB_TIMEOUT, cache_dir=CACHE_FOLDER)
+
+
+def download_link(label, path, file_name, key, description):
+    """Download of a job output read from disk and served only to this session"""
+    with open(path, "rb") as f:
+        st.download_button(label, f, file_name=file_name, key=key, help=description)
+
+
+def _jump(key, line):
+    st.session_state[f"{key}_line"] = min(max(line, 1), st.session_state[f"{key}_lines"])
+
+
+def _jump_to_symbol(key):
+    symbol = st.session_state[f"{key}_symbol"]
+    if symbol is not None:
+        _jump(key, symbol["line"] + 1)
+
+
+def _find_next(key, index):
+    text = st.session_state[f"{key}_find"]
+    found = index.search(text, st.session_state[f"{key}_line"])
+    st.session_state[f"{key}_not_found"] = bool(text) and not found
+    if found:
+        _jump(key, found[0] + 1)
+
+
+def show_artifact(path, language, key):
+    """Windowed view of a text output: VIEW_LINES lines read from disk, with symbol jump and text search"""
+    index = load_index(path)
+    st.session_state[f"{key}_lines"] = max(index.line_count, 1)
+    st.session_state[f"{key}_line"] = min(st.session_state.get(f"{key}_line", 1), st.session_state[f"{key}_lines"])
+    if index.symbols:
+        query = st.text_input("Find a function, label, loop, row or tensor", key=f"{key}_query")
+        st.selectbox("Jump to", index.find_symbols(query), index=None, key=f"{key}_symbol",
+                     format_func=lambda symbol: f"{symbol['kind']} {symbol['name']} "
+                                                f"(line {symbol['line'] + 1}, {symbol['count']}x)",
+                     on_change=_jump_to_symbol, args=(key,))
+    find_col, line_col = st.columns(2)
+    with find_col:
+        st.text_input("Search text", key=f"{key}_find", on_change=_find_next, args=(key, index))
+        if st.session_state.get(f"{key}_not_found"):
+            st.caption("Not found")
+    with line_col:
+        st.number_input("Line", min_value=1, max_value=st.session_state[f"{key}_lines"], key=f"{key}_line")
+    first = st.session_state[f"{key}_line"]
+    lines = index.read_lines(first - 1, VIEW_LINES)
+    st.code("\n".join(lines), language=language)
+    prev_col, next_col, find_next_col = st.columns(3)
+    prev_col.button("Previous page", key=f"{key}_prev", on_click=_jump, args=(key, first - VIEW_LINES))
+    next_col.button("Next page", key=f"{key}_next", on_click=_jump, args=(key, first + VIEW_LINES))
+    find_next_col.button("Find next", key=f"{key}_find_next", on_click=_find_next, args=(key, index))
+    st.caption(f"Lines {first}-{first + len(lines) - 1} of {index.line_count} ({index.size / 1024:.1f} KiB)")
+
+
+job_queue = get_job_queue()
+compile_cache = CompileCache(CACHE_FOLDER)
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
 # Streamlit app interface
 
 st.markdown("<h1 class='header'>Enhanced PIM Architecture Compiler</h1>", unsafe_allow_html=True)
@@ -401,6 +204,17 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+clusters = st.sidebar.number_input("PIM clusters", min_value=1, max_value=64, value=1,
+                                   help="Split multiply loop nests across this many clusters")
+banks = st.sidebar.number_input("Memory banks", min_value=1, max_value=64, value=DEFAULT_BANKS,
+                                help="Banks the arrays are laid out across")
+incremental = st.sidebar.checkbox("Incremental lowering", value=True,
+                                  help="Lower each function separately and reuse cached asm for unchanged ones")
+stage_report = st.sidebar.checkbox("Stage report", value=False,
+                                   help="Record each stage's time, memory, sizes and instruction counts")
+sample_profile = st.sidebar.checkbox("Sampling profiler", value=False,
+                                     help="Sample the compiler's stack to find hot functions (adds a stage report)")
+
 # File upload section
 with st.container():
     st.markdown("<div class='file-uploader'>", unsafe_allow_html=True)
@@ -410,44 +224,113 @@ with st.container():
     st.markdown("</div>", unsafe_allow_html=True)
 
 if uploaded_file:
-    # Show processing status
-    with st.status("Processing your file...", expanded=True) as status:
-        st.write("Saving uploaded file...")
-        cpp_path = os.path.join(UPLOAD_FOLDER, uploaded_file.name)
-        raw_ll_path = os.path.join(OUTPUT_FOLDER, "unoptimized.ll")
-        opt_ll_path = os.path.join(OUTPUT_FOLDER, "optimized.ll")
-        
-        with open(cpp_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        with open(cpp_path, "r") as f:
-            cpp_code = f.read()
-        
-        st.markdown("<div class='output-title'>Uploaded C++ File Content</div>", unsafe_allow_html=True)
-        st.markdown(f"<div class='cpp-display'><pre>{cpp_code}</pre></div>", unsafe_allow_html=True)
-            
-        st.write("Generating LLVM IR...")
-        if not generate_llvm_ir(cpp_path, raw_ll_path):
-            st.error("Failed to generate LLVM IR")
-            st.stop()
-        
-        st.write("Optimizing LLVM IR...")
-        if not optimize_llvm_ir(raw_ll_path, opt_ll_path):
-            st.error("Failed to optimize LLVM IR")
-            st.stop()
-        
-        st.write("Extracting Three-Address Code...")
-        tac_instructions = parse_llvm_to_tac(opt_ll_path)
-        if not tac_instructions:
-            st.error("Failed to extract TAC from LLVM IR")
-            st.stop()
-        
-        st.write("Generating Custom ISA...")
-        isa_instructions, operations_used = map_tac_to_isa(tac_instructions)
-        
-        st.write("Generating Look-Ahead Table (LUT)...")
-        lut_content = generate_lut_file(cpp_code)
+    session_id = st.session_state.session_id
+    source_bytes = uploaded_file.getvalue()
+    # Keyed on the content, so re-uploading an edited file with the same name and size recompiles it
+    submission = (uploaded_file.name, hashlib.sha256(source_bytes).hexdigest(), int(clusters), int(banks),
+                  incremental, stage_report, sample_profile)
+    if st.session_state.get("submission") != submission or job_queue.job(st.session_state.job_id) is None:
+        # A new upload or new options, or the old job has expired: replace this session's previous job
+        for old in job_queue.jobs(session_id):
+            job_queue.discard(old.id)
+        st.session_state.job_id = job_queue.submit(uploaded_file.name, source_bytes, session=session_id,
+                                                   clusters=int(clusters), banks=int(banks), incremental=incremental,
+                                                   report=stage_report, sample=sample_profile)
+        st.session_state.submission = submission
+    job = job_queue.job(st.session_state.job_id)
+
+    st.markdown("<div class='output-title'>Uploaded C++ File Content</div>", unsafe_allow_html=True)
+    with st.container():
+        show_artifact(job.source_path, "cpp", f"source_{job.id}")
+
+    if not job.finished_state:
+        with st.status(f"Job {job.id}: {job.stage()} ({job.elapsed():.1f}s)", expanded=True):
+            for elapsed, message in job.events:
+                st.write(f"{elapsed:6.2f}s  {message}")
+            if job.state == "queued":
+                st.write(f"Waiting for a free worker ({MAX_WORKERS} compiles run at once)...")
+            if st.button("Cancel compilation", key=f"cancel_{job.id}"):
+                job_queue.cancel(job.id)
+                st.rerun()
+        time.sleep(0.5)
+        st.rerun()
+    if job.state != "done":
+        st.error(f"Job {job.id} {job.state}: {job.error}")
+        st.stop()
+
+    result = job.result
+    work_dir = result["work_dir"]
+    opt_ll_path = os.path.join(work_dir, "optimized.ll")
+    with st.status(f"Job {job.id} complete in {job.elapsed():.1f}s", expanded=False):
+        for elapsed, message in job.events:
+            st.write(f"{elapsed:6.2f}s  {message}")
+        if result["stats"]:
+            lut_stats = result["stats"]
+            st.write(f"LUT programming: {lut_stats['lut_programs_emitted']} emitted, "
+                     f"{lut_stats['lut_programs_saved']} redundant skipped, "
+                     f"{lut_stats['lut_programs_hoisted']} hoisted out of loops")
+            st.write(f"Hardware loops: {lut_stats['loops_repeat_blocks']} repeat blocks, "
+                     f"{lut_stats['loops_unrolled']} unrolled")
+            if result["functions_lowered"] is not None:
+                st.write(f"Incremental lowering: {lut_stats['functions_reused']} functions reused from cache, "
+                         f"{lut_stats['functions_lowered']} lowered ({', '.join(result['functions_lowered']) or 'none'})")
+
+        narrowing = result["profile"]["narrowing"]
+        if narrowing["operations"]:
+            st.write(f"Value ranges: {narrowing['operations']} operations narrowed, "
+                     f"{narrowing['micro_ops']} of {narrowing['full_micro_ops']} weighted LUT micro-ops remain")
+
+        with PimBinary(os.path.join(work_dir, "output.bin")) as binary:
+            sim = simulate(binary.program())
+        bound = "at least " if sim["cycles_lower_bound"] else ""
+        st.write(f"Estimated run time: {bound}{sim['cycles']} cycles, {sim['row_activations']} row activations, "
+                 f"{sim['lut_programming_events']} LUT reprogramming events")
+        if sim["cycles_lower_bound"]:
+            st.caption(f"{sim['runtime_repeats']} loops have a trip count known only at run time and are "
+                       "costed as one iteration")
+
+        layout = result["memory_layout"]
+        if layout["warning"]:
+            st.warning(f"Memory layout: {layout['warning']}")
+        if layout["tensors"]:
+            st.write(f"Memory layout: {len(layout['tensors'])} arrays placed, "
+                     f"{layout['row_activations']} row activations and {layout['bank_conflicts']} bank conflicts "
+                     f"over {layout['traced_accesses']} traced accesses (row-major in one bank: "
+                     f"{layout['baseline_row_activations']} and {layout['baseline_bank_conflicts']})")
+
+        partition = result["partition"]
+        if partition is not None:
+            for kernel in partition["kernels"]:
+                st.write(f"{kernel['loop']} split across {partition['clusters']} clusters ({kernel['split']} loop): "
+                         f"iterations {kernel['iterations']}, balance {kernel['balance']:.0%}, "
+                         f"estimated speedup {kernel['speedup']}x")
+            for kernel in partition["serial_kernels"]:
+                st.write(f"{kernel['loop']} kept serial on cluster 0: a loop of the nest has a runtime trip count")
+            bound = "at least " if partition["simulation"]["cycles_lower_bound"] else ""
+            st.write(f"Partitioned run: {bound}{partition['simulation']['cycles']} cycles over "
+                     f"{partition['simulation']['sync_points']} sync points")
+
+        cache_stats = compile_cache.stats()
+        st.write(f"Compile cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                 f"{cache_stats['function_hits']} function hits, {cache_stats['entries']} entries")
         
-        status.update(label="Processing complete!", state="complete", expanded=False)
+        analysis = generate_lut_file(result["profile"])
+
+    report = result["report"]
+    if report is not None:
+        with st.expander("Compile report", expanded=False):
+            st.write(f"{report['total_seconds']:.3f}s over {len(report['stages'])} stages, "
+                     f"peak RSS {report['peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+            st.dataframe(report["stages"], use_container_width=True)
+            sampling = report["sampling"]
+            if sampling is not None:
+                st.markdown(f"**Hot functions** ({sampling['samples']} samples every "
+                            f"{sampling['interval'] * 1000:.0f} ms)")
+                st.dataframe(sampling["hot_functions"], use_container_width=True)
+                download_link("Download Sampled Stacks", os.path.join(work_dir, "profile.folded"),
+                              "profile.folded", "folded_dl", "Collapsed stacks for flame graph tools")
+            download_link("Download Report", os.path.join(work_dir, "report.json"),
+                          "report.json", "report_dl", "Download the per-stage compile report")
 
     # Display results in a 2x2 grid layout using Streamlit's native column system
     st.markdown("<h2 style='text-align: center; color: white;'>Compilation Results</h2>", unsafe_allow_html=True)
@@ -458,25 +341,18 @@ if uploaded_file:
     # First row, first column - LLVM IR
     with row1_col1:
         st.markdown("<div class='output-title'>Optimized LLVM IR</div>", unsafe_allow_html=True)
-        with open(opt_ll_path) as f:
-            optimized_llvm_content = f.read()
-        
         with st.container():
-            st.code(optimized_llvm_content, language="llvm")
-            st.download_button("Download LLVM IR", optimized_llvm_content, 
-                           file_name="optimized.ll", key="llvm_dl",
-                           help="Download the optimized LLVM intermediate representation")
+            show_artifact(opt_ll_path, "llvm", f"llvm_{job.id}")
+            download_link("Download LLVM IR", opt_ll_path, "optimized.ll", "llvm_dl",
+                          "Download the optimized LLVM intermediate representation")
     
     # First row, second column - TAC
     with row1_col2:
         st.markdown("<div class='output-title'>Three-Address Code</div>", unsafe_allow_html=True)
-        tac_content = "\n".join(tac_instructions)
-        
         with st.container():
-            st.code(tac_content, language="text")
-            st.download_button("Download TAC", tac_content, 
-                           file_name="output.tac", key="tac_dl",
-                           help="Download the three-address code representation")
+            show_artifact(os.path.join(work_dir, "output.tac"), "text", f"tac_{job.id}")
+            download_link("Download TAC", os.path.join(work_dir, "output.tac"), "output.tac", "tac_dl",
+                          "Download the three-address code representation")
     
     # Add some spacing
     st.markdown("<br>", unsafe_allow_html=True)
@@ -487,36 +363,31 @@ if uploaded_file:
     # Second row, first column - Custom ISA
     with row2_col1:
         st.markdown("<div class='output-title'>Custom ISA</div>", unsafe_allow_html=True)
-        isa_content = "\n".join(isa_instructions)
-        
         with st.container():
-            st.code(isa_content, language="asm")
-            st.download_button("Download ISA", isa_content, 
-                           file_name="output.asm", key="isa_dl",
-                           help="Download the custom PIM instruction set architecture code")
+            show_artifact(os.path.join(work_dir, "output.asm"), "asm", f"isa_{job.id}")
+            download_link("Download ISA", os.path.join(work_dir, "output.asm"), "output.asm", "isa_dl",
+                          "Download the custom PIM instruction set architecture code")
+            download_link("Download Binary", os.path.join(work_dir, "output.bin"), "output.bin", "bin_dl",
+                          "Download the packed 24-bit instruction encoding")
+            download_link("Download Memory Map", os.path.join(work_dir, "output.map"), "output.map", "map_dl",
+                          "Download the bank, row and layout of each array")
     
     # Second row, second column - LUT
     with row2_col2:
     	st.markdown("<div class='output-title'>Look Up Table</div>", unsafe_allow_html=True)
     
-    	with open(cpp_path, "r") as f:
-       	    cpp_code = f.read()
-    	
-    	analysis = generate_lut_file(cpp_code)
-    
     	st.markdown("**Operation Frequency:**")
     	st.json(analysis["Operation Frequency"])
     
+    	st.markdown("**Loop Nests:**")
+    	st.json(analysis["Loop Nests"])
+    
+    	st.markdown("**Core Placement:**")
+    	st.json(analysis["Core Placement"])
+    
     	st.markdown("**Lookup Table:**")
     	st.json(analysis["Lookup Table"])
 	
-    # Save output files
-    with open(os.path.join(OUTPUT_FOLDER, "output.tac"), "w") as f:
-        f.write(tac_content)
-        
-    with open(os.path.join(OUTPUT_FOLDER, "output.asm"), "w") as f:
-        f.write(isa_content)
-        
-    
+
 else:
     st.info("Please upload a C++ file to begin compilation")
@@ -0,0 +1,223 @@
+from pim_ir import Opcode, TacInstr
+from precision import DEFAULT_WIDTH, nibbles
+
+# Sweeps over a module's values before ranges that keep growing are widened to unknown
+RANGE_PASSES = 3
+
+# Operations the LUT lowering can narrow
+NARROWABLE_OPCODES = (Opcode.MUL, Opcode.ADD, Opcode.ICMP)
+
+# Value whose range has not been computed yet (a phi input from a back edge on the first sweep)
+_PENDING = object()
+
+
+def _constant(token):
+    if token in (b"true", b"false"):
+        return int(token == b"true"), int(token == b"true")
+    try:
+        value = int(token)
+    except ValueError:
+        return None
+    return value, value
+
+
+def _fits(value_range, bits):
+    """value_range if it is wholly a signed or wholly an unsigned bits-wide range, else None"""
+    if value_range is None:
+        return None
+    lo, hi = value_range
+    if lo >= 0:
+        return value_range if hi < 1 << bits else None
+    return value_range if lo >= -(1 << bits - 1) and hi < 1 << bits - 1 else None
+
+
+def _union(ranges):
+    known = [value_range for value_range in ranges if value_range is not _PENDING]
+    if not known:
+        return _PENDING
+    if None in known:
+        return None
+    return min(lo for lo, _ in known), max(hi for _, hi in known)
+
+
+def _unsigned(value_range):
+    return value_range is not None and value_range[0] >= 0
+
+
+def _signed(value_range, bits):
+    return value_range is not None and value_range[1] < 1 << bits - 1
+
+
+def _shift(value_range, bits):
+    """Constant shift amount of a range, or None"""
+    if value_range is None or value_range[0] != value_range[1] or not 0 <= value_range[0] < bits:
+        return None
+    return value_range[0]
+
+
+def _binary(op, bits, a, b):
+    """Range of a binary operation on bits-wide operands with ranges a and b (None if unknown)"""
+    if op == b"and":
+        masks = [value_range[1] for value_range in (a, b) if _unsigned(value_range)]
+        return (0, min(masks)) if masks else None
+    if op in (b"or", b"xor"):
+        if _unsigned(a) and _unsigned(b):
+            return 0, (1 << max(a[1].bit_length(), b[1].bit_length())) - 1
+        return None
+    if op in (b"lshr", b"ashr", b"shl"):
+        shift = _shift(b, bits)
+        if shift is None:
+            return None
+        if op == b"shl":
+            return _fits((a[0] << shift, a[1] << shift), bits) if a is not None else None
+        if op == b"lshr":
+            return (a[0] >> shift, a[1] >> shift) if _unsigned(a) else (0, ((1 << bits) - 1) >> shift)
+        if _signed(a, bits):
+            return a[0] >> shift, a[1] >> shift
+        return -(1 << bits - 1) >> shift, ((1 << bits - 1) - 1) >> shift
+    if op in (b"udiv", b"urem"):
+        if not _unsigned(b) or b[0] == 0:
+            return None
+        if op == b"urem":
+            return 0, min(a[1], b[1] - 1) if _unsigned(a) else b[1] - 1
+        return (a[0] // b[1], a[1] // b[0]) if _unsigned(a) else (0, ((1 << bits) - 1) // b[0])
+    if op in (b"sdiv", b"srem"):
+        if not _signed(b, bits) or b[0] <= 0:
+            return None
+        if op == b"srem":
+            return (0, min(a[1], b[1] - 1)) if _unsigned(a) and _signed(a, bits) else (1 - b[1], b[1] - 1)
+        return (a[0] // b[1], a[1] // b[0]) if _unsigned(a) and _signed(a, bits) else None
+    if a is None or b is None:
+        return None
+    if op == b"add":
+        return _fits((a[0] + b[0], a[1] + b[1]), bits)
+    if op == b"sub":
+        return _fits((a[0] - b[1], a[1] - b[0]), bits)
+    if op == b"mul":
+        products = [x * y for x in a for y in b]
+        return _fits((min(products), max(products)), bits)
+    return None
+
+
+def value_ranges(values, phis, slots, stores, inductions):
+    """Integer range of every SSA value that analysis can bound, keyed by (function, name)
+
+    values are the range operations ir_profile gathered, in program
+    order: ("add", bits, lhs, rhs) and the other binary operations,
+    ("zext", bits, source, to bits) and the other casts, ("select", bits,
+    cond, a, b), ("icmp", 1), ("phi", bits) with incoming values from
+    phis, and ("load", bits, slot). A load is bounded by the values stored
+    to its stack slot, if the slot is in slots (scalar allocas that never
+    escape). inductions maps counted loops' induction phis and slots to
+    the range they sweep. Ranges are (lo, hi) of the signed or unsigned
+    reading of the value; phis are iterated to a fixed point, widening
+    values still growing after RANGE_PASSES sweeps to unknown. Values
+    with no known range are left out.
+    """
+    ranges = {}
+    slot_ranges = {}
+
+    def operand(function, token):
+        key = (function, token)
+        if key in values:
+            return ranges.get(key, _PENDING)
+        return _constant(token) if token[:1] != b"%" else None
+
+    def slot_range(function, slot):
+        key = (function, slot)
+        if key in inductions:
+            return inductions[key]
+        if key not in slots:
+            return None
+        if key not in slot_ranges:
+            slot_ranges[key] = _union([operand(function, value) for _, value in stores.get(key, ())] or [None])
+        return slot_ranges[key]
+
+    def evaluate(key, value):
+        function = key[0]
+        op, bits, *args = value
+        if op == b"icmp":
+            return 0, 1
+        if op == b"phi":
+            return _union([operand(function, token) for token, _ in phis[key][1]])
+        if op == b"select":
+            return _union([operand(function, token) for token in args[1:]])
+        if op == b"load":
+            return slot_range(function, args[0])
+        source = operand(function, args[0])
+        if source is _PENDING:
+            return _PENDING
+        if op == b"zext":
+            return source if _unsigned(source) else (0, (1 << bits) - 1)
+        if op == b"sext":
+            return source if _signed(source, bits) else (-(1 << bits - 1), (1 << bits - 1) - 1)
+        if op == b"trunc":
+            return _fits(source, args[1])
+        other = operand(function, args[1])
+        if other is _PENDING:
+            return _PENDING
+        return _binary(op, bits, source, other)
+
+    for sweep in range(len(values) + RANGE_PASSES):
+        # Slots are bounded once per sweep; a store changed later in it forces another
+        slot_ranges.clear()
+        changed = False
+        for key, value in values.items():
+            new = inductions[key] if key in inductions else evaluate(key, value)
+            if new is _PENDING:
+                continue
+            old = ranges.get(key, _PENDING)
+            if new != old:
+                if sweep >= RANGE_PASSES and old is not _PENDING:
+                    if old is None:
+                        continue
+                    new = None
+                ranges[key] = new
+                changed = True
+        if not changed:
+            break
+    return {key: value_range for key, value_range in ranges.items() if value_range is not None}
+
+
+def operand_bits(value_range):
+    """Unsigned bits a value in value_range needs, or None if it may be negative or is unknown"""
+    if not _unsigned(value_range):
+        return None
+    return max(value_range[1].bit_length(), 1)
+
+
+def narrowed_bits(opcode, width, range_a, range_b):
+    """(bits of a, bits of b) for a MUL, ADD or ICMP whose operands fit in fewer nibbles than width, else None
+
+    Only operands known to be non-negative are narrowed.
+    """
+    if opcode not in NARROWABLE_OPCODES:
+        return None
+    bits = [operand_bits(value_range) for value_range in (range_a, range_b)]
+    if None in bits:
+        return None
+    full = nibbles(width)
+    if all(nibbles(operand) >= full for operand in bits):
+        return None
+    return tuple(min(operand, width or DEFAULT_WIDTH) for operand in bits)
+
+
+def narrow_operations(tac_instructions, block_labels, ranges):
+    """TAC with operand_bits set on operations narrowed by value ranges, and how many were
+
+    ranges are a profile's value_ranges, keyed by (function, value name);
+    block_labels maps each TacInstr block to its (function, label).
+    """
+    narrowed = []
+    count = 0
+    for instr in tac_instructions:
+        if instr.opcode in NARROWABLE_OPCODES and instr.operand_bits is None:
+            function = block_labels[instr.block][0]
+            bits = narrowed_bits(instr.opcode, instr.width,
+                                 *(ranges.get((function, name)) for name in instr.operands))
+            if bits is not None:
+                instr = TacInstr(instr.opcode, instr.dest, instr.operands, instr.width, instr.block, instr.cond,
+                                 instr.meta, bits)
+                count += 1
+        narrowed.append(instr)
+    return narrowed, count
@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from compile_cache import CompileCache  # noqa: E402
+from pim_pipeline import compile_source  # noqa: E402
+
+SOURCE = ROOT / "Test_outputs" / "optimized.ll"
+
+
+@pytest.mark.parametrize("option", [{"stream": True}, {"incremental": True}, {"banks": 2}],
+                         ids=lambda option: next(iter(option)))
+def test_options_that_change_outputs_are_in_the_key(tmp_path, option):
+    cache = CompileCache(tmp_path / "cache")
+    assert not compile_source(SOURCE, tmp_path / "a", cache, optimize=False)["cached"]
+    assert compile_source(SOURCE, tmp_path / "b", cache, optimize=False)["cached"]
+    assert not compile_source(SOURCE, tmp_path / "c", cache, optimize=False, **option)["cached"]
+    assert compile_source(SOURCE, tmp_path / "d", cache, optimize=False, **option)["cached"]
+
+
+def test_hit_restores_lowering_results(tmp_path):
+    cache = CompileCache(tmp_path / "cache")
+    miss = compile_source(SOURCE, tmp_path / "miss", cache, optimize=False)
+    hit = compile_source(SOURCE, tmp_path / "hit", cache, optimize=False)
+    assert hit["cached"]
+    assert hit["stats"] == miss["stats"]
+    assert hit["operations_used"] == miss["operations_used"]
+    assert hit["isa_instructions"] == miss["isa_instructions"]
+    assert hit["memory_layout"] == miss["memory_layout"]
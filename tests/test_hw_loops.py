@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from benchmark import matmul_kernel  # noqa: E402
+from pim_pipeline import compile_source  # noqa: E402
+
+
+def _compile(source_path, work_dir):
+    result = compile_source(source_path, work_dir, optimize=False)
+    return result["stats"], (work_dir / "output.asm").read_text().splitlines()
+
+
+def _opcodes(lines, mnemonic):
+    return [line for line in lines if line.split(";")[0].split()[:1] == [mnemonic]]
+
+
+def test_example_loops_become_repeat_blocks(tmp_path):
+    stats, lines = _compile(ROOT / "Test_outputs" / "optimized.ll", tmp_path)
+    assert stats["loops_repeat_blocks"] == 10
+    assert stats["loops_unrolled"] == 0
+    headers = []
+    for line in lines:
+        if line.startswith("REPEAT"):
+            count, header = line.split(";")[0].split()[1], line.split("%")[-1]
+            # The example's bounds r1/c1/c2 are only known at run time
+            assert count.startswith("%")
+            headers.append(header)
+        elif line.startswith("END_REPEAT"):
+            assert line.endswith(f"Back to %{headers.pop()}")
+    assert not headers
+    assert len(_opcodes(lines, "REPEAT")) == len(_opcodes(lines, "END_REPEAT")) == 10
+
+
+def test_short_constant_loop_is_unrolled(tmp_path):
+    counts = {}
+    for size in (4, 8):
+        source_path = tmp_path / f"matmul{size}.ll"
+        source_path.write_text(matmul_kernel(size))
+        stats, lines = _compile(source_path, tmp_path / str(size))
+        counts[size] = stats, lines
+    stats, lines = counts[4]
+    assert stats["loops_unrolled"] == 1
+    assert stats["loops_repeat_blocks"] == 2
+    assert [line.split(";")[0].strip() for line in _opcodes(lines, "REPEAT")] == ["REPEAT 4", "REPEAT 4"]
+    stats, repeated = counts[8]
+    assert stats["loops_unrolled"] == 0
+    assert len(_opcodes(lines, "MAC_MULT")) == 4 * len(_opcodes(repeated, "MAC_MULT"))
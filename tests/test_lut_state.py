@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from ir_profile import profile_ir  # noqa: E402
+from pim_pipeline import compile_source, map_tac_to_isa, parse_llvm_to_tac  # noqa: E402
+from pim_simulator import simulate  # noqa: E402
+from precision import plan_core_placement  # noqa: E402
+
+SOURCE = ROOT / "Test_outputs" / "optimized.ll"
+
+
+def _lut_stats(stats):
+    return {key: value for key, value in stats.items() if key.startswith("lut_programs_")}
+
+
+def test_example_skips_and_hoists_lut_programming(tmp_path):
+    stats = compile_source(SOURCE, tmp_path, optimize=False)["stats"]
+    assert _lut_stats(stats) == {"lut_programs_requested": 18, "lut_programs_emitted": 12,
+                                 "lut_programs_saved": 6, "lut_programs_hoisted": 3}
+    lines = (tmp_path / "output.asm").read_text().splitlines()
+    programs = [index for index, line in enumerate(lines) if line.startswith("LUT_PROG")]
+    hoisted = [index for index in programs if "Hoisted" in lines[index]]
+    assert len(programs) == stats["lut_programs_emitted"] + stats["lut_programs_hoisted"]
+    assert len(hoisted) == stats["lut_programs_hoisted"]
+    # Hoisted programming runs once ahead of its loop
+    for index in hoisted:
+        assert lines[next(i for i in range(index, len(lines)) if not lines[i].startswith("LUT_PROG"))].startswith(
+            ("REPEAT", "ACTIVATE"))
+    assert simulate(lines, mode="reference")["lut_faults"] == 0
+
+
+def test_without_hoisting_nothing_is_hoisted():
+    profile = profile_ir(str(SOURCE))
+    placement = plan_core_placement(profile["lut_demand"])
+    block_labels = {}
+    tac = parse_llvm_to_tac(str(SOURCE), block_labels)
+    stats = {}
+    lines, _ = map_tac_to_isa(tac, block_labels, stats, hoist_luts=False, placement=placement,
+                              loops=profile["loops"])
+    assert stats["lut_programs_hoisted"] == 0
+    assert stats["lut_programs_emitted"] + stats["lut_programs_saved"] == stats["lut_programs_requested"] == 18
+    assert not any("Hoisted" in line for line in lines if line.startswith("LUT_PROG"))
+    assert simulate(lines, mode="reference")["lut_faults"] == 0
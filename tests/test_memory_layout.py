@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from benchmark import matmul_kernel  # noqa: E402
+from ir_profile import profile_ir  # noqa: E402
+from memory_layout import plan_memory_layout  # noqa: E402
+from pim_pipeline import compile_source  # noqa: E402
+from pim_simulator import simulate  # noqa: E402
+
+FAR_ELEMENT = b"""define i32 @get(i32* %p) {
+entry:
+  %a = getelementptr inbounds i32, i32* %p, i64 200000
+  %v = load i32, i32* %a, align 4
+  ret i32 %v
+}
+"""
+
+
+def test_matmul_layout():
+    plan = plan_memory_layout(profile_ir(matmul_kernel(64).encode()))
+    placements = {tensor["tensor"]: tensor for tensor in plan["tensors"]}
+    assert placements["@B"]["layout"] == "column_major"
+    assert placements["@A"]["layout"] == "row_major"
+    assert len({placement["banks"][0] for placement in placements.values()}) == 3
+    assert plan["row_activations"] < plan["baseline_row_activations"]
+    assert plan["pointer_rows"]["matmul"]["pb"] == [placements["@B"]["banks"][0], placements["@B"]["first_row"]]
+
+
+def test_layout_reaches_output_asm(tmp_path):
+    source_path = tmp_path / "matmul.ll"
+    source_path.write_text(matmul_kernel(64))
+    cycles = {}
+    for banks in (1, 4):
+        compile_source(source_path, tmp_path / str(banks), optimize=False, banks=banks)
+        lines = (tmp_path / str(banks) / "output.asm").read_text().splitlines()
+        loads = {line.split(";")[0].strip() for line in lines if line.startswith("LOAD")}
+        assert len(loads) == 2
+        cycles[banks] = simulate(lines)["cycles"]
+    assert cycles[4] < cycles[1]
+
+
+def test_missing_extent_reaches_constant_subscript():
+    tensor = profile_ir(FAR_ELEMENT)["tensors"]["get:%p"]
+    assert tensor["shape"] == (200001,)
+    assert tensor["estimated"]
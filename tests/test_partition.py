@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from partition import partition_streams  # noqa: E402
+from pim_simulator import PimConfig, simulate  # noqa: E402
+
+RUNTIME_KERNEL = ["LOAD 3  ; Trip count", "REPEAT %n  ; Loop %i.loop", "REPEAT 8  ; Loop %k.loop", "LOAD 1",
+                  "MAC_MULT 0x1", "STORE 2", "END_REPEAT", "END_REPEAT"]
+CONSTANT_KERNEL = ["REPEAT 8  ; Loop %j.loop", "LOAD 1", "MAC_MULT 0x1", "STORE 2", "END_REPEAT"]
+NESTED_KERNEL = ["ACTIVATE 1, 1", "REPEAT 8  ; Loop %i.loop", "REPEAT 8  ; Loop %k.loop", "LOAD 1, 1",
+                 "MAC_MULT 0x1", "STORE 2", "END_REPEAT", "STORE 3  ; Store to row 3", "END_REPEAT"]
+
+
+@pytest.mark.parametrize("split", ["auto", "outer", "inner"])
+def test_runtime_count_kernel_stays_serial(split):
+    streams, report = partition_streams(RUNTIME_KERNEL + CONSTANT_KERNEL, 4, split)
+    assert streams[0][:len(RUNTIME_KERNEL)] == RUNTIME_KERNEL
+    assert all("%n" not in line for stream in streams[1:] for line in stream)
+    assert report["serial_kernels"] == [{"line": 2, "loop": "Loop %i.loop", "count": "%n",
+                                         "reason": "runtime trip count"}]
+    assert [kernel["iterations"] for kernel in report["kernels"]] == [[2, 2, 2, 2]]
+
+
+def test_inner_split_reduces_partner_copies_after_the_kernel():
+    streams, report = partition_streams(NESTED_KERNEL, 4, "inner")
+    assert report["kernels"][0]["row_bases"] == [0, 4, 8, 12]
+    assert streams[1][:3] == ["SYNC  ; Enter kernel at line 2", "ACTIVATE 5, 1", "REPEAT 8  ; Loop %i.loop"]
+    assert "STORE 7  ; Store to row 3" in streams[1]
+    loads = [line for line in streams[0] if "Partial sum" in line]
+    assert loads == ["LOAD 7  ; Partial sum from cluster 1", "LOAD 11  ; Partial sum from cluster 2"]
+    assert "LOAD 15  ; Partial sum from cluster 3" in streams[2]
+    simulate(streams, PimConfig(banks=4))
+
+
+def test_kernel_stays_serial_when_copies_do_not_fit():
+    streams, report = partition_streams(["STORE 300", *CONSTANT_KERNEL], 2)
+    assert streams[0][1:] == CONSTANT_KERNEL
+    assert report["serial_kernels"][0]["reason"] == "2 copies of 301 rows exceed 512 rows"
@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from benchmark import matmul_kernel  # noqa: E402
+from partition import partition_streams  # noqa: E402
+from pim_binary import PimBinary, disassemble, encode, encode_file  # noqa: E402
+from pim_pipeline import compile_source  # noqa: E402
+
+
+def _canonical(token):
+    """Numeric operands in decimal, since disassembly prints compute masks in hex"""
+    try:
+        return str(int(token.rstrip(","), 0)) + ("," if token.endswith(",") else "")
+    except ValueError:
+        return token
+
+
+def _normalize(lines):
+    """Instruction text without comments, blank lines, spacing or radix differences"""
+    normalized = []
+    for line in lines:
+        text = " ".join(map(_canonical, line.split(";", 1)[0].replace(",", ", ").split()))
+        if text:
+            normalized.append(text)
+    return normalized
+
+
+def _round_trip(lines):
+    assert _normalize(disassemble(encode(lines))) == _normalize(lines)
+
+
+def test_compute_masks_round_trip_in_any_radix():
+    _round_trip(["MAC_MULT 3", "MAC_ADD 0x1F", "COMPARE 511", "COMPARE", "LUT_PROG_ADD 0x3, 0x10"])
+    assert disassemble(encode(["MAC_MULT 3"])) == ["MAC_MULT 0x3"]
+
+
+def test_banked_rows_round_trip():
+    _round_trip(["ACTIVATE 5, 2", "LOAD 5, 2", "STORE 7", "ACTIVATE 511, 63"])
+
+
+@pytest.mark.parametrize("asm_path", sorted((ROOT / "Test_outputs").glob("*.asm")), ids=lambda path: path.name)
+def test_test_outputs_round_trip(asm_path):
+    _round_trip(asm_path.read_text().splitlines())
+
+
+def test_compiled_example_round_trip(tmp_path):
+    compile_source(ROOT / "Test_outputs" / "optimized.ll", tmp_path, optimize=False)
+    lines = (tmp_path / "output.asm").read_text().splitlines()
+    _round_trip(lines)
+    with PimBinary(tmp_path / "output.bin") as binary:
+        assert _normalize(disassemble(binary)) == _normalize(lines)
+
+
+@pytest.mark.parametrize("split", ["outer", "inner"])
+def test_cluster_streams_round_trip(tmp_path, split):
+    source_path = tmp_path / "matmul.ll"
+    source_path.write_text(matmul_kernel(16))
+    compile_source(source_path, tmp_path / "outputs", optimize=False)
+    lines = (tmp_path / "outputs" / "output.asm").read_text().splitlines()
+    streams, report = partition_streams(lines, 4, split)
+    assert report["kernels"]
+    for cluster, stream in enumerate(streams):
+        assert any(line.startswith("SYNC") for line in stream)
+        asm_path = tmp_path / f"cluster_{cluster}.asm"
+        asm_path.write_text("\n".join(stream))
+        encode_file(asm_path, tmp_path / f"cluster_{cluster}.bin")
+        with PimBinary(tmp_path / f"cluster_{cluster}.bin") as binary:
+            assert _normalize(disassemble(binary)) == _normalize(stream)
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from pim_binary import PimBinary, encode  # noqa: E402
+from pim_simulator import simulate  # noqa: E402
+
+BODY = ["LOAD 1", "MAC_MULT 0x1", "STORE 2"]
+
+
+def _cycles(lines, mode):
+    return simulate(lines, mode=mode)["cycles"]
+
+
+@pytest.mark.parametrize("mode", ["numpy", "reference"])
+def test_constant_repeat_multiplies_its_body(mode):
+    activate = _cycles(["ACTIVATE 0"], mode)
+    body = _cycles(["ACTIVATE 0", *BODY], mode) - activate
+    result = simulate(["ACTIVATE 0", "REPEAT 3", "REPEAT 4", *BODY, "END_REPEAT", "END_REPEAT"], mode=mode)
+    # Outer REPEAT once, inner REPEAT 3 times, body and inner END_REPEAT 12 times, outer END_REPEAT 3 times
+    assert result["cycles"] == activate + 1 + 3 + 12 * body + 12 + 3
+    assert result["executed_instructions"] == 1 + 1 + 3 + 12 * len(BODY) + 12 + 3
+    assert not result["cycles_lower_bound"]
+
+
+@pytest.mark.parametrize("mode", ["numpy", "reference"])
+def test_runtime_repeat_is_a_lower_bound(mode):
+    result = simulate(["REPEAT %n", *BODY, "END_REPEAT"], mode=mode)
+    assert result["cycles_lower_bound"]
+    assert result["runtime_repeats"] == 1
+    assert result["executed_instructions"] == len(BODY) + 2
+
+
+@pytest.mark.parametrize("mode", ["numpy", "reference"])
+def test_each_bank_keeps_its_row_open(mode):
+    result = simulate(["LOAD 1, 1", "LOAD 1, 2", "LOAD 1, 1", "ACTIVATE 1, 2"], mode=mode)
+    assert result["row_activations"] == 3
+    assert result["row_hits"] == 1
+    assert result["redundant_activations"] == 1
+    assert simulate(["LOAD 1", "LOAD 2", "LOAD 1", "LOAD 2"], mode=mode)["row_activations"] == 4
+
+
+def test_binary_keeps_repeat_counts():
+    lines = ["REPEAT 5", *BODY, "LOAD 3, 1", "END_REPEAT"]
+    with PimBinary(encode(lines)) as binary:
+        assert simulate(binary.program()) == simulate(lines)
+
+
+def test_sync_inside_repeat_is_rejected():
+    with pytest.raises(ValueError, match="inside a REPEAT"):
+        simulate(["REPEAT 2", "SYNC", "END_REPEAT"])
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from pim_ir import Opcode  # noqa: E402
+from precision import CMP_EQ, CMP_GT, CMP_LT, decompose  # noqa: E402
+
+WIDTHS = [8, 16, 32]
+
+
+def _operands(width, count=500):
+    rng = np.random.default_rng(width)
+    edges = np.array([0, 1, (1 << width) - 1, 1 << width - 1, (1 << width - 1) - 1], dtype=np.uint64)
+    values = rng.integers(0, 1 << width, size=count, dtype=np.uint64)
+    return np.concatenate([edges, values]), np.concatenate([edges[::-1], rng.permutation(values)])
+
+
+@pytest.mark.parametrize("width", WIDTHS)
+def test_add_matches_numpy(width):
+    a, b = _operands(width)
+    mask = np.uint64((1 << width) - 1)
+    assert np.array_equal(decompose(Opcode.ADD, width).execute(a, b), (a + b) & mask)
+
+
+@pytest.mark.parametrize("width", WIDTHS)
+def test_mul_matches_numpy(width):
+    a, b = _operands(width)
+    mask = np.uint64((1 << width) - 1)
+    assert np.array_equal(decompose(Opcode.MUL, width).execute(a, b), (a * b) & mask)
+
+
+@pytest.mark.parametrize("width", WIDTHS)
+@pytest.mark.parametrize("signed", [False, True])
+def test_compare_matches_numpy(width, signed):
+    a, b = _operands(width)
+    if signed:
+        a_values = a.astype(np.int64) - ((a >> np.uint64(width - 1)) << np.uint64(width)).astype(np.int64)
+        b_values = b.astype(np.int64) - ((b >> np.uint64(width - 1)) << np.uint64(width)).astype(np.int64)
+    else:
+        a_values, b_values = a.astype(np.int64), b.astype(np.int64)
+    expected = np.where(a_values < b_values, CMP_LT, np.where(a_values > b_values, CMP_GT, CMP_EQ))
+    assert np.array_equal(decompose(Opcode.ICMP, width, signed=signed).execute(a, b), expected)
+
+
+@pytest.mark.parametrize("width", [1, 2, 3, 5, 7])
+def test_odd_widths_wrap(width):
+    a, b = np.arange(1 << width, dtype=np.uint64), np.arange(1 << width, dtype=np.uint64)[::-1].copy()
+    mask = np.uint64((1 << width) - 1)
+    assert np.array_equal(decompose(Opcode.ADD, width).execute(a, a), (a + a) & mask)
+    assert np.array_equal(decompose(Opcode.MUL, width).execute(a, b), (a * b) & mask)
@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from pim_ir import Opcode, TacInstr  # noqa: E402
+from row_allocator import NUM_ROWS, ROW_BITS, RowAllocation, allocate_rows  # noqa: E402
+
+BLOCK_LABELS = {0: ("f", "entry"), 1: ("g", "entry")}
+
+
+def test_functions_do_not_share_slots():
+    tac = [TacInstr(Opcode.MUL, "1", ("a", "b"), 32, block=0), TacInstr(Opcode.LOAD, "2", ("1",), 32, block=0),
+           TacInstr(Opcode.MUL, "1", ("a", "b"), 32, block=1), TacInstr(Opcode.LOAD, "2", ("@g",), 32, block=1)]
+    allocation = allocate_rows(tac, row_bits=32, block_labels=BLOCK_LABELS)
+    assert allocation.slots[("f", "1")] != allocation.slots[("g", "1")]
+    assert allocation.row_for(tac[1]) == (0, allocation.slots[("f", "1")][0])
+    assert allocation.key(tac[3]) == (None, "@g")
+
+
+def test_running_out_of_rows_evicts_instead_of_failing():
+    allocation = RowAllocation(first_row=2)
+    values = (NUM_ROWS - 2) * (ROW_BITS // 32) + 1
+    rows = [allocation.row_of((None, str(value)), 32) for value in range(values)]
+    assert rows[-1] == 2
+    assert allocation.evicted == ROW_BITS // 32
+    assert (None, "0") not in allocation.slots
+    assert allocation.row_of((None, "0"), 32) == 2
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src_code"))
+
+from ir_profile import profile_ir  # noqa: E402
+from pim_pipeline import map_tac_to_isa, parse_llvm_to_tac  # noqa: E402
+from precision import micro_program  # noqa: E402
+from value_range import narrow_operations  # noqa: E402
+
+# An i32 multiply, add and signed compare on a zext i8 and a value masked to 4 bits
+NARROWABLE = """define i32 @narrow(i8 %a, i32 %b) {
+entry:
+  %x = zext i8 %a to i32
+  %y = and i32 %b, 15
+  %m = mul nsw i32 %x, %y
+  %s = add nsw i32 %m, %y
+  %c = icmp slt i32 %s, %x
+  %r = select i1 %c, i32 %s, i32 %x
+  ret i32 %r
+}
+"""
+
+
+def _lower(tmp_path):
+    source_path = tmp_path / "narrow.ll"
+    source_path.write_text(NARROWABLE)
+    block_labels = {}
+    tac = parse_llvm_to_tac(str(source_path), block_labels)
+    return tac, block_labels, profile_ir(str(source_path))
+
+
+def test_narrowed_programs_match_full_width(tmp_path):
+    tac, block_labels, profile = _lower(tmp_path)
+    narrowed, count = narrow_operations(tac, block_labels, profile["value_ranges"])
+    assert count == 3
+    rng = np.random.default_rng(0)
+    for full, narrow in zip(tac, narrowed):
+        if narrow.operand_bits is None:
+            continue
+        a_bits, b_bits = narrow.operand_bits
+        a = np.concatenate([[0, (1 << a_bits) - 1], rng.integers(0, 1 << a_bits, 2000)]).astype(np.uint64)
+        b = np.concatenate([[(1 << b_bits) - 1, 0], rng.integers(0, 1 << b_bits, 2000)]).astype(np.uint64)
+        assert len(micro_program(narrow).asm_lines()) < len(micro_program(full).asm_lines())
+        assert np.array_equal(micro_program(narrow).execute(a, b), micro_program(full).execute(a, b))
+
+
+def test_narrowing_shortens_the_lowering(tmp_path):
+    tac, block_labels, profile = _lower(tmp_path)
+    stats = {}
+    full, _ = map_tac_to_isa(tac, block_labels)
+    narrowed, _ = map_tac_to_isa(tac, block_labels, stats, value_ranges=profile["value_ranges"])
+    assert stats["narrowed_operations"] == 3
+    assert len(narrowed) < len(full)